@@ -4,18 +4,18 @@ Tracks keyboard and mouse activity by application
 
 Dependencies:
 pip install pynput pillow
+
+Pillow is only needed for a background image. Run without a window with:
+python activity_tracker.py --headless   (see daemon.py)
 """
 
-import tkinter as tk
-from tkinter import ttk
 from datetime import datetime
 import threading
-import csv
+import time
 import os
-from collections import defaultdict
-import glob
+import queue
+from collections import Counter, deque, namedtuple
 import subprocess
-from PIL import Image, ImageTk
 
 # Fix for pynput on newer macOS/Python versions
 try:
@@ -36,14 +36,29 @@ except ImportError as e:
     print(f"Warning: Could not import pynput or required libraries: {e}")
     PYNPUT_AVAILABLE = False
 
-# Platform-specific imports
 import platform
-if platform.system() == 'Darwin':  # macOS
-    from AppKit import NSWorkspace
-elif platform.system() == 'Windows':
-    import win32gui
-    import win32process
-    import psutil
+
+# Platform-specific app lookups live in app_resolver
+from app_resolver import AppResolver
+from bursts import RECORD_MODES, BurstCoalescer
+from event_buffer import EventBuffer
+from heatmap import HeatmapStore
+from journal import JOURNAL_FILENAME, EventJournal, read_journal
+from metrics import Metrics
+from motion import MotionAggregator
+from rollups import RollupStore, add_stored_event
+from storage import make_storage
+
+# tkinter (and PIL, for the background image) are imported by the GUI on
+# first use, so headless runs never pay for them
+tk = None
+
+
+def _import_tk():
+    global tk
+    if tk is None:
+        import tkinter
+        tk = tkinter
 
 
 # ============ CUSTOMIZATION SETTINGS ============
@@ -73,18 +88,165 @@ FONT_SIZE_BUTTON = 9
 STATUS_TRACKING_COLOR = "#000000"  # Black
 STATUS_STOPPED_COLOR = "#000000"  # Black
 
+# Show latency/drop metrics under the stats line and dump them to
+# activity_data/metrics.json every minute
+SHOW_METRICS = False
+
+# Terminal output: 0 = quiet, 1 = a summary every CONSOLE_INTERVAL seconds
+# while events arrive, 2 = a line per event (slow under launchd/py2app logs)
+CONSOLE_VERBOSITY = 1
+CONSOLE_INTERVAL = 10
+
+# How often the window picks up results of background work (~60 fps)
+RESULT_POLL_MS = 16
+
+# Serve live and historical counts on http://127.0.0.1:<port>/ (0 picks a
+# free port; see query_server.py), or None for no server
+QUERY_PORT = None
+
+# Where sessions are saved: 'csv' or 'binary' files per session, or one
+# 'sqlite' database (see the Data Format section of the README)
+STORAGE_FORMAT = 'csv'
+
 # ================================================
 
 
+class EventPipeline:
+    """Bounded hand-off between the pynput listener threads and a worker thread
+    
+    Listener callbacks only append a timestamped tuple to a deque (atomic under
+    the GIL, no lock taken). The worker wakes every batch_interval seconds and
+    passes whatever is queued to the handler in batches, so the app lookup,
+    printing and disk I/O never run inside the OS input hook.
+    """
+    
+    # 'drop_newest' - discard the incoming event when the queue is full
+    # 'drop_oldest' - discard the oldest queued event to make room for it
+    OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest')
+    
+    def __init__(self, handler, capacity=10000, overflow_policy='drop_oldest',
+                 batch_interval=0.05, max_batch=1000):
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        
+        self.handler = handler  # called with a list of (timestamp, event_type, key, position, app)
+        self.capacity = capacity
+        self.overflow_policy = overflow_policy
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        
+        self._queue = deque()
+        self._stop_event = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._thread = None
+        
+        # Counters for feedback and diagnostics
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.high_water = 0
+    
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    @property
+    def pending(self):
+        return len(self._queue)
+    
+    def start(self):
+        """Start the worker thread (no-op if it is already running)"""
+        if self.running:
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="EventPipeline", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout=2.0):
+        """Stop the worker thread after it has processed everything queued"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.drain()
+    
+    def put(self, item):
+        """Queue an item from a listener thread; returns False if it was dropped"""
+        queue = self._queue
+        if len(queue) >= self.capacity:
+            self.dropped += 1
+            if self.overflow_policy == 'drop_newest':
+                return False
+            try:
+                queue.popleft()
+            except IndexError:
+                pass
+        
+        queue.append(item)
+        self.enqueued += 1
+        if len(queue) > self.high_water:
+            self.high_water = len(queue)
+        return True
+    
+    def drain(self):
+        """Process everything queued so far; safe to call from any thread"""
+        with self._drain_lock:
+            queue = self._queue
+            while queue:
+                batch = []
+                while queue and len(batch) < self.max_batch:
+                    batch.append(queue.popleft())
+                
+                self.processed += len(batch)
+                try:
+                    self.handler(batch)
+                except Exception as e:
+                    print(f"Error processing events: {e}")
+    
+    def _run(self):
+        """Worker loop - wake up periodically and drain the queue"""
+        while not self._stop_event.wait(self.batch_interval):
+            self.drain()
+        self.drain()
+
+
+# What the GUI (or anything else polling) shows, published by the tracker as
+# one immutable tuple so readers never see half-updated counters
+StatusSnapshot = namedtuple('StatusSnapshot', [
+    'tracking', 'global_mode', 'session_id', 'session_start', 'events', 'apps',
+    'saved_events', 'dropped'])
+
+
+def _wait_until_ready(listener, timeout):
+    """Block until a pynput listener is ready, or timeout seconds pass"""
+    waiter = threading.Thread(target=listener.wait, daemon=True)
+    waiter.start()
+    waiter.join(timeout)
+    return not waiter.is_alive()
+
+
 class ActivityTracker:
     """Main class for tracking keyboard and mouse activity"""
     
-    def __init__(self, autosave_interval=60):  # Changed to 60 seconds (1 minute)
+    def __init__(self, autosave_interval=60, flush_policy='flush',
+                 queue_capacity=10000, overflow_policy='drop_oldest', app_resolver=None,
+                 buffer_limit=1000000, storage_format='csv', storage=None,
+                 data_folder='activity_data', metrics_enabled=False, metrics_interval=60,
+                 track_motion=False, motion_interval=1.0, motion_min_distance=3.0,
+                 record_positions=False, record_mode='raw', burst_gap=2.0, burst_max=60.0,
+                 burst_histogram='class', journal_size=1 << 20, query_port=None,
+                 verbosity=1, console_interval=10):
+        if record_mode not in RECORD_MODES:
+            raise ValueError(f"Unknown record mode: {record_mode}")
+        
         self.tracking = False
         self.global_mode = False  # False = app-specific, True = global
-        self.data_folder = 'activity_data'
+        self.data_folder = data_folder
         self.autosave_interval = autosave_interval  # seconds between auto-saves
-        self.last_save_time = datetime.now()
+        self.flush_policy = flush_policy  # see storage.SessionWriter.FLUSH_POLICIES
+        self.storage_format = storage_format  # 'csv', 'binary' or 'sqlite'
+        self.last_save_ns = None  # event time of the last auto-save
         
         # Create data folder if it doesn't exist
         if not os.path.exists(self.data_folder):
@@ -93,7 +255,72 @@ class ActivityTracker:
         # Current session data
         self.session_id = None
         self.session_file = None
-        self.session_events = []
+        # Columnar buffer; beyond buffer_limit events it spills chunks to disk
+        self.session_events = EventBuffer(
+            max_memory_events=buffer_limit,
+            spill_dir=os.path.join(self.data_folder, 'spill'))
+        
+        # Where sessions are saved - session files or SQLite (see storage.py)
+        self.storage = storage or make_storage(self.data_folder, storage_format, flush_policy)
+        
+        # Per-minute counts by app / event type / key class for analytics
+        self.rollups = RollupStore(self.data_folder)
+        
+        # Click positions per app and day, for heatmaps
+        self.heatmaps = HeatmapStore(self.data_folder)
+        
+        # Crash journal - every stored row also goes into a memory-mapped
+        # ring, and rows a crash kept from being saved are replayed into
+        # storage here, before anything new is recorded (see journal.py)
+        self.journal = None
+        self.journal_path = os.path.join(self.data_folder, JOURNAL_FILENAME)
+        if journal_size:
+            self.recover_journal()
+            self.journal = EventJournal(self.journal_path, journal_size)
+        
+        # Incremental saving - only events past saved_event_count get written
+        self.saved_event_count = 0
+        self._save_lock = threading.Lock()
+        
+        # Caches the foreground app between focus changes (created on first use
+        # so the platform backend isn't loaded until tracking starts)
+        self.app_resolver = app_resolver
+        
+        # Listener callbacks hand events to this pipeline; its worker thread
+        # does the app lookup and saving off the input hook
+        self.event_pipeline = EventPipeline(
+            self._process_events, capacity=queue_capacity, overflow_policy=overflow_policy)
+        
+        # In 'burst' mode keystrokes are stored as one row per typing burst
+        # (see bursts.py); the GUI counter still sees every key, and the
+        # rollups count each burst from its row, so they only ever hold
+        # stored rows and journal recovery can't count a key twice
+        self.record_mode = record_mode
+        self.bursts = None
+        if record_mode == 'burst':
+            self.bursts = BurstCoalescer(self._store_burst, gap=burst_gap,
+                                         max_duration=burst_max, histogram=burst_histogram)
+        
+        # Mouse moves and scrolls are coalesced into per-interval records
+        # before they reach the pipeline (see motion.py). Off by default:
+        # they would count toward the event totals like keys and clicks.
+        # Each interval is credited to the app in front when it opened
+        self.track_motion = track_motion
+        self.motion = MotionAggregator(
+            self.enqueue_event, interval=motion_interval,
+            min_distance=motion_min_distance, record_positions=record_positions,
+            resolve_app=self.get_active_application)
+        
+        # Counters and latency histograms; every hot-path site checks
+        # metrics.enabled first, so disabled metrics cost one attribute lookup
+        self.metrics = Metrics(enabled=metrics_enabled)
+        self.metrics_interval = metrics_interval
+        self.metrics_file = os.path.join(self.data_folder, 'metrics.json')
+        self.metrics.gauge('buffer_events', lambda: len(self.session_events))
+        self.metrics.gauge('buffer_bytes', lambda: self.session_events.memory_bytes)
+        self.metrics.gauge('queue_pending', lambda: self.event_pipeline.pending)
+        self.metrics.gauge('events_dropped', lambda: self.event_pipeline.dropped)
+        self.metrics.gauge('bytes_written', lambda: self.storage.bytes_written)
         
         # CSV header
         self.csv_header = ['timestamp', 'app', 'event_type', 'key']
@@ -103,62 +330,180 @@ class ActivityTracker:
         self.mouse_listener = None
         self.listeners_started = False
         
-        # Event counter for GUI feedback
+        # Event counter for GUI feedback, and the same per app
         self.event_count = 0
+        self.session_apps = Counter()
         self.session_start = None
+        
+        # Console feedback - see CONSOLE_VERBOSITY; level 1 prints a summary
+        # at most every console_interval seconds instead of a line per event
+        self.verbosity = verbosity
+        self.console_interval = console_interval
+        self._summary_ns = None
+        self._summary_events = 0
+        self._summary_apps = {}
+        
+        # Counters for the GUI, republished after each batch of events
+        self._saved_total = 0
+        self.snapshot = None
+        self.publish_snapshot()
+        
+        # perf_counter_ns() at start_tracking and at the session's first event
+        self.tracking_started_ns = None
+        self.first_event_ns = None
+        
+        # Optional local HTTP endpoint for dashboards (see query_server.py)
+        self.query_server = None
+        if query_port is not None:
+            from query_server import QueryServer
+            self.query_server = QueryServer(self, port=query_port).start()
     
     def get_active_application(self):
         """Get the currently active application name"""
         if self.global_mode:
             return "Global"
         
-        try:
-            if platform.system() == 'Darwin':  # macOS
-                workspace = NSWorkspace.sharedWorkspace()
-                if workspace is None:
-                    return "Unknown"
-                active_app = workspace.activeApplication()
-                if active_app and 'NSApplicationName' in active_app:
-                    return active_app['NSApplicationName']
-                return "Unknown"
-            
-            elif platform.system() == 'Windows':
-                # Get active window handle
-                window = win32gui.GetForegroundWindow()
-                # Get process ID from window
-                _, pid = win32process.GetWindowThreadProcessId(window)
-                # Get process name
-                process = psutil.Process(pid)
-                return process.name()
-            
-            else:
-                return "Unknown"
-        except Exception as e:
-            # Silently handle errors and return Unknown
-            return "Unknown"
+        if self.app_resolver is None:
+            self.app_resolver = AppResolver()
+        return self.app_resolver.resolve()
     
-    def record_event(self, event_type, key=None):
+    def record_event(self, event_type, key=None, timestamp=None, position=None, app=None):
         """Record an activity event"""
         if not self.tracking:
             return
+        self._record(event_type, key, timestamp, position, app)
+    
+    def _record(self, event_type, key=None, timestamp=None, position=None, app=None):
+        """Store an event, resolving its app (unless given) and auto-saving as needed"""
+        metrics = self.metrics if self.metrics.enabled else None
+        if metrics:
+            started = time.perf_counter_ns()
         
-        event = {
-            'timestamp': datetime.now().isoformat(),
-            'app': self.get_active_application(),
-            'event_type': event_type,
-            'key': key if key else event_type
-        }
-        self.session_events.append(event)
+        # Timestamps are epoch nanoseconds from time.time_ns()
+        timestamp = timestamp or time.time_ns()
+        app = app or self.get_active_application()
+        if metrics:
+            looked_up = time.perf_counter_ns()
+            metrics.observe('app_lookup', looked_up - started)
+        key = key if key else event_type
+        if self.bursts is not None and event_type == 'keystroke':
+            # Reaches the rollups with its burst row, when the burst closes
+            self.bursts.add(timestamp, app, key)
+        else:
+            if self.bursts is not None:
+                self.bursts.close_idle(timestamp)
+            self._store(timestamp, app, event_type, key)
+            self.rollups.add(timestamp, app, event_type, key)
+        if position is not None:
+            self.heatmaps.add(timestamp, app, *position)
         self.event_count += 1
+        self.session_apps[app] += 1
+        if self.event_count == 1:
+            self.first_event_ns = time.perf_counter_ns()
+            if self.verbosity >= 1:
+                print(f">>> First event recorded {self.first_event_ms:.1f} ms after tracking started <<<")
+        if metrics:
+            metrics.incr(f'events.{event_type}')
         
-        # Print every event to terminal for feedback
-        print(f"[{event['app']}] {event_type}: {key if key else 'N/A'}")
+        # Terminal feedback - a line per event only at verbosity 2
+        if self.verbosity >= 2:
+            if metrics:
+                printing = time.perf_counter_ns()
+                print(f"[{app}] {event_type}: {key}")
+                metrics.observe('console_print', time.perf_counter_ns() - printing)
+            else:
+                print(f"[{app}] {event_type}: {key}")
+        elif self.verbosity == 1:
+            if self._summary_ns is None:
+                self._summary_ns = timestamp
+            elif timestamp - self._summary_ns >= self.console_interval * 1_000_000_000:
+                self.print_summary()
+                self._summary_ns = timestamp
         
-        # Auto-save if interval has passed
-        if (datetime.now() - self.last_save_time).total_seconds() >= self.autosave_interval:
+        # Auto-save if interval has passed (measured in event time, so a
+        # clock jump in either direction still triggers a save)
+        if self.last_save_ns is None:
+            self.last_save_ns = timestamp
+        if (abs(timestamp - self.last_save_ns) >= self.autosave_interval * 1_000_000_000 or
+                (self.journal is not None and self.journal.should_save)):
             self.save_session()
-            self.last_save_time = datetime.now()
-            print(f">>> Auto-saved: {len(self.session_events)} events | File: {self.session_file} <<<")
+            self.last_save_ns = timestamp
+            if self.verbosity >= 1:
+                print(f">>> Auto-saved: {len(self.session_events)} events | File: {self.session_file} <<<")
+        
+        if metrics:
+            metrics.observe('record_event', time.perf_counter_ns() - started)
+    
+    def print_summary(self):
+        """Print the events recorded since the last summary, busiest apps first"""
+        new_events = self.event_count - self._summary_events
+        if new_events <= 0:
+            return
+        apps = self.session_apps.copy()
+        apps.subtract(self._summary_apps)
+        top = ', '.join(f"{app} {count}" for app, count in apps.most_common(3) if count > 0)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {new_events} events ({top}) | "
+              f"session total {self.event_count}")
+        self._summary_events = self.event_count
+        self._summary_apps = dict(self.session_apps)
+    
+    def publish_snapshot(self):
+        """Replace self.snapshot with the current counters (one atomic assignment)"""
+        self.snapshot = StatusSnapshot(
+            tracking=self.tracking, global_mode=self.global_mode, session_id=self.session_id,
+            session_start=self.session_start, events=self.event_count,
+            apps=dict(self.session_apps), saved_events=self._saved_total,
+            dropped=self.event_pipeline.dropped)
+    
+    def refresh_totals(self):
+        """Bring the session index up to date and republish the saved total (slow)"""
+        self.storage.refresh()
+        self._saved_total = self.get_total_event_count()
+        self.publish_snapshot()
+    
+    def _store(self, timestamp, app, event_type, key):
+        """Add a row to the session buffer and the crash journal"""
+        self.session_events.append_event(timestamp, app, event_type, key)
+        if self.journal is not None:
+            self.journal.append(timestamp, app, event_type, key)
+    
+    def _store_burst(self, timestamp, app, event_type, key):
+        """Store a closed burst and count its keystrokes into the rollups"""
+        self._store(timestamp, app, event_type, key)
+        if self.journal is not None:
+            self.journal.checkpoint(None)
+        add_stored_event(self.rollups, timestamp, app, event_type, key)
+    
+    def _checkpoint_burst(self):
+        """Journal the burst still being typed, so a crash doesn't lose it"""
+        if self.bursts is not None and self.journal is not None:
+            self.journal.checkpoint(self.bursts.open_row())
+    
+    def enqueue_event(self, event_type, key=None, timestamp=None, position=None, app=None):
+        """Timestamp an event and hand it to the worker thread"""
+        if not self.tracking:
+            return
+        
+        if self.event_pipeline.running:
+            self.event_pipeline.put((timestamp or time.time_ns(), event_type, key, position, app))
+        else:
+            self.record_event(event_type, key, timestamp, position, app)
+            self._checkpoint_burst()
+            self.publish_snapshot()
+    
+    def _process_events(self, batch):
+        """Pipeline handler - record a batch of queued events"""
+        if self.metrics.enabled:
+            # Time from the listener callback to the worker picking it up
+            now = time.time_ns()
+            for item in batch:
+                self.metrics.observe('queue_delay', max(now - item[0], 0))
+        
+        for timestamp, event_type, key, position, app in batch:
+            # Events queued before a stop still belong to that session
+            self._record(event_type, key, timestamp, position, app)
+        self._checkpoint_burst()
+        self.publish_snapshot()
     
     def on_key_press(self, key):
         """Callback for keyboard events"""
@@ -169,7 +514,7 @@ class ActivityTracker:
             else:
                 key_str = str(key).replace('Key.', '')
             
-            self.record_event('keystroke', key_str)
+            self.enqueue_event('keystroke', key_str)
         except Exception as e:
             # Silently ignore errors to prevent spam
             pass
@@ -178,119 +523,258 @@ class ActivityTracker:
         """Callback for mouse click events"""
         if pressed:  # Only record on press, not release
             button_str = str(button).replace('Button.', '')
-            self.record_event('click', button_str)
+            self.enqueue_event('click', button_str, position=(x, y))
+    
+    def on_move(self, x, y):
+        """Callback for mouse movement - coalesced, not queued per move"""
+        if self.tracking:
+            self.motion.move(x, y)
+    
+    def on_scroll(self, x, y, dx, dy):
+        """Callback for scroll events - coalesced like movement"""
+        if self.tracking:
+            self.motion.scroll(dx, dy)
     
     def start_tracking(self):
         """Start tracking (or restart with new session)"""
         # Start new session
         self.event_count = 0
+        self.session_apps = Counter()
+        self._summary_ns = None
+        self._summary_events = 0
+        self._summary_apps = {}
         self.session_start = datetime.now()
         self.session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.session_file = os.path.join(self.data_folder, f'session_{self.session_id}.csv')
-        self.session_events = []
+        self.close_session_writer()
+        self.storage.open_session(self.session_id)
+        self.session_file = self.storage.session_location
+        self.session_events.clear()
+        self.motion.reset()
+        if self.bursts is not None:
+            self.bursts.reset()
+        self.saved_event_count = 0
+        if self.journal is not None:
+            self.journal.begin(self.session_id)
+        self.last_save_ns = None
+        self.first_event_ns = None
+        self.tracking_started_ns = time.perf_counter_ns()
         self.tracking = True
+        self.publish_snapshot()
         
         print(f"Tracking started... Session ID: {self.session_id}")
+        self.event_pipeline.start()
+        if self.metrics.enabled:
+            self.metrics.start_dumping(self.metrics_file, self.metrics_interval)
         
         # Only create listeners once on first start
         if not self.listeners_started and PYNPUT_AVAILABLE:
-            print("Creating listeners for the first time...")
-            
-            # Start keyboard monitoring - ignore the trust error
-            try:
-                # Create listener without checking trust status
-                self.keyboard_listener = keyboard.Listener(
-                    on_press=self.on_key_press,
-                    suppress=False
-                )
-                # Start in a thread so errors don't crash the app
-                keyboard_thread = threading.Thread(target=self.keyboard_listener.start, daemon=True)
-                keyboard_thread.start()
-                
-                # Give it a moment
-                import time
-                time.sleep(0.3)
-                print(f"✓ Keyboard listener started")
-            except Exception as e:
-                print(f"✗ Keyboard listener error (may still work): {e}")
-            
-            # Start mouse monitoring
-            try:
-                self.mouse_listener = mouse.Listener(on_click=self.on_click)
-                self.mouse_listener.start()
-                print(f"✓ Mouse listener started")
-            except Exception as e:
-                print(f"✗ Error starting mouse listener: {e}")
-            
-            self.listeners_started = True
+            self.start_listeners()
         else:
             print("Listeners already running, just starting new session")
     
+    def start_listeners(self, timeout=2.0):
+        """Create the keyboard and mouse listeners, returning once their hooks are live"""
+        print("Creating listeners for the first time...")
+        
+        # Start keyboard monitoring - ignore the trust error
+        try:
+            # Create listener without checking trust status; it runs in its
+            # own thread so errors don't crash the app
+            self.keyboard_listener = keyboard.Listener(
+                on_press=self.on_key_press,
+                suppress=False
+            )
+            self.keyboard_listener.start()
+            print(f"✓ Keyboard listener started")
+        except Exception as e:
+            print(f"✗ Keyboard listener error (may still work): {e}")
+        
+        # Start mouse monitoring
+        try:
+            if self.track_motion:
+                self.mouse_listener = mouse.Listener(
+                    on_click=self.on_click, on_move=self.on_move, on_scroll=self.on_scroll)
+            else:
+                self.mouse_listener = mouse.Listener(on_click=self.on_click)
+            self.mouse_listener.start()
+            print(f"✓ Mouse listener started")
+        except Exception as e:
+            print(f"✗ Error starting mouse listener: {e}")
+        
+        # Wait for the hooks to be installed rather than sleeping a fixed time
+        for name, listener in (('Keyboard', self.keyboard_listener), ('Mouse', self.mouse_listener)):
+            if listener is not None and not _wait_until_ready(listener, timeout):
+                print(f"✗ {name} listener not ready after {timeout}s")
+        
+        self.listeners_started = True
+    
+    def stop_listeners(self):
+        """Stop the keyboard and mouse listeners (only needed on exit)"""
+        for listener in (self.keyboard_listener, self.mouse_listener):
+            if listener is not None:
+                try:
+                    listener.stop()
+                except Exception as e:
+                    print(f"Error stopping listener: {e}")
+        self.keyboard_listener = None
+        self.mouse_listener = None
+        self.listeners_started = False
+    
     def stop_tracking(self):
         """Stop tracking (but keep listeners running)"""
+        self.motion.flush()
         self.tracking = False
+        self.event_pipeline.drain()
+        if self.bursts is not None:
+            self.bursts.flush()
         self.save_session()
+        self.close_session_writer()
+        if self.metrics.enabled:
+            self.metrics.stop_dumping(self.metrics_file)
+        if self.verbosity == 1:
+            self.print_summary()
+        self.publish_snapshot()
         print(f"Tracking stopped. Saved {len(self.session_events)} events")
         # Note: We DON'T stop the listeners - they keep running in the background
     
+    @property
+    def first_event_ms(self):
+        """Milliseconds from start_tracking to the session's first recorded event"""
+        if self.first_event_ns is None or self.tracking_started_ns is None:
+            return None
+        return (self.first_event_ns - self.tracking_started_ns) / 1e6
+    
     def toggle_mode(self):
         """Toggle between app-specific and global tracking"""
         self.global_mode = not self.global_mode
+        self.publish_snapshot()
         return self.global_mode
     
     def save_session(self):
-        """Save current session to CSV file"""
-        if not self.session_events:
-            return
+        """Append events recorded since the last save to the session storage"""
+        with self._save_lock:
+            if len(self.session_events) <= self.saved_event_count:
+                return
+            
+            started = time.perf_counter_ns() if self.metrics.enabled else None
+            try:
+                # Only the tail is new - earlier events are already saved
+                pending = list(self.session_events.iter_columns(self.saved_event_count))
+                self.storage.append_events(pending)
+                self.saved_event_count += len(pending)
+                self._saved_total = self.storage.total_events()
+                if self.journal is not None:
+                    self.journal.mark_saved(self.saved_event_count)
+                self.rollups.flush()
+                self.heatmaps.flush()
+            except Exception as e:
+                print(f"Error saving session: {e}")
+                import traceback
+                traceback.print_exc()
+            
+            if started is not None:
+                self.metrics.observe('save_session', time.perf_counter_ns() - started)
+    
+    def recover_journal(self):
+        """Save rows a crash left unsaved in the journal; returns how many"""
+        try:
+            session_id, rows, open_row = read_journal(self.journal_path)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            print(f"Warning: Could not read journal {self.journal_path}: {e}")
+            return 0
+        if not (rows or open_row) or not session_id:
+            return 0
         
         try:
-            # Write CSV file with UTF-8 encoding
-            with open(self.session_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=self.csv_header)
-                writer.writeheader()
-                writer.writerows(self.session_events)
+            # A crash after saving rows but before marking them saved leaves
+            # them in the journal too; the session's row count tells them apart
+            saved = self.storage.session_rows(session_id)
+            events = [event for number, event in rows if number > saved]
+            # The burst being typed, unless its closed row made it in
+            if open_row is not None and not any(event[:3] == open_row[:3] for event in events):
+                events.append(open_row)
+            if not events:
+                return 0
+            self.storage.open_session(session_id)
+            self.storage.append_events(events)
+            self.storage.close_session()
+            for event in events:
+                add_stored_event(self.rollups, *event)
+            self.rollups.flush()
         except Exception as e:
-            print(f"Error saving session: {e}")
-            import traceback
-            traceback.print_exc()
+            # Keep the journal so the rows aren't lost with the next one
+            print(f"Error recovering journal: {e}")
+            os.replace(self.journal_path, self.journal_path + '.failed')
+            return 0
+        
+        print(f"Recovered {len(events)} unsaved events into session {session_id}")
+        return len(events)
+    
+    def close_session_writer(self):
+        """Close the open session file, if any"""
+        with self._save_lock:
+            try:
+                self.storage.close_session()
+            except Exception as e:
+                print(f"Error closing session file: {e}")
     
     def load_all_sessions(self):
         """Load all session files and return combined events"""
-        all_events = []
-        
         try:
-            # Only load CSV files (ignore old JSON files)
-            session_files = glob.glob(os.path.join(self.data_folder, 'session_*.csv'))
-            
-            for session_file in session_files:
-                try:
-                    with open(session_file, 'r', newline='', encoding='utf-8') as f:
-                        reader = csv.DictReader(f)
-                        for row in reader:
-                            all_events.append(row)
-                except Exception as e:
-                    print(f"Warning: Could not load {session_file}: {e}")
-                    continue
+            return self.storage.load_all_sessions()
         except Exception as e:
             print(f"Error loading sessions: {e}")
-        
-        return all_events
+            return []
+    
+    def iter_events(self, start=None, end=None, apps=None, event_types=None, **options):
+        """Stream saved events lazily, skipping sessions outside the filters"""
+        return self.storage.iter_events(
+            start=start, end=end, apps=apps, event_types=event_types, **options)
+    
+    def get_total_event_count(self):
+        """Get total number of saved events without reading the sessions"""
+        return self.storage.total_events()
+    
+    def get_app_totals(self):
+        """Get saved event counts per application"""
+        return self.storage.app_totals()
     
     def get_session_count(self):
-        """Get total number of session files"""
+        """Get total number of saved sessions"""
         try:
-            session_files = glob.glob(os.path.join(self.data_folder, 'session_*.csv'))
-            return len(session_files)
+            return self.storage.get_session_count()
         except Exception as e:
             print(f"Error counting sessions: {e}")
             return 0
+    
+    def metrics_summary(self):
+        """One-line summary of the key latencies and drops, for the GUI"""
+        parts = []
+        for name, label in (('app_lookup', 'lookup'), ('record_event', 'record'),
+                            ('save_session', 'save')):
+            summary = self.metrics.summary(name)
+            if summary:
+                parts.append(f"{label} p99 {summary['p99_us']:.0f}µs")
+        parts.append(f"dropped {self.event_pipeline.dropped}")
+        return ' | '.join(parts)
 
 
 class ActivityTrackerGUI:
     """Compact customizable GUI for the Activity Tracker"""
     
     def __init__(self):
-        self.tracker = ActivityTracker(autosave_interval=30)
+        _import_tk()
+        self.tracker = ActivityTracker(autosave_interval=30, metrics_enabled=SHOW_METRICS,
+                                       query_port=QUERY_PORT, verbosity=CONSOLE_VERBOSITY,
+                                       console_interval=CONSOLE_INTERVAL, storage_format=STORAGE_FORMAT)
+        
+        # Slow work (start/stop, saving, refreshing totals, opening the
+        # folder) runs on worker threads; their callbacks come back through
+        # this queue and run on the Tk thread (see run_in_background)
+        self._results = queue.SimpleQueue()
+        self._toggling = False
         
         # Create main window
         self.root = tk.Tk()
@@ -302,6 +786,7 @@ class ActivityTrackerGUI:
         self.bg_image = None
         if os.path.exists(BG_IMAGE_PATH):
             try:
+                from PIL import Image, ImageTk
                 img = Image.open(BG_IMAGE_PATH)
                 # Resize to window size
                 width, height = map(int, WINDOW_SIZE.split('x'))
@@ -327,10 +812,14 @@ class ActivityTrackerGUI:
         # Create UI
         self.create_ui()
         
+        # Bring the session index up to date without blocking the window
+        self.run_in_background(self.tracker.refresh_totals)
+        
         # Start tracking automatically
-        self.tracking_thread = threading.Thread(target=self.tracker.start_tracking, daemon=True)
-        self.tracking_thread.start()
+        self._toggling = True
+        self.run_in_background(self.tracker.start_tracking, self._on_toggled)
         
+        self.root.after(RESULT_POLL_MS, self._poll_results)
         # Delay status updates slightly to let UI stabilize
         self.root.after(500, self.update_status)
     
@@ -406,31 +895,66 @@ class ActivityTrackerGUI:
         except:
             return hex_color
     
-    def toggle_tracking(self):
-        """Toggle tracking on/off"""
+    def run_in_background(self, work, on_done=None):
+        """Run work() on a worker thread, then on_done(result) on the Tk thread"""
+        def run():
+            try:
+                result = work()
+            except Exception as e:
+                print(f"Error in background task {getattr(work, '__name__', work)}: {e}")
+                import traceback
+                traceback.print_exc()
+                result = e
+            if on_done is not None:
+                self._results.put((on_done, result))
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def _poll_results(self):
+        """Run callbacks from finished background tasks (Tk is only touched here)"""
+        while True:
+            try:
+                on_done, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                on_done(result)
+            except Exception as e:
+                print(f"Error updating UI: {e}")
+        
         try:
-            if self.tracker.tracking:
-                # Stop current tracking
-                self.tracker.stop_tracking()
-                self.toggle_btn.config(text="START", bg=BUTTON_START_BG)
-                self.status_label.config(text="STOPPED", fg=STATUS_STOPPED_COLOR)
-            else:
-                # Start new tracking session
-                # Give a small delay to ensure everything is cleaned up
-                import time
-                time.sleep(0.2)
-                
-                # Start tracking in a new thread
-                self.tracking_thread = threading.Thread(
-                    target=self.tracker.start_tracking, daemon=True)
-                self.tracking_thread.start()
-                
-                self.toggle_btn.config(text="STOP", bg=BUTTON_STOP_BG)
-                self.status_label.config(text="TRACKING", fg=STATUS_TRACKING_COLOR)
-        except Exception as e:
-            print(f"Error toggling tracking: {e}")
-            import traceback
-            traceback.print_exc()
+            if self.root.winfo_exists():
+                self.root.after(RESULT_POLL_MS, self._poll_results)
+        except:
+            pass
+    
+    def toggle_tracking(self):
+        """Toggle tracking on/off without blocking the window"""
+        if self._toggling:
+            return  # the last start/stop is still running
+        self._toggling = True
+        self.toggle_btn.config(state=tk.DISABLED)
+        
+        if self.tracker.tracking:
+            # Stopping drains the queue and saves, so it runs off the Tk thread
+            self.status_label.config(text="STOPPING", fg=STATUS_STOPPED_COLOR)
+            self.run_in_background(self.tracker.stop_tracking, self._on_toggled)
+        else:
+            # No delay needed - stop_tracking already drained and closed the last session
+            self.status_label.config(text="STARTING", fg=STATUS_TRACKING_COLOR)
+            self.run_in_background(self.tracker.start_tracking, self._on_toggled)
+    
+    def _on_toggled(self, result):
+        """Show the state a background start/stop left the tracker in"""
+        self._toggling = False
+        self.toggle_btn.config(state=tk.NORMAL)
+        if self.tracker.tracking:
+            self.toggle_btn.config(text="STOP", bg=BUTTON_STOP_BG)
+            self.status_label.config(text="TRACKING", fg=STATUS_TRACKING_COLOR)
+        else:
+            self.toggle_btn.config(text="START", bg=BUTTON_START_BG)
+            self.status_label.config(text="STOPPED", fg=STATUS_STOPPED_COLOR)
+        self.update_stats()
     
     def toggle_mode(self):
         """Toggle between app-specific and global mode"""
@@ -446,35 +970,44 @@ class ActivityTrackerGUI:
         """Open the activity_data folder"""
         folder_path = os.path.abspath(self.tracker.data_folder)
         
-        try:
-            if platform.system() == 'Darwin':  # macOS
-                subprocess.run(['open', folder_path])
-            elif platform.system() == 'Windows':
-                subprocess.run(['explorer', folder_path])
-            else:  # Linux
-                subprocess.run(['xdg-open', folder_path])
-            print(f"Opened folder: {folder_path}")
-        except Exception as e:
-            print(f"Could not open folder: {e}")
+        def open_folder():
+            try:
+                if platform.system() == 'Darwin':  # macOS
+                    subprocess.run(['open', folder_path])
+                elif platform.system() == 'Windows':
+                    subprocess.run(['explorer', folder_path])
+                else:  # Linux
+                    subprocess.run(['xdg-open', folder_path])
+                print(f"Opened folder: {folder_path}")
+            except Exception as e:
+                print(f"Could not open folder: {e}")
+        
+        self.run_in_background(open_folder)
     
     def start_status_updates(self):
         """Start the status update loop"""
         self.update_status()
     
+    def update_stats(self):
+        """Redraw the stats line from the tracker's published snapshot (no I/O)"""
+        snapshot = self.tracker.snapshot
+        if snapshot.tracking and snapshot.session_start is not None:
+            session_duration = (datetime.now() - snapshot.session_start).total_seconds()
+            minutes = int(session_duration // 60)
+            seconds = int(session_duration % 60)
+            stats_text = f"{minutes}m {seconds}s | {snapshot.events} events"
+        else:
+            stats_text = f"Total: {snapshot.saved_events:,} events"
+        if self.tracker.metrics.enabled:
+            stats_text += "\n" + self.tracker.metrics_summary()
+        
+        if hasattr(self, 'stats_label') and self.stats_label.winfo_exists():
+            self.stats_label.config(text=stats_text)
+    
     def update_status(self):
         """Update status display"""
         try:
-            if self.tracker.tracking:
-                session_duration = (datetime.now() - self.tracker.session_start).total_seconds()
-                minutes = int(session_duration // 60)
-                seconds = int(session_duration % 60)
-                stats_text = f"{minutes}m {seconds}s | {self.tracker.event_count} events"
-            else:
-                all_events = self.tracker.load_all_sessions()
-                stats_text = f"Total: {len(all_events):,} events"
-            
-            if hasattr(self, 'stats_label') and self.stats_label.winfo_exists():
-                self.stats_label.config(text=stats_text)
+            self.update_stats()
         except Exception as e:
             print(f"Status update error: {e}")
         
@@ -491,12 +1024,27 @@ class ActivityTrackerGUI:
         self.root.mainloop()
     
     def on_closing(self):
-        """Clean up when closing"""
-        self.tracker.stop_tracking()
-        self.root.destroy()
+        """Clean up when closing - the final save runs off the Tk thread"""
+        self.toggle_btn.config(state=tk.DISABLED)
+        self.status_label.config(text="SAVING", fg=STATUS_STOPPED_COLOR)
+        
+        def shut_down():
+            if self.tracker.tracking:
+                self.tracker.stop_tracking()
+            self.tracker.event_pipeline.stop()
+            if self.tracker.query_server is not None:
+                self.tracker.query_server.stop()
+        
+        self.run_in_background(shut_down, lambda result: self.root.destroy())
 
 
 if __name__ == "__main__":
+    import sys
+    if '--headless' in sys.argv[1:]:
+        import daemon
+        daemon.main([arg for arg in sys.argv[1:] if arg != '--headless'])
+        sys.exit()
+    
     print("Activity Tracker Started")
     print("=" * 40)
     app = ActivityTrackerGUI()
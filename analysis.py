@@ -0,0 +1,454 @@
+"""
+Analysis
+Active time, idle gaps, per-app dwell time and event rates over saved sessions
+
+Saved events are loaded into contiguous numeric columns - timestamps, burst
+end times, event weights and app / event type codes - and every statistic
+is computed from those columns in whole-array passes rather than per event
+dict. NumPy is used when it is installed; otherwise the columns are
+array.array and the same statistics are computed over them in plain
+loops (slower, but still far from per-row datetime parsing).
+Binary session files are decoded block by block straight into columns, and
+CSV timestamps are parsed in bulk, so a year of history loads in seconds
+rather than minutes.
+
+Definitions (idle_threshold defaults to 5 minutes):
+
+    gap        time from the end of one event (a burst ends at its last
+               keystroke) to the start of the next
+    idle       gaps longer than idle_threshold; active time is the span
+               from the first to the last event minus idle gaps
+    dwell      time credited to the app of each event until the next event,
+               capped at idle_threshold; a visit starts at each app switch
+    rate       events per local-clock minute (a burst counts its keystrokes)
+
+Usage:
+    python analysis.py --start 2025-01-01 --end 2026-01-01
+    python analysis.py --app Chrome --idle-threshold 120 --json
+"""
+
+import argparse
+import csv
+import json
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from itertools import accumulate
+from operator import sub
+
+import session_query
+from bursts import BURST_EVENT_TYPE, decode_burst_key
+from event_buffer import StringTable, ns_to_iso
+from session_binary import BINARY_EXTENSION, BinarySessionReader
+from session_index import SessionIndex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NUMPY_AVAILABLE = np is not None
+SECOND_NS = 1_000_000_000
+MINUTE_NS = 60 * SECOND_NS
+# Upper edges (seconds) of the gap histogram buckets; the last bucket is open
+GAP_EDGES = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class EventColumns:
+    """Time-ordered events as parallel numeric columns
+
+    timestamps, ends   epoch nanoseconds (ends differ only for bursts)
+    weights            input events per row (a burst's keystroke count)
+    app_codes          index into apps
+    type_codes         index into event_types
+    """
+
+    def __init__(self, timestamps, ends, weights, app_codes, type_codes, apps, event_types, numpy):
+        self.timestamps = timestamps
+        self.ends = ends
+        self.weights = weights
+        self.app_codes = app_codes
+        self.type_codes = type_codes
+        self.apps = apps
+        self.event_types = event_types
+        self.numpy = numpy
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+# ============ Loading ============
+
+def _local_epoch_offsets_us(wall_us):
+    """Per-row offset from naive local wall-clock microseconds to epoch microseconds"""
+    # The UTC offset only changes on hour boundaries, so it is computed once
+    # per distinct hour rather than per row
+    hours, inverse = np.unique(wall_us // 3_600_000_000, return_inverse=True)
+    epoch = datetime(1970, 1, 1)
+    offsets = np.array([int(hour) * 3_600_000_000 -
+                        int((epoch + timedelta(hours=int(hour))).timestamp()) * 1_000_000
+                        for hour in hours], dtype=np.int64)
+    return offsets[inverse]
+
+
+def parse_iso_column(values, use_numpy):
+    """Epoch nanoseconds for a sequence of naive local ISO strings"""
+    if use_numpy:
+        wall_us = np.array(values, dtype='datetime64[us]').astype(np.int64)
+        if not len(wall_us):
+            return wall_us
+        return (wall_us - _local_epoch_offsets_us(wall_us)) * 1000
+
+    # Rows share their whole-second prefix with their neighbours, so only
+    # each new second goes through datetime
+    seconds = {}
+    parsed = array('q')
+    for value in values:
+        prefix = value[:19]
+        base = seconds.get(prefix)
+        if base is None:
+            base = seconds[prefix] = int(datetime.fromisoformat(prefix).timestamp()) * SECOND_NS
+        fraction = value[20:26]
+        parsed.append(base + int(fraction.ljust(6, '0')) * 1000 if fraction else base)
+    return parsed
+
+
+def _burst_columns(timestamps, type_codes, key_codes, burst_code, keys):
+    """Ends and weights for a chunk; (None, None) when it holds no bursts"""
+    if burst_code is None or burst_code not in type_codes:
+        return None, None
+    ends = array('q', timestamps)
+    weights = array('q', bytes(8 * len(timestamps)))
+    decoded = {}
+    for i, code in enumerate(type_codes):
+        if code != burst_code:
+            weights[i] = 1
+            continue
+        key_code = key_codes[i]
+        if key_code not in decoded:
+            try:
+                burst = decode_burst_key(keys[key_code])
+                decoded[key_code] = (burst['n'], burst['ms'] * 1_000_000)
+            except (ValueError, KeyError, TypeError):
+                decoded[key_code] = (1, 0)
+        weights[i], duration = decoded[key_code]
+        ends[i] += duration
+    return ends, weights
+
+
+def _remap(codes, mapping):
+    """File-local string codes to dataset-wide codes"""
+    return array('i', map(mapping.__getitem__, codes))
+
+
+def _read_binary(path, tables, start_ns, end_ns):
+    chunks = []
+    with BinarySessionReader(path) as reader:
+        app_map = [tables[0].code(value) for value in reader.tables[0]]
+        type_map = [tables[1].code(value) for value in reader.tables[1]]
+        file_types = reader.tables[1]
+        burst_code = file_types.index(BURST_EVENT_TYPE) if BURST_EVENT_TYPE in file_types else None
+
+        for index, entry in enumerate(reader.blocks):
+            low, high = entry[4], entry[5]
+            if (start_ns is not None and high < start_ns) or (end_ns is not None and low >= end_ns):
+                continue
+            timestamps, app_codes, type_codes, key_codes = reader.read_block(index)
+            ends, weights = _burst_columns(timestamps, type_codes, key_codes, burst_code,
+                                           reader.tables[2])
+            chunks.append((timestamps, ends, weights,
+                           _remap(app_codes, app_map), _remap(type_codes, type_map)))
+    return chunks
+
+
+def _read_csv(path, tables, use_numpy):
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        rows = list(reader)
+    if not header or not rows:
+        return []
+
+    columns = list(zip(*rows))
+    timestamps = parse_iso_column(columns[header.index('timestamp')], use_numpy)
+    if use_numpy:
+        timestamps = array('q', timestamps.tobytes())
+    app_codes = array('i', map(tables[0].code, columns[header.index('app')]))
+    type_codes = array('i', map(tables[1].code, columns[header.index('event_type')]))
+
+    burst_code = tables[1].codes.get(BURST_EVENT_TYPE)
+    keys = columns[header.index('key')]
+    # Row numbers stand in for key codes; each burst key is decoded once per row
+    ends, weights = _burst_columns(timestamps, type_codes, range(len(keys)), burst_code, keys)
+    return [(timestamps, ends, weights, app_codes, type_codes)]
+
+
+def load_columns(data_folder, start=None, end=None, apps=None, event_types=None, use_numpy=None):
+    """Load saved events in [start, end) into an EventColumns, sorted by time
+
+    use_numpy defaults to whether NumPy is installed. Sessions and archive
+    partitions outside the range or filters are skipped unopened.
+    """
+    use_numpy = NUMPY_AVAILABLE if use_numpy is None else use_numpy and NUMPY_AVAILABLE
+    start_ns = session_query.to_ns(start)
+    end_ns = session_query.to_ns(end)
+    apps = frozenset(apps) if apps else None
+    event_types = frozenset(event_types) if event_types else None
+
+    tables = (StringTable(), StringTable())
+    chunks = []
+    index = SessionIndex(data_folder)
+    for path in session_query.plan_files(data_folder, start_ns, end_ns, apps, event_types, index):
+        try:
+            if path.endswith(BINARY_EXTENSION):
+                chunks.extend(_read_binary(path, tables, start_ns, end_ns))
+            else:
+                chunks.extend(_read_csv(path, tables, use_numpy))
+        except Exception as e:
+            print(f"Warning: Could not load {path}: {e}")
+
+    columns = _concatenate(chunks, use_numpy)
+    keep_apps = None if apps is None else {tables[0].codes[app] for app in apps if app in tables[0].codes}
+    keep_types = (None if event_types is None else
+                  {tables[1].codes[kind] for kind in event_types if kind in tables[1].codes})
+    columns = _sort_and_filter(columns, start_ns, end_ns, keep_apps, keep_types, use_numpy)
+    return EventColumns(*columns, list(tables[0].values), list(tables[1].values), use_numpy)
+
+
+def _concatenate(chunks, use_numpy):
+    """Join per-block chunks into five columns, filling in ends and weights"""
+    if use_numpy:
+        if not chunks:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, empty.astype(np.int32), empty.astype(np.int32)
+        timestamps = np.concatenate([np.frombuffer(chunk[0], dtype=np.int64) for chunk in chunks])
+        ends = np.concatenate([np.frombuffer(chunk[1] if chunk[1] is not None else chunk[0],
+                                             dtype=np.int64) for chunk in chunks])
+        weights = np.concatenate([np.frombuffer(chunk[2], dtype=np.int64) if chunk[2] is not None
+                                  else np.ones(len(chunk[0]), dtype=np.int64) for chunk in chunks])
+        app_codes = np.concatenate([np.frombuffer(chunk[3], dtype=np.int32) for chunk in chunks])
+        type_codes = np.concatenate([np.frombuffer(chunk[4], dtype=np.int32) for chunk in chunks])
+        return timestamps, ends, weights, app_codes, type_codes
+
+    timestamps, ends, weights = array('q'), array('q'), array('q')
+    app_codes, type_codes = array('i'), array('i')
+    for chunk_timestamps, chunk_ends, chunk_weights, chunk_apps, chunk_types in chunks:
+        timestamps.extend(chunk_timestamps)
+        ends.extend(chunk_ends if chunk_ends is not None else chunk_timestamps)
+        weights.extend(chunk_weights if chunk_weights is not None else array('q', [1]) * len(chunk_timestamps))
+        app_codes.extend(chunk_apps)
+        type_codes.extend(chunk_types)
+    return timestamps, ends, weights, app_codes, type_codes
+
+
+def _sort_and_filter(columns, start_ns, end_ns, keep_apps, keep_types, use_numpy):
+    timestamps, _, _, app_codes, type_codes = columns
+    if use_numpy:
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start_ns is not None:
+            mask &= timestamps >= start_ns
+        if end_ns is not None:
+            mask &= timestamps < end_ns
+        if keep_apps is not None:
+            mask &= np.isin(app_codes, list(keep_apps))
+        if keep_types is not None:
+            mask &= np.isin(type_codes, list(keep_types))
+        selected = np.flatnonzero(mask)
+        order = selected[np.argsort(timestamps[selected], kind='stable')]
+        return tuple(column[order] for column in columns)
+
+    order = [i for i in range(len(timestamps))
+             if (start_ns is None or timestamps[i] >= start_ns) and
+             (end_ns is None or timestamps[i] < end_ns) and
+             (keep_apps is None or app_codes[i] in keep_apps) and
+             (keep_types is None or type_codes[i] in keep_types)]
+    order.sort(key=timestamps.__getitem__)
+    return tuple(array(column.typecode, map(column.__getitem__, order)) for column in columns)
+
+
+# ============ Statistics ============
+
+def gaps(columns):
+    """Gaps between consecutive events in nanoseconds (len(columns) - 1 of them)"""
+    if len(columns) < 2:
+        return np.zeros(0, dtype=np.int64) if columns.numpy else array('q')
+    if columns.numpy:
+        # A burst can outlast the events that follow it, so measure from the
+        # furthest end reached so far
+        reach = np.maximum.accumulate(columns.ends)
+        return np.maximum(columns.timestamps[1:] - reach[:-1], 0)
+    reach = array('q', accumulate(columns.ends, max))
+    return array('q', (max(gap, 0) for gap in map(sub, columns.timestamps[1:], reach[:-1])))
+
+
+def active_time(columns, idle_threshold=300):
+    """Active and idle seconds over the loaded range"""
+    if not len(columns):
+        return {'span_s': 0.0, 'active_s': 0.0, 'idle_s': 0.0, 'idle_gaps': 0, 'active_periods': 0}
+    threshold = int(idle_threshold * SECOND_NS)
+    between = gaps(columns)
+    if columns.numpy:
+        span = int(columns.ends.max() - columns.timestamps[0])
+        idle_mask = between > threshold
+        idle = int(between[idle_mask].sum())
+        idle_gaps = int(np.count_nonzero(idle_mask))
+    else:
+        span = max(columns.ends) - columns.timestamps[0]
+        long_gaps = [gap for gap in between if gap > threshold]
+        idle = sum(long_gaps)
+        idle_gaps = len(long_gaps)
+    return {'span_s': span / SECOND_NS, 'active_s': (span - idle) / SECOND_NS,
+            'idle_s': idle / SECOND_NS, 'idle_gaps': idle_gaps, 'active_periods': idle_gaps + 1}
+
+
+def gap_distribution(columns, edges=GAP_EDGES):
+    """Histogram of gaps over `edges` (seconds) plus percentiles"""
+    between = gaps(columns)
+    edges_ns = [int(edge * SECOND_NS) for edge in edges]
+    if columns.numpy:
+        buckets = np.bincount(np.searchsorted(edges_ns, between, side='left'),
+                              minlength=len(edges_ns) + 1).tolist()
+        ordered = np.sort(between)
+    else:
+        buckets = [0] * (len(edges_ns) + 1)
+        for gap in between:
+            buckets[bisect_right(edges_ns, gap - 1)] += 1
+        ordered = sorted(between)
+
+    result = {'gaps': len(between),
+              'buckets': {f'<={edge:g}s': count for edge, count in zip(edges, buckets)}}
+    result['buckets'][f'>{edges[-1]:g}s'] = buckets[-1]
+    for name, fraction in (('p50_s', 0.5), ('p90_s', 0.9), ('p99_s', 0.99), ('max_s', 1.0)):
+        result[name] = int(ordered[int(fraction * (len(ordered) - 1))]) / SECOND_NS if len(ordered) else None
+    return result
+
+
+def app_dwell(columns, idle_threshold=300):
+    """Seconds, visits and events per app, most time first"""
+    count = len(columns)
+    if not count:
+        return {}
+    threshold = int(idle_threshold * SECOND_NS)
+    codes = columns.app_codes
+    apps = len(columns.apps)
+
+    if columns.numpy:
+        durations = columns.ends - columns.timestamps
+        credit = np.empty(count, dtype=np.int64)
+        credit[:-1] = np.minimum(np.diff(columns.timestamps), np.maximum(durations[:-1], threshold))
+        credit[-1] = durations[-1]
+        seconds = np.bincount(codes, weights=credit, minlength=apps) / SECOND_NS
+        events = np.bincount(codes, weights=columns.weights, minlength=apps)
+        switched = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        visits = np.bincount(codes[switched], minlength=apps)
+        visits[codes[0]] += 1
+        seconds, events, visits = seconds.tolist(), events.tolist(), visits.tolist()
+    else:
+        seconds, events, visits = [0] * apps, [0] * apps, [0] * apps
+        timestamps, ends, weights = columns.timestamps, columns.ends, columns.weights
+        previous = None
+        for i in range(count):
+            code = codes[i]
+            duration = ends[i] - timestamps[i]
+            credit = min(timestamps[i + 1] - timestamps[i], max(duration, threshold)) if i + 1 < count else duration
+            seconds[code] += credit
+            events[code] += weights[i]
+            if code != previous:
+                visits[code] += 1
+                previous = code
+        seconds = [value / SECOND_NS for value in seconds]
+
+    dwell = {app: {'seconds': seconds[code], 'visits': int(visits[code]), 'events': int(events[code])}
+             for code, app in enumerate(columns.apps) if events[code]}
+    return dict(sorted(dwell.items(), key=lambda item: item[1]['seconds'], reverse=True))
+
+
+def events_per_minute(columns):
+    """(first minute as epoch ns, counts per minute) with a slot for every minute in range"""
+    if not len(columns):
+        return None, []
+    timestamps = columns.timestamps
+    first = int(timestamps[0]) // MINUTE_NS
+    if columns.numpy:
+        counts = np.bincount(timestamps // MINUTE_NS - first, weights=columns.weights)
+        return first * MINUTE_NS, counts.astype(np.int64)
+
+    counts = array('q', bytes(8 * (timestamps[-1] // MINUTE_NS - first + 1)))
+    for timestamp, weight in zip(timestamps, columns.weights):
+        counts[timestamp // MINUTE_NS - first] += weight
+    return first * MINUTE_NS, counts
+
+
+def summarize(columns, idle_threshold=300):
+    """All of the above as one JSON-friendly dict"""
+    _, rate = events_per_minute(columns)
+    if columns.numpy:
+        busy = rate[rate > 0]
+        active_minutes, busy_total = len(busy), int(busy.sum())
+    else:
+        busy = [count for count in rate if count]
+        active_minutes, busy_total = len(busy), sum(busy)
+    return {'rows': len(columns),
+            'events': int(columns.weights.sum() if columns.numpy else sum(columns.weights)),
+            'first': ns_to_iso(int(columns.timestamps[0])) if len(columns) else None,
+            'last': ns_to_iso(int(columns.timestamps[-1])) if len(columns) else None,
+            'active': active_time(columns, idle_threshold),
+            'gaps': gap_distribution(columns),
+            'dwell': app_dwell(columns, idle_threshold),
+            'per_minute': {'minutes': len(rate), 'active_minutes': active_minutes,
+                           'peak': int(max(rate)) if len(rate) else 0,
+                           'mean_active': busy_total / active_minutes if active_minutes else 0.0}}
+
+
+def _hours(seconds):
+    return f"{seconds / 3600:,.1f}h"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Active time, idle gaps and dwell time per app")
+    parser.add_argument('--data-folder', default='activity_data')
+    parser.add_argument('--start', help="ISO start (inclusive)")
+    parser.add_argument('--end', help="ISO end (exclusive)")
+    parser.add_argument('--app', action='append', help="only this app (repeatable)")
+    parser.add_argument('--idle-threshold', type=float, default=300,
+                        help="gaps longer than this many seconds count as idle")
+    parser.add_argument('--no-numpy', action='store_true', help="use the array fallback")
+    parser.add_argument('--json', action='store_true', help="print the full summary as JSON")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    columns = load_columns(args.data_folder, args.start, args.end, apps=args.app,
+                           use_numpy=not args.no_numpy)
+    loaded = time.perf_counter()
+    summary = summarize(columns, args.idle_threshold)
+    summary['seconds'] = {'load': loaded - started, 'analyse': time.perf_counter() - loaded}
+    summary['backend'] = 'numpy' if columns.numpy else 'array'
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    active = summary['active']
+    print(f"{summary['events']:,} events ({summary['rows']:,} rows) from {summary['first']} to "
+          f"{summary['last']}, loaded in {summary['seconds']['load']:.2f}s with {summary['backend']}")
+    print(f"Active {_hours(active['active_s'])} of {_hours(active['span_s'])} "
+          f"in {active['active_periods']:,} periods")
+    gap_stats = summary['gaps']
+    if gap_stats['gaps']:
+        print(f"Gaps: p50 {gap_stats['p50_s']:.3f}s, p90 {gap_stats['p90_s']:.3f}s, "
+              f"p99 {gap_stats['p99_s']:.3f}s")
+    for bucket, count in gap_stats['buckets'].items():
+        print(f"  {bucket:>8} {count:>12,}")
+    print(f"Per minute: peak {summary['per_minute']['peak']:,}, "
+          f"mean {summary['per_minute']['mean_active']:.1f} over "
+          f"{summary['per_minute']['active_minutes']:,} active minutes")
+    print("Dwell:")
+    for app, stats in list(summary['dwell'].items())[:10]:
+        print(f"  {_hours(stats['seconds']):>8} {stats['visits']:>7,} visits "
+              f"{stats['events']:>10,} events  {app}")
+
+
+if __name__ == "__main__":
+    main()
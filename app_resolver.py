@@ -0,0 +1,216 @@
+"""
+Active Application Resolver
+Caches the foreground application so the event path doesn't ask the OS on
+every keystroke and click
+
+The resolver keeps the current app name until focus changes (where the
+platform can tell us) or a short TTL runs out, and remembers pid -> name
+lookups in a small LRU. Window sources are pluggable, so tests and
+benchmarks can drive it with FakeWindowSource.
+"""
+
+import platform
+import threading
+import time
+from collections import OrderedDict
+
+
+class WindowSource:
+    """Backend interface - tells the resolver which app is in front"""
+
+    def foreground(self):
+        """Return (pid, name) for the foreground app; name may be None"""
+        raise NotImplementedError
+
+    def process_name(self, pid):
+        """Return the application name for a pid"""
+        raise NotImplementedError
+
+    def subscribe(self, callback):
+        """Call callback() on every focus change; return False if unsupported"""
+        return False
+
+
+class NullWindowSource(WindowSource):
+    """Fallback for platforms without an app lookup"""
+
+    def foreground(self):
+        return None, "Unknown"
+
+    def process_name(self, pid):
+        return "Unknown"
+
+
+class MacWindowSource(WindowSource):
+    """macOS backend using NSWorkspace"""
+
+    def __init__(self):
+        from AppKit import NSWorkspace
+        self._workspace = NSWorkspace.sharedWorkspace()
+        self._observer = None
+
+    def foreground(self):
+        active_app = self._workspace.activeApplication()
+        if not active_app:
+            return None, "Unknown"
+        return (active_app.get('NSApplicationProcessIdentifier'),
+                active_app.get('NSApplicationName', "Unknown"))
+
+    def process_name(self, pid):
+        from AppKit import NSRunningApplication
+        app = NSRunningApplication.runningApplicationWithProcessIdentifier_(pid)
+        return app.localizedName() if app is not None else "Unknown"
+
+    def subscribe(self, callback):
+        # Delivered on the main run loop - the Tk mainloop drives it on macOS
+        try:
+            from AppKit import NSWorkspaceDidActivateApplicationNotification
+            center = self._workspace.notificationCenter()
+            self._observer = center.addObserverForName_object_queue_usingBlock_(
+                NSWorkspaceDidActivateApplicationNotification, None, None,
+                lambda notification: callback())
+            return True
+        except Exception as e:
+            print(f"Focus notifications unavailable, polling instead: {e}")
+            return False
+
+
+class WindowsWindowSource(WindowSource):
+    """Windows backend using win32gui and psutil"""
+
+    def __init__(self):
+        import win32gui
+        import win32process
+        import psutil
+        self._win32gui = win32gui
+        self._win32process = win32process
+        self._psutil = psutil
+
+    def foreground(self):
+        window = self._win32gui.GetForegroundWindow()
+        _, pid = self._win32process.GetWindowThreadProcessId(window)
+        return pid, None
+
+    def process_name(self, pid):
+        return self._psutil.Process(pid).name()
+
+
+class FakeWindowSource(WindowSource):
+    """Scriptable source for tests and benchmarks"""
+
+    def __init__(self, apps=None, notify=True):
+        self.apps = dict(apps or {1: "Fake"})  # pid -> name
+        self.pid = next(iter(self.apps))
+        self.notify = notify
+        self.foreground_calls = 0
+        self.name_calls = 0
+        self._callbacks = []
+
+    def focus(self, pid, name=None):
+        """Bring pid to the front, notifying subscribers"""
+        if name is not None:
+            self.apps[pid] = name
+        self.pid = pid
+        for callback in self._callbacks:
+            callback()
+
+    def foreground(self):
+        self.foreground_calls += 1
+        return self.pid, None
+
+    def process_name(self, pid):
+        self.name_calls += 1
+        return self.apps.get(pid, "Unknown")
+
+    def subscribe(self, callback):
+        if not self.notify:
+            return False
+        self._callbacks.append(callback)
+        return True
+
+
+def default_window_source():
+    """Pick the window source for the current platform"""
+    try:
+        if platform.system() == 'Darwin':
+            return MacWindowSource()
+        elif platform.system() == 'Windows':
+            return WindowsWindowSource()
+    except ImportError as e:
+        print(f"Warning: Could not load app lookup backend: {e}")
+    return NullWindowSource()
+
+
+class AppResolver:
+    """Caches the foreground application name between focus changes"""
+
+    def __init__(self, source=None, ttl=0.25, notify_ttl=1.0, cache_size=256,
+                 clock=time.monotonic, notifications=True):
+        self.source = source if source is not None else default_window_source()
+        self.clock = clock
+        self.cache_size = cache_size
+
+        # pid -> name, most recently used last
+        self._names = OrderedDict()
+        self._lock = threading.Lock()
+        self._current = None
+        self._expires = 0.0
+        self._generation = 0
+
+        # With notifications the TTL is only a safety net for missed ones.
+        # Callers with no main run loop to deliver them (e.g. daemon.py)
+        # pass notifications=False and rely on the short TTL instead
+        self.notifications = notifications and self.source.subscribe(self.invalidate)
+        self.max_age = notify_ttl if self.notifications else ttl
+
+        # Counters for diagnostics
+        self.hits = 0
+        self.foreground_lookups = 0
+        self.name_lookups = 0
+
+    def invalidate(self):
+        """Forget the cached app - called on focus changes"""
+        self._generation += 1
+        self._expires = 0.0
+
+    def resolve(self):
+        """Return the foreground app name, asking the OS only when stale"""
+        current = self._current
+        if current is not None and self.clock() < self._expires:
+            self.hits += 1
+            return current
+
+        with self._lock:
+            generation = self._generation
+            now = self.clock()
+            try:
+                pid, name = self.source.foreground()
+                self.foreground_lookups += 1
+                if name is None:
+                    name = self._name_for_pid(pid)
+            except Exception:
+                name = "Unknown"
+
+            self._current = name or "Unknown"
+            # A focus change during the lookup leaves the result stale
+            if generation == self._generation:
+                self._expires = now + self.max_age
+            return self._current
+
+    def _name_for_pid(self, pid):
+        """Look up a process name through the LRU cache"""
+        if pid is None:
+            return "Unknown"
+
+        names = self._names
+        name = names.get(pid)
+        if name is not None:
+            names.move_to_end(pid)
+            return name
+
+        self.name_lookups += 1
+        name = self.source.process_name(pid)
+        names[pid] = name
+        if len(names) > self.cache_size:
+            names.popitem(last=False)
+        return name
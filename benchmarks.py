@@ -0,0 +1,295 @@
+"""
+Event Pipeline Benchmarks
+Headless, reproducible measurements of the tracker's hot path
+
+Drives ActivityTracker with synthetic keyboard and mouse streams using a
+FakeWindowSource app resolver - no pynput listeners and no Tk window - and
+reports:
+
+- record_event latency percentiles (synthetic event time, so multi-hour
+  sessions run in seconds and auto-saves happen on the simulated clock)
+- on_key_press / on_click callback latency with the event worker running,
+  paced in real time at the scenario's rate
+- auto-save pause durations
+- peak size of the session_events buffer
+- load_all_sessions throughput for several history sizes
+
+Usage:
+    python benchmarks.py                       # all scenarios
+    python benchmarks.py --scenario burst --output bench.json
+    python benchmarks.py --history-sizes 10000,100000,1000000
+
+Results are written as JSON so runs can be compared.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+
+from app_resolver import AppResolver, FakeWindowSource
+from activity_tracker import ActivityTracker
+from storage import make_storage
+
+
+APPS = {1: "Code", 2: "Chrome", 3: "Terminal", 4: "Slack"}
+KEYS = list('etaoinshrdlucmfwypvbgkjqxz') + ['space', 'enter', 'backspace', 'shift', 'tab']
+BUTTONS = ['Button.left', 'Button.left', 'Button.left', 'Button.right']
+
+# name -> (events/sec while active, active seconds, pause seconds, simulated duration seconds)
+SCENARIOS = {
+    'steady': (5.0, 60.0, 0.0, 30 * 60),
+    'burst': (25.0, 2.0, 3.0, 30 * 60),
+    'long': (5.0, 60.0, 0.0, 4 * 60 * 60),
+}
+
+
+class FakeKey:
+    """Stand-in for a pynput key with a char attribute"""
+
+    def __init__(self, char):
+        self.char = char if len(char) == 1 else None
+        self.name = char
+
+    def __str__(self):
+        return f"Key.{self.name}"
+
+
+def percentiles(samples):
+    """Summary statistics of latency samples in nanoseconds, reported in microseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def at(fraction):
+        return ordered[min(count - 1, int(fraction * count))] / 1000
+
+    return {'count': count, 'mean_us': sum(ordered) / count / 1000, 'p50_us': at(0.50),
+            'p90_us': at(0.90), 'p99_us': at(0.99), 'p999_us': at(0.999),
+            'max_us': ordered[-1] / 1000}
+
+
+def synthetic_stream(rate, active, pause, duration, seed=0, start_ns=None):
+    """Yield (timestamp_ns, event_type, key, pid) for a typing/clicking pattern
+
+    duration is in seconds; None means the stream never ends.
+    """
+    rng = random.Random(seed)
+    now = start_ns if start_ns is not None else time.time_ns()
+    end = now + int(duration * 1e9) if duration is not None else None
+    pid = 1
+    period_end = now + int(active * 1e9)
+
+    while end is None or now < end:
+        # Poisson arrivals at `rate` during active periods
+        now += int(rng.expovariate(rate) * 1e9)
+        if pause and now >= period_end:
+            now = period_end + int(pause * 1e9)
+            period_end = now + int(active * 1e9)
+        if rng.random() < 0.01:
+            pid = rng.choice(list(APPS))
+
+        if rng.random() < 0.1:
+            yield now, 'click', rng.choice(BUTTONS).replace('Button.', ''), pid
+        else:
+            yield now, 'keystroke', rng.choice(KEYS), pid
+
+
+@contextlib.contextmanager
+def quiet():
+    """Send the tracker's console output to /dev/null, like a GUI app would"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def make_tracker(data_folder, storage_format, autosave_interval):
+    source = FakeWindowSource(APPS)
+    tracker = ActivityTracker(autosave_interval=autosave_interval, storage_format=storage_format,
+                              app_resolver=AppResolver(source), data_folder=data_folder)
+    return tracker, source
+
+
+def bench_record(name, storage_format, autosave_interval, seed):
+    """Drive record_event with simulated time and measure latency and saves"""
+    rate, active, pause, duration = SCENARIOS[name]
+    folder = tempfile.mkdtemp(prefix='bench_')
+    try:
+        tracker, source = make_tracker(folder, storage_format, autosave_interval)
+
+        save_pauses = []
+        save_session = tracker.save_session
+
+        def timed_save():
+            started = time.perf_counter_ns()
+            save_session()
+            save_pauses.append(time.perf_counter_ns() - started)
+
+        tracker.save_session = timed_save
+
+        latencies = []
+        peak_buffer = 0
+        with quiet():
+            tracker.start_tracking()
+            for timestamp, event_type, key, pid in synthetic_stream(rate, active, pause, duration, seed):
+                if pid != source.pid:
+                    source.focus(pid)
+                started = time.perf_counter_ns()
+                tracker.record_event(event_type, key, timestamp=timestamp)
+                latencies.append(time.perf_counter_ns() - started)
+                if len(latencies) % 1000 == 0:
+                    peak_buffer = max(peak_buffer, tracker.session_events.memory_bytes)
+            peak_buffer = max(peak_buffer, tracker.session_events.memory_bytes)
+            events = len(tracker.session_events)
+            tracker.stop_tracking()
+        tracker.event_pipeline.stop()
+        tracker.storage.close()
+
+        return {'events': events, 'simulated_seconds': duration,
+                'record_event': percentiles(latencies),
+                'autosave': percentiles(save_pauses[:-1]),  # the last save is stop_tracking's
+                'session_events_peak_bytes': peak_buffer,
+                'bytes_per_event': peak_buffer / events if events else 0,
+                'resolver': {'hits': tracker.app_resolver.hits,
+                             'lookups': tracker.app_resolver.foreground_lookups}}
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def bench_callbacks(name, storage_format, seconds, seed):
+    """Drive on_key_press / on_click in real time with the worker thread running"""
+    rate, active, pause, _ = SCENARIOS[name]
+    folder = tempfile.mkdtemp(prefix='bench_')
+    try:
+        tracker, source = make_tracker(folder, storage_format, autosave_interval=5)
+        latencies = {'on_key_press': [], 'on_click': []}
+
+        with quiet():
+            tracker.start_tracking()
+            started_wall = time.time_ns()
+            for timestamp, event_type, key, pid in synthetic_stream(
+                    rate, active, pause, seconds, seed, start_ns=started_wall):
+                delay = (timestamp - time.time_ns()) / 1e9
+                if delay > 0:
+                    time.sleep(delay)
+                if pid != source.pid:
+                    source.focus(pid)
+
+                if event_type == 'click':
+                    started = time.perf_counter_ns()
+                    tracker.on_click(0, 0, f'Button.{key}', True)
+                    latencies['on_click'].append(time.perf_counter_ns() - started)
+                else:
+                    fake_key = FakeKey(key)
+                    started = time.perf_counter_ns()
+                    tracker.on_key_press(fake_key)
+                    latencies['on_key_press'].append(time.perf_counter_ns() - started)
+            tracker.stop_tracking()
+        pipeline = tracker.event_pipeline
+        pipeline.stop()
+        tracker.storage.close()
+
+        result = {callback: percentiles(samples) for callback, samples in latencies.items()}
+        result['queue'] = {'enqueued': pipeline.enqueued, 'dropped': pipeline.dropped,
+                           'high_water': pipeline.high_water}
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def bench_load(sizes, storage_format, seed, events_per_session=20000):
+    """Measure load_all_sessions throughput against history size"""
+    results = []
+    for size in sizes:
+        folder = tempfile.mkdtemp(prefix='bench_')
+        try:
+            storage = make_storage(folder, storage_format)
+            stream = synthetic_stream(8.0, 60.0, 0.0, None, seed,
+                                      start_ns=1_700_000_000 * 1_000_000_000)
+            written = 0
+            session = 0
+            while written < size:
+                count = min(events_per_session, size - written)
+                batch = [(timestamp, APPS[pid], event_type, key)
+                         for timestamp, event_type, key, pid in islice(stream, count)]
+                storage.open_session(f'20231114_{session:06d}')
+                storage.append_events(batch)
+                storage.close_session()
+                written += count
+                session += 1
+
+            tracker = ActivityTracker(storage=storage, data_folder=folder)
+            started = time.perf_counter()
+            with quiet():
+                events = len(tracker.load_all_sessions())
+            elapsed = time.perf_counter() - started
+            storage.close()
+
+            results.append({'history_events': size, 'sessions': session,
+                            'loaded_events': events, 'seconds': elapsed,
+                            'events_per_second': events / elapsed if elapsed else None})
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'machine': platform.machine(), 'commit': commit or None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the activity tracker event pipeline")
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS) + ['all'], default='all')
+    parser.add_argument('--storage-format', default='csv', choices=['csv', 'binary', 'sqlite'])
+    parser.add_argument('--autosave-interval', type=float, default=30.0,
+                        help="simulated seconds between auto-saves")
+    parser.add_argument('--callback-seconds', type=float, default=5.0,
+                        help="real seconds of paced callback traffic per scenario (0 to skip)")
+    parser.add_argument('--history-sizes', default='10000,100000',
+                        help="comma-separated event counts for the load benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write JSON results here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    scenarios = sorted(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    results = {'environment': environment(), 'config': vars(args), 'scenarios': {}}
+
+    for name in scenarios:
+        print(f"Running {name}...", file=sys.stderr)
+        result = {'record': bench_record(name, args.storage_format, args.autosave_interval, args.seed)}
+        if args.callback_seconds > 0:
+            result['callbacks'] = bench_callbacks(name, args.storage_format,
+                                                  args.callback_seconds, args.seed)
+        results['scenarios'][name] = result
+
+    sizes = [int(size) for size in args.history_sizes.split(',') if size]
+    if sizes:
+        print("Running load_all_sessions...", file=sys.stderr)
+        results['load_all_sessions'] = bench_load(sizes, args.storage_format, args.seed)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
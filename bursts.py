@@ -0,0 +1,150 @@
+"""
+Bursts
+Coalesces runs of keystrokes into single burst records
+
+With ActivityTracker(record_mode='burst'), consecutive keystrokes in the
+same app are stored as one row per typing burst instead of one row per
+key. A burst closes when typing pauses for `gap` seconds, the app changes,
+or it has lasted `max_duration` seconds. The row's timestamp is the
+burst's first keystroke, its event_type is 'burst', and its key is JSON:
+
+    {"n": 42, "ms": 5321}                               count, duration
+    {"n": 42, "ms": 5321, "classes": {"letter": 35, ...}}   histogram='class'
+    {"n": 42, "ms": 5321, "keys": {"e": 6, ...}}            histogram='key'
+
+Without a histogram, or with the key-class one (see rollups.key_class),
+no key contents are stored.
+"""
+
+import json
+import threading
+
+from event_buffer import iso_to_ns, ns_to_iso
+
+
+BURST_EVENT_TYPE = 'burst'
+RECORD_MODES = ('raw', 'burst')
+HISTOGRAMS = (None, 'class', 'key')
+
+
+def encode_burst_key(count, duration_ns, classes=None, keys=None):
+    """Build a burst record's key"""
+    record = {'n': count, 'ms': duration_ns // 1_000_000}
+    if classes is not None:
+        record['classes'] = classes
+    if keys is not None:
+        record['keys'] = keys
+    return json.dumps(record, separators=(',', ':'))
+
+
+def decode_burst_key(key):
+    """Parse a burst record's key into a dict with n, ms and an optional histogram"""
+    return json.loads(key)
+
+
+def event_weight(event_type, key):
+    """How many input events a stored row stands for"""
+    if event_type != BURST_EVENT_TYPE:
+        return 1
+    try:
+        return json.loads(key)['n']
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+def decode_row(row):
+    """Add count, end and histogram fields to a burst row dict (other rows pass through)"""
+    if row['event_type'] != BURST_EVENT_TYPE:
+        return row
+    try:
+        burst = json.loads(row['key'])
+        row['count'] = burst['n']
+        row['end'] = ns_to_iso(iso_to_ns(row['timestamp']) + burst['ms'] * 1_000_000)
+    except (ValueError, KeyError, TypeError):
+        return row
+    for histogram in ('classes', 'keys'):
+        if histogram in burst:
+            row[histogram] = burst[histogram]
+    return row
+
+
+class BurstCoalescer:
+    """Groups keystrokes per app into bursts and emits each one when it closes"""
+
+    def __init__(self, emit, gap=2.0, max_duration=60.0, histogram=None):
+        if histogram not in HISTOGRAMS:
+            raise ValueError(f"Unknown burst histogram: {histogram}")
+
+        self.emit = emit  # called as emit(start_ns, app, 'burst', key)
+        self.gap_ns = int(gap * 1e9)
+        self.max_ns = int(max_duration * 1e9)
+        self.histogram = histogram
+        self._lock = threading.Lock()
+        self._burst = None  # [app, start_ns, last_ns, count, histogram dict]
+
+        if histogram == 'class':
+            from rollups import key_class
+            self._bucket = lambda key: key_class('keystroke', key)
+        else:
+            self._bucket = lambda key: key
+
+    def add(self, timestamp_ns, app, key):
+        """Count one keystroke, closing the open burst first if it has ended"""
+        with self._lock:
+            burst = self._burst
+            closed = None
+            if burst is not None and (app != burst[0] or
+                                      timestamp_ns - burst[2] >= self.gap_ns or
+                                      timestamp_ns - burst[1] >= self.max_ns):
+                closed, burst = burst, None
+            if burst is None:
+                burst = self._burst = [app, timestamp_ns, timestamp_ns, 0, {}]
+
+            burst[2] = max(burst[2], timestamp_ns)
+            burst[3] += 1
+            if self.histogram is not None:
+                bucket = self._bucket(key)
+                burst[4][bucket] = burst[4].get(bucket, 0) + 1
+
+        if closed is not None:
+            self._emit(closed)
+
+    def close_idle(self, now_ns):
+        """Close the open burst if no keystroke has arrived for `gap` seconds"""
+        with self._lock:
+            burst = self._burst
+            if burst is None or now_ns - burst[2] < self.gap_ns:
+                return
+            self._burst = None
+        self._emit(burst)
+
+    def flush(self):
+        """Close the open burst, if any (e.g. when a session stops)"""
+        with self._lock:
+            burst, self._burst = self._burst, None
+        if burst is not None:
+            self._emit(burst)
+
+    def reset(self):
+        """Drop the open burst without emitting it"""
+        with self._lock:
+            self._burst = None
+
+    def open_row(self):
+        """The open burst as the row it would be stored as so far, or None"""
+        with self._lock:
+            burst = self._burst
+            if burst is None:
+                return None
+            burst = burst[:4] + [dict(burst[4])]
+        return self._row(burst)
+
+    def _row(self, burst):
+        app, start, last, count, histogram = burst
+        key = encode_burst_key(count, last - start,
+                               classes=histogram if self.histogram == 'class' else None,
+                               keys=histogram if self.histogram == 'key' else None)
+        return start, app, BURST_EVENT_TYPE, key
+
+    def _emit(self, burst):
+        self.emit(*self._row(burst))
@@ -0,0 +1,461 @@
+"""
+Compaction
+Merges closed sessions into day or month archive partitions, with retention
+
+Every start/stop leaves a session_<id> file in activity_data/. Compaction
+moves the events of closed sessions into activity_data/archive/part_<date>
+files - one per local day (part_YYYYMMDD) or month (part_YYYYMM) - and
+deletes the session files. archive/partitions.json holds a summary of each
+partition (event count, time range, per-app and per-event-type counts, the
+sessions merged into it), and readers skip partitions outside a requested
+time range by their name alone.
+
+Older data can then be thinned out:
+
+    downsampling  partitions older than N days are rewritten with one row
+                  per app and minute for typing (a burst row with key-class
+                  counts), one per minute for mouse movement and scrolling,
+                  and no position samples; clicks are kept
+    retention     partitions older than N days are deleted
+
+Rollups and heatmaps are separate and are never deleted. Extra columns of
+a merged dataset's partitions (the host, see merge_datasets.py) are kept
+through compaction and downsampling.
+
+Every change is staged in temporary files and recorded in the manifest
+before anything is renamed or deleted, so a crash part-way through is
+finished by the next run instead of losing or duplicating events.
+
+Usage:
+    python compaction.py                                  # day partitions
+    python compaction.py --partition month --downsample-after-days 30 --retention-days 365
+"""
+
+import argparse
+import csv
+import glob
+import heapq
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from itertools import islice
+
+import session_query
+from bursts import BURST_EVENT_TYPE, decode_burst_key, encode_burst_key
+from event_buffer import FIELDS, iso_to_ns, ns_to_iso
+from journal import JOURNAL_FILENAME, read_journal
+from motion import move_key, parse_motion_key, scroll_key
+from rollups import MINUTE_NS, key_class
+from session_binary import BINARY_EXTENSION, BLOCK_EVENTS, BinarySessionReader, BinarySessionWriter
+from session_index import add_events_to_entry, new_entry
+
+
+MANIFEST_FILENAME = 'partitions.json'
+MANIFEST_VERSION = 1
+PARTITION_FORMATS = {'day': '%Y%m%d', 'month': '%Y%m'}
+DAY_NS = 24 * 60 * 60 * 1_000_000_000
+
+
+def partition_name(timestamp_ns, partition):
+    return datetime.fromtimestamp(timestamp_ns / 1e9).strftime(PARTITION_FORMATS[partition])
+
+
+def write_partition_file(path, events, fields=FIELDS, binary=False, sync=True):
+    """Write event tuples to a new CSV or binary file and sync it to disk
+
+    Events are (timestamp_ns, app, event_type, key, *extra) with one extra
+    value per column of fields past FIELDS (e.g. a merged dataset's host);
+    the binary format has no room for extra columns.
+    """
+    events = iter(events)
+    if binary:
+        writer = BinarySessionWriter(path, flush_policy='fsync' if sync else 'none')
+        try:
+            for chunk in iter(lambda: list(islice(events, BLOCK_EVENTS)), []):
+                writer.write_events([event[:4] for event in chunk], commit=False)
+        finally:
+            writer.close()
+        return
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        writer.writerows((ns_to_iso(event[0]),) + tuple(event[1:]) for event in events)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_partition_file(path):
+    """(fields, events) of a partition file; events is a lazy, time-ordered iterator"""
+    if path.endswith(BINARY_EXTENSION):
+        return FIELDS, _read_binary_rows(path)
+
+    f = open(path, 'r', newline='', encoding='utf-8')
+    reader = csv.reader(f)
+    fields = tuple(next(reader, FIELDS))
+    return fields, _read_csv_rows(f, reader)
+
+
+def _read_binary_rows(path):
+    with BinarySessionReader(path) as reader:
+        yield from reader.iter_columns()
+
+
+def _read_csv_rows(f, reader):
+    with f:
+        for row in reader:
+            yield (iso_to_ns(row[0]),) + tuple(row[1:])
+
+
+def _padded(events, pad):
+    for event in events:
+        yield event + pad
+
+
+def downsample_events(events):
+    """Replace raw typing, movement and scroll rows with per-minute summaries
+
+    Keystrokes and bursts become one burst row per app and minute with
+    key-class counts (no key contents); mouse_move and scroll rows are
+    summed per app and minute; mouse_pos samples are dropped. Other rows
+    are kept as they are.
+    """
+    typing = {}  # (minute, app, extra) -> [count, first, last, classes]
+    motion = {}  # (minute, app, event_type, extra) -> Counter of summed fields
+    kept = []
+
+    for event in events:
+        timestamp, app, event_type, key = event[:4]
+        extra = tuple(event[4:])  # e.g. a merged dataset's host
+        minute = timestamp - timestamp % MINUTE_NS
+        if event_type in ('keystroke', BURST_EVENT_TYPE):
+            entry = typing.setdefault((minute, app, extra), [0, timestamp, timestamp, Counter()])
+            if event_type == 'keystroke':
+                count, last, classes = 1, timestamp, {key_class('keystroke', key): 1}
+            else:
+                burst = decode_burst_key(key)
+                count, last = burst['n'], timestamp + burst['ms'] * 1_000_000
+                classes = burst.get('classes')
+                if classes is None and 'keys' in burst:
+                    classes = Counter()
+                    for raw_key, raw_count in burst['keys'].items():
+                        classes[key_class('keystroke', raw_key)] += raw_count
+                if classes is None:
+                    classes = {'other': count}
+            entry[0] += count
+            entry[1] = min(entry[1], timestamp)
+            entry[2] = max(entry[2], last)
+            entry[3].update(classes)
+        elif event_type in ('mouse_move', 'scroll'):
+            motion.setdefault((minute, app, event_type, extra), Counter()).update(parse_motion_key(key))
+        elif event_type != 'mouse_pos':
+            kept.append(event)
+
+    for (minute, app, extra), (count, first, last, classes) in typing.items():
+        kept.append((minute, app, BURST_EVENT_TYPE,
+                     encode_burst_key(count, last - first, classes=dict(classes))) + extra)
+    for (minute, app, event_type, extra), sums in motion.items():
+        if event_type == 'mouse_move':
+            key = move_key(sums['px'], sums['n'])
+        else:
+            key = scroll_key(sums['dx'], sums['dy'], sums['n'])
+        kept.append((minute, app, event_type, key) + extra)
+
+    kept.sort(key=lambda event: event[0])
+    return kept
+
+
+class Archive:
+    """The partition files and their manifest"""
+
+    def __init__(self, data_folder, partition='day', archive_format='csv'):
+        if partition not in PARTITION_FORMATS:
+            raise ValueError(f"Unknown partition size: {partition}")
+        if archive_format not in ('csv', 'binary'):
+            raise ValueError(f"Unknown archive format: {archive_format}")
+
+        self.data_folder = data_folder
+        self.folder = os.path.join(data_folder, session_query.ARCHIVE_FOLDER)
+        self.path = os.path.join(self.folder, MANIFEST_FILENAME)
+        self.partition = partition
+        self.extension = BINARY_EXTENSION if archive_format == 'binary' else '.csv'
+        self.partitions = {}  # file name -> summary
+        self.pending = None  # staged renames and deletions, see _commit
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported archive manifest version in {self.path}")
+        if data.get('partitions') and data['partition'] != self.partition:
+            raise ValueError(f"Archive is partitioned by {data['partition']}, not {self.partition}")
+        self.partitions = data['partitions']
+        self.pending = data.get('pending')
+
+    def save(self):
+        os.makedirs(self.folder, exist_ok=True)
+        data = {'version': MANIFEST_VERSION, 'partition': self.partition,
+                'partitions': self.partitions, 'pending': self.pending}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def session_ids(self):
+        """IDs of every session merged into the archive"""
+        return {session for summary in self.partitions.values() for session in summary['sessions']}
+
+    def _file_for(self, name):
+        """Existing file of a partition (whatever its format) or the path for a new one"""
+        for extension in ('.csv', BINARY_EXTENSION):
+            path = os.path.join(self.folder, f'part_{name}{extension}')
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.folder, f'part_{name}{self.extension}')
+
+    # ============ Staged changes ============
+
+    def finish_pending(self):
+        """Complete a compaction that was interrupted after it was recorded"""
+        if not self.pending:
+            return
+        for tmp_path, path in self.pending['rename']:
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, path)
+        for path in self.pending['delete']:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.pending = None
+        self.save()
+
+    def _commit(self, staged, delete):
+        """Record then apply staged partition files and deletions
+
+        staged maps a final path to (tmp path, summary or None to drop it).
+        """
+        for path, (_, summary) in staged.items():
+            name = os.path.basename(path)
+            if summary is None:
+                self.partitions.pop(name, None)
+            else:
+                self.partitions[name] = summary
+        self.pending = {'rename': [[tmp_path, path] for path, (tmp_path, summary) in staged.items()
+                                   if summary is not None],
+                        'delete': list(delete)}
+        self.save()
+        self.finish_pending()
+
+    def _stage(self, path, events, fields, summary):
+        """Write events to a temporary partition file, summarising them on the way"""
+        tmp_path = path + '.tmp'
+        entry = new_entry()
+        hosts = Counter()
+        host = fields.index('host') if 'host' in fields else None
+
+        def counted():
+            for chunk in iter(lambda: list(islice(events, BLOCK_EVENTS)), []):
+                add_events_to_entry(entry, [event[:4] for event in chunk])
+                if host is not None:
+                    hosts.update(event[host] for event in chunk)
+                yield from chunk
+
+        events = iter(events)
+        write_partition_file(tmp_path, counted(), fields, binary=path.endswith(BINARY_EXTENSION))
+        for field in ('mtime', 'size'):
+            entry.pop(field)
+        entry.update(summary)
+        if host is not None:
+            entry['hosts'] = dict(hosts)
+        return tmp_path, entry
+
+    # ============ Jobs ============
+
+    def add_sessions(self, session_paths, batch_sessions=50):
+        """Merge whole session files into their partitions and delete them
+
+        Sessions are read batch_sessions at a time, and each batch's events
+        are sorted into a temporary run file per partition. Each partition
+        is then rewritten once, merging its existing file with its runs as
+        streams, so memory holds one batch and the archive is read and
+        written once however many batches there are.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        # Left behind if an earlier run was killed
+        for run in glob.glob(os.path.join(self.folder, 'part_*.run*.tmp')):
+            os.remove(run)
+
+        runs = defaultdict(list)  # partition name -> run file paths
+        sessions = defaultdict(set)
+        added = 0
+        try:
+            for start in range(0, len(session_paths), batch_sessions):
+                grouped = defaultdict(list)
+                for path in session_paths[start:start + batch_sessions]:
+                    session_id = os.path.splitext(os.path.basename(path))[0][len('session_'):]
+                    for event in session_query.read_session_events(path):
+                        name = partition_name(event[0], self.partition)
+                        grouped[name].append(event)
+                        sessions[name].add(session_id)
+
+                for name, events in grouped.items():
+                    added += len(events)
+                    summary = self.partitions.get(os.path.basename(self._file_for(name)), {})
+                    if summary.get('downsampled'):
+                        events = downsample_events(events)
+                    else:
+                        events.sort(key=lambda event: event[0])
+                    run = os.path.join(self.folder, f'part_{name}.run{len(runs[name])}.tmp')
+                    write_partition_file(run, events, sync=False)
+                    runs[name].append(run)
+
+            staged = {}
+            for name, run_paths in runs.items():
+                path = self._file_for(name)
+                summary = self.partitions.get(os.path.basename(path), {})
+                fields, streams = FIELDS, []
+                if os.path.exists(path):
+                    fields, existing = read_partition_file(path)
+                    streams.append(existing)
+                # Sessions have no extra columns (e.g. host) - leave them empty
+                pad = ('',) * (len(fields) - len(FIELDS))
+                for run in run_paths:
+                    streams.append(_padded(read_partition_file(run)[1], pad))
+                merged = heapq.merge(*streams, key=lambda event: event[0])
+                staged[path] = self._stage(path, merged, fields, {
+                    'sessions': sorted(set(summary.get('sessions', [])) | sessions[name]),
+                    'downsampled': summary.get('downsampled', False)})
+
+            self._commit(staged, session_paths)
+        finally:
+            for run_paths in runs.values():
+                for run in run_paths:
+                    try:
+                        os.remove(run)
+                    except FileNotFoundError:
+                        pass
+        return added
+
+    def apply_retention(self, retention_days=None, downsample_after_days=None, now_ns=None):
+        """Delete or downsample partitions whose newest event is old enough"""
+        now_ns = now_ns if now_ns is not None else time.time_ns()
+        staged = {}
+        deleted = []
+        for name, summary in list(self.partitions.items()):
+            path = os.path.join(self.folder, name)
+            if summary['last'] is None:
+                continue
+            age_ns = now_ns - session_query.to_ns(summary['last'])
+
+            if retention_days is not None and age_ns >= retention_days * DAY_NS:
+                staged[path] = (None, None)
+                deleted.append(path)
+            elif (downsample_after_days is not None and not summary.get('downsampled') and
+                  age_ns >= downsample_after_days * DAY_NS):
+                fields, events = read_partition_file(path)
+                staged[path] = self._stage(path, downsample_events(events), fields,
+                                           {'sessions': summary['sessions'], 'downsampled': True})
+
+        if staged:
+            self._commit(staged, deleted)
+        return (len(deleted), len(staged) - len(deleted))
+
+
+def unreplayed_session(data_folder):
+    """Session the crash journal still holds unsaved rows for, or None"""
+    try:
+        session_id, rows, open_row = read_journal(os.path.join(data_folder, JOURNAL_FILENAME))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Could not read journal in {data_folder}: {e}")
+        return None
+    return session_id if rows or open_row else None
+
+
+def closed_sessions(data_folder, min_age=600, exclude=(), now=None):
+    """Session files not written to for min_age seconds, minus any in exclude
+
+    The session a running tracker has open (see session_query.live_session)
+    is never closed, however long it has been idle, and neither is one whose
+    rows are still waiting in the crash journal to be replayed.
+    """
+    now = now if now is not None else time.time()
+    exclude = {os.path.abspath(path) for path in exclude if path}
+    live = session_query.live_session(data_folder)
+    unreplayed = unreplayed_session(data_folder)
+    closed = []
+    for path in session_query.session_files(data_folder):
+        name = os.path.basename(path)
+        if os.path.abspath(path) in exclude or name == live:
+            continue
+        if unreplayed and os.path.splitext(name)[0] == f'session_{unreplayed}':
+            continue
+        if now - os.path.getmtime(path) < min_age:
+            continue
+        closed.append(path)
+    return closed
+
+
+def read_manifest(data_folder):
+    """Partition summaries of a data folder's archive ({} if there is none)"""
+    path = os.path.join(data_folder, session_query.ARCHIVE_FOLDER, MANIFEST_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('partitions', {})
+    except FileNotFoundError:
+        return {}
+
+
+def archived_session_count(data_folder):
+    """Number of sessions merged into the archive"""
+    partitions = read_manifest(data_folder)
+    return len({session for summary in partitions.values() for session in summary['sessions']})
+
+
+def compact(data_folder, partition='day', archive_format='csv', min_age=600, exclude=(),
+            retention_days=None, downsample_after_days=None, batch_sessions=50):
+    """Archive closed sessions, then apply downsampling and retention; returns a summary"""
+    archive = Archive(data_folder, partition, archive_format)
+    archive.finish_pending()
+
+    sessions = closed_sessions(data_folder, min_age, exclude)
+    events = archive.add_sessions(sessions, batch_sessions) if sessions else 0
+
+    deleted, downsampled = archive.apply_retention(retention_days, downsample_after_days)
+    return {'sessions': len(sessions), 'events': events, 'partitions': len(archive.partitions),
+            'deleted': deleted, 'downsampled': downsampled}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact session files into archive partitions")
+    parser.add_argument('--data-folder', default='activity_data')
+    parser.add_argument('--partition', choices=sorted(PARTITION_FORMATS), default='day')
+    parser.add_argument('--format', dest='archive_format', choices=['csv', 'binary'], default='csv')
+    parser.add_argument('--min-age', type=float, default=600,
+                        help="only compact sessions untouched for this many seconds")
+    parser.add_argument('--downsample-after-days', type=float,
+                        help="summarise typing and movement per minute in older partitions")
+    parser.add_argument('--retention-days', type=float, help="delete partitions older than this")
+    args = parser.parse_args(argv)
+
+    result = compact(args.data_folder, args.partition, args.archive_format, args.min_age,
+                     retention_days=args.retention_days,
+                     downsample_after_days=args.downsample_after_days)
+    print(f"Compacted {result['sessions']} sessions ({result['events']:,} events) into "
+          f"{result['partitions']} partitions; downsampled {result['downsampled']}, "
+          f"deleted {result['deleted']}")
+
+
+if __name__ == "__main__":
+    main()
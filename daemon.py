@@ -0,0 +1,271 @@
+"""
+Headless Daemon
+Runs ActivityTracker without a window, for servers and login-time agents
+
+No tkinter or PIL is imported. Tracking is started and stopped with
+signals or commands on a control socket:
+
+    SIGUSR1          start a new session
+    SIGUSR2          stop the current session
+    SIGTERM/SIGINT   stop and exit
+
+The control socket is activity_data/control.sock (on Windows, a TCP port
+on 127.0.0.1 written to activity_data/control.port). It takes one command
+per connection - start, stop, status or quit - and answers with one line
+of JSON.
+
+Usage:
+    python daemon.py                    # track until stopped
+    python daemon.py --paused           # wait for a start command
+    python daemon.py --send status      # talk to a running daemon
+"""
+
+import time
+
+# Measured before anything heavy is imported, so startup times include it
+LAUNCHED_NS = time.perf_counter_ns()
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver
+
+
+CONTROL_COMMANDS = ('start', 'stop', 'status', 'quit')
+
+
+def _since_launch_ms(ns):
+    return None if ns is None else round((ns - LAUNCHED_NS) / 1e6, 1)
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        command = self.rfile.readline(64).decode('utf-8', 'replace').strip()
+        reply = self.server.daemon.request(command)
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+
+class _UnixControlServer(socketserver.ThreadingMixIn, getattr(socketserver, 'UnixStreamServer', object)):
+    daemon_threads = True
+
+
+class _TCPControlServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+
+
+def control_address(data_folder):
+    """Where the control socket lives: a socket path, or a port file on Windows"""
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(data_folder, 'control.sock')
+    return os.path.join(data_folder, 'control.port')
+
+
+def send_command(data_folder, command, timeout=10.0):
+    """Send one command to a running daemon and return its decoded reply"""
+    address = control_address(data_folder)
+    if address.endswith('.sock'):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        target = address
+    else:
+        with open(address, 'r', encoding='utf-8') as f:
+            target = ('127.0.0.1', int(f.read().strip()))
+        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    with conn:
+        conn.settimeout(timeout)
+        conn.connect(target)
+        conn.sendall((command + '\n').encode('utf-8'))
+        with conn.makefile('r', encoding='utf-8') as reply:
+            return json.loads(reply.readline())
+
+
+class TrackerDaemon:
+    """Owns a headless ActivityTracker and serialises start/stop commands"""
+
+    def __init__(self, tracker, data_folder):
+        self.tracker = tracker
+        self.data_folder = data_folder
+        self.address = control_address(data_folder)
+        # SimpleQueue.put is safe to call from a signal handler
+        self._commands = queue.SimpleQueue()
+        self._server = None
+        self.ready_ns = None
+        self.launch_first_event_ns = None
+
+    # ============ Control ============
+
+    def request(self, command):
+        """Run a command on the daemon's main thread and wait for the result"""
+        if command not in CONTROL_COMMANDS:
+            return {'error': f"unknown command {command!r}", 'commands': list(CONTROL_COMMANDS)}
+        reply = queue.SimpleQueue()
+        self._commands.put((command, reply))
+        return reply.get()
+
+    def _on_signal(self, signum, frame):
+        command = {getattr(signal, 'SIGUSR1', None): 'start',
+                   getattr(signal, 'SIGUSR2', None): 'stop'}.get(signum, 'quit')
+        self._commands.put((command, None))
+
+    def install_signal_handlers(self):
+        for name in ('SIGUSR1', 'SIGUSR2', 'SIGTERM', 'SIGINT'):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), self._on_signal)
+
+    def open_control_socket(self):
+        """Listen for commands, refusing to start if another daemon owns the socket"""
+        if self.address.endswith('.sock'):
+            if os.path.exists(self.address):
+                try:
+                    send_command(self.data_folder, 'status', timeout=1.0)
+                except OSError:
+                    os.remove(self.address)  # left behind by a crashed daemon
+                else:
+                    raise RuntimeError(f"A daemon is already listening on {self.address}")
+            previous_umask = os.umask(0o177)  # owner-only socket
+            try:
+                self._server = _UnixControlServer(self.address, _ControlHandler)
+            finally:
+                os.umask(previous_umask)
+        else:
+            self._server = _TCPControlServer(('127.0.0.1', 0), _ControlHandler)
+            with open(self.address, 'w', encoding='utf-8') as f:
+                f.write(str(self._server.server_address[1]))
+
+        self._server.daemon = self
+        threading.Thread(target=self._server.serve_forever, name="ControlSocket", daemon=True).start()
+
+    def close_control_socket(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        try:
+            os.remove(self.address)
+        except OSError:
+            pass
+
+    # ============ Commands ============
+
+    def status(self):
+        tracker = self.tracker
+        if self.launch_first_event_ns is None and tracker.first_event_ns is not None:
+            self.launch_first_event_ns = tracker.first_event_ns
+        return {'tracking': tracker.tracking,
+                'session_id': tracker.session_id,
+                'events': tracker.event_count,
+                'dropped': tracker.event_pipeline.dropped,
+                'ready_ms': _since_launch_ms(self.ready_ns),
+                'launch_to_first_event_ms': _since_launch_ms(self.launch_first_event_ns),
+                'session_first_event_ms': tracker.first_event_ms}
+
+    def handle(self, command):
+        tracker = self.tracker
+        if command == 'start' and not tracker.tracking:
+            tracker.start_tracking()
+        elif command in ('stop', 'quit') and tracker.tracking:
+            self.status()  # keep the launch timing before the session resets
+            tracker.stop_tracking()
+        return self.status()
+
+    def run(self, start=True):
+        """Serve commands on the calling (main) thread until quit"""
+        self.install_signal_handlers()
+        self.open_control_socket()
+        try:
+            if start:
+                self.tracker.start_tracking()
+            self.ready_ns = time.perf_counter_ns()
+            print(f"Daemon ready in {_since_launch_ms(self.ready_ns):.1f} ms "
+                  f"(control: {self.address}, pid {os.getpid()})")
+
+            while True:
+                command, reply = self._commands.get()
+                try:
+                    result = self.handle(command)
+                except Exception as e:
+                    print(f"Error handling {command}: {e}")
+                    result = {'error': str(e)}
+                if reply is not None:
+                    reply.put(result)
+                if command == 'quit':
+                    break
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        tracker = self.tracker
+        if tracker.tracking:
+            tracker.stop_tracking()
+        status = self.status()
+        self.close_control_socket()
+        if tracker.query_server is not None:
+            tracker.query_server.stop()
+        tracker.stop_listeners()
+        tracker.event_pipeline.stop()
+        tracker.storage.close()
+        if status['launch_to_first_event_ms'] is not None:
+            print(f"First event was recorded {status['launch_to_first_event_ms']:.1f} ms after launch")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the activity tracker without a window")
+    parser.add_argument('--data-folder', default='activity_data')
+    parser.add_argument('--storage-format', default='csv', choices=['csv', 'binary', 'sqlite'])
+    parser.add_argument('--flush-policy', default='flush', choices=['none', 'flush', 'fsync'])
+    parser.add_argument('--autosave-interval', type=float, default=60)
+    parser.add_argument('--global', dest='global_mode', action='store_true',
+                        help="record every event under 'Global' instead of per app")
+    parser.add_argument('--record-mode', default='raw', choices=['raw', 'burst'],
+                        help="'burst' stores one row per typing burst instead of per key")
+    parser.add_argument('--burst-histogram', default='class', choices=['class', 'key', 'none'],
+                        help="key-class (default) or raw key histogram in burst rows, or none")
+    parser.add_argument('--motion', action='store_true',
+                        help="also record mouse movement and scrolling")
+    parser.add_argument('--metrics', action='store_true',
+                        help="dump metrics to <data-folder>/metrics.json")
+    parser.add_argument('--query-port', type=int,
+                        help="serve counts on http://127.0.0.1:PORT/ (0 picks a free port)")
+    parser.add_argument('--verbosity', type=int, choices=[0, 1, 2], default=1,
+                        help="0 quiet, 1 periodic summaries (default), 2 a line per event")
+    parser.add_argument('--paused', action='store_true', help="wait for a start command")
+    parser.add_argument('--send', choices=CONTROL_COMMANDS,
+                        help="send a command to a running daemon and print its reply")
+    args = parser.parse_args(argv)
+
+    if args.send:
+        try:
+            print(json.dumps(send_command(args.data_folder, args.send), indent=2))
+        except (OSError, ValueError) as e:
+            print(f"Could not reach the daemon: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    # Nothing runs a main run loop here, so macOS focus notifications would
+    # never arrive; poll with the short TTL instead
+    tracker = ActivityTracker(autosave_interval=args.autosave_interval,
+                              flush_policy=args.flush_policy,
+                              app_resolver=AppResolver(notifications=False),
+                              storage_format=args.storage_format,
+                              data_folder=args.data_folder,
+                              metrics_enabled=args.metrics,
+                              track_motion=args.motion,
+                              record_mode=args.record_mode,
+                              burst_histogram=None if args.burst_histogram == 'none' else args.burst_histogram,
+                              query_port=args.query_port,
+                              verbosity=args.verbosity)
+    tracker.global_mode = args.global_mode
+    TrackerDaemon(tracker, args.data_folder).run(start=not args.paused)
+
+
+if __name__ == "__main__":
+    main()
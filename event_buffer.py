@@ -0,0 +1,198 @@
+"""
+Event Buffer
+Compact columnar storage for the events of the current session
+
+Timestamps are int64 epoch-nanoseconds in an array('q'); app names, event
+types and keys are small-integer codes into interned string tables. That
+is about 18 bytes per event instead of a few hundred for a dict of strings.
+Once max_memory_events are held in memory, the columns are spilled to a
+chunk file on disk and the in-memory arrays start over.
+"""
+
+import os
+import tempfile
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+
+FIELDS = ('timestamp', 'app', 'event_type', 'key')
+
+# Array typecodes for the four columns
+TIMESTAMP_TYPE = 'q'
+APP_TYPE = 'I'
+EVENT_TYPE_TYPE = 'H'
+KEY_TYPE = 'I'
+
+
+_iso_cache = [None, None]  # [epoch second, naive local datetime]
+
+
+def ns_to_iso(ns):
+    """Convert epoch nanoseconds to a local ISO-8601 string like datetime.isoformat()"""
+    seconds, remainder = divmod(ns, 1_000_000_000)
+    cached_second, base = _iso_cache
+    if cached_second != seconds:
+        base = datetime.fromtimestamp(seconds)
+        _iso_cache[:] = [seconds, base]
+    return (base + timedelta(microseconds=remainder // 1000)).isoformat()
+
+
+def iso_to_ns(text):
+    """Convert an ISO-8601 string (naive = local time) to epoch nanoseconds"""
+    dt = datetime.fromisoformat(text)
+    seconds = int(dt.replace(microsecond=0).timestamp())
+    return seconds * 1_000_000_000 + dt.microsecond * 1000
+
+
+class StringTable:
+    """Interns strings as small integer codes"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class EventBuffer:
+    """Append-only columnar event list with optional spilling to disk"""
+
+    def __init__(self, max_memory_events=None, spill_dir=None):
+        self.max_memory_events = max_memory_events
+        self.spill_dir = spill_dir
+
+        self.apps = StringTable()
+        self.event_types = StringTable()
+        self.keys = StringTable()
+
+        self._lock = threading.Lock()
+        self._chunks = []  # (path, count) of spilled chunks, oldest first
+        self._spilled = 0
+        self._new_columns()
+
+    def _new_columns(self):
+        self._timestamps = array(TIMESTAMP_TYPE)
+        self._app_codes = array(APP_TYPE)
+        self._event_type_codes = array(EVENT_TYPE_TYPE)
+        self._key_codes = array(KEY_TYPE)
+
+    def __len__(self):
+        return self._spilled + len(self._timestamps)
+
+    def __iter__(self):
+        return self.events_from(0)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return [event for _, event in zip(range(stop - start), self.events_from(start))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        return next(self.events_from(index))
+
+    @property
+    def spilled_chunks(self):
+        return len(self._chunks)
+
+    @property
+    def memory_bytes(self):
+        """Approximate bytes held by the in-memory columns"""
+        return sum(column.itemsize * len(column) for column in
+                   (self._timestamps, self._app_codes, self._event_type_codes, self._key_codes))
+
+    def append_event(self, timestamp_ns, app, event_type, key):
+        """Append one event given as epoch nanoseconds and strings"""
+        with self._lock:
+            self._timestamps.append(timestamp_ns)
+            self._app_codes.append(self.apps.code(app))
+            self._event_type_codes.append(self.event_types.code(event_type))
+            self._key_codes.append(self.keys.code(key))
+
+            if self.max_memory_events and len(self._timestamps) >= self.max_memory_events:
+                self._spill()
+
+    def append(self, event):
+        """Append an event dict with the CSV fields"""
+        self.append_event(iso_to_ns(event['timestamp']), event['app'],
+                          event['event_type'], event['key'])
+
+    def iter_columns(self, start=0):
+        """Yield (timestamp_ns, app, event_type, key) tuples from index start"""
+        apps = self.apps.values
+        event_types = self.event_types.values
+        keys = self.keys.values
+
+        with self._lock:
+            chunks = list(self._chunks)
+            # Spilling swaps in new arrays, so these stay valid to read
+            memory = (self._timestamps, self._app_codes, self._event_type_codes, self._key_codes)
+            memory_count = len(self._timestamps)
+
+        offset = 0
+        for path, count in chunks + [(None, memory_count)]:
+            if start < offset + count:
+                columns = memory if path is None else self._read_chunk(path, count)
+                timestamps, app_codes, event_type_codes, key_codes = columns
+                for i in range(max(start - offset, 0), count):
+                    yield (timestamps[i], apps[app_codes[i]],
+                           event_types[event_type_codes[i]], keys[key_codes[i]])
+            offset += count
+
+    def events_from(self, start=0):
+        """Yield event dicts (ISO timestamps) from index start"""
+        for timestamp, app, event_type, key in self.iter_columns(start):
+            yield {'timestamp': ns_to_iso(timestamp), 'app': app,
+                   'event_type': event_type, 'key': key}
+
+    def clear(self):
+        """Drop all events and delete any spilled chunks"""
+        with self._lock:
+            for path, _ in self._chunks:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._chunks = []
+            self._spilled = 0
+            self._new_columns()
+
+    def _spill(self):
+        """Move the in-memory columns to a chunk file (caller holds the lock)"""
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='activity_spill_')
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+        fd, path = tempfile.mkstemp(prefix='chunk_', suffix='.bin', dir=self.spill_dir)
+        with os.fdopen(fd, 'wb') as f:
+            for column in (self._timestamps, self._app_codes, self._event_type_codes, self._key_codes):
+                column.tofile(f)
+
+        count = len(self._timestamps)
+        self._chunks.append((path, count))
+        self._spilled += count
+        self._new_columns()
+
+    def _read_chunk(self, path, count):
+        """Load a spilled chunk back as columns of codes"""
+        columns = []
+        with open(path, 'rb') as f:
+            for typecode in (TIMESTAMP_TYPE, APP_TYPE, EVENT_TYPE_TYPE, KEY_TYPE):
+                column = array(typecode)
+                column.fromfile(f, count)
+                columns.append(column)
+        return columns
@@ -0,0 +1,225 @@
+"""
+Heatmaps
+Click positions accumulated into per-app, per-day grids
+
+Each click bumps one cell of a fixed-resolution grid (cell_size screen
+pixels square) for its app and local day. Grids are sparse - only cells
+that were clicked are stored - and are merged into one JSON file per day
+under activity_data/heatmaps/ whenever the session is saved. A heatmap over
+weeks of data is then the sum of a few small grids rather than a replay of
+every click.
+
+Export a PNG (needs Pillow) with:
+    python heatmap.py --app Chrome --start 2025-10-01 --end 2025-11-01 -o chrome.png
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import session_query
+
+
+HEATMAP_VERSION = 1
+DEFAULT_CELL_SIZE = 16  # screen pixels per grid cell
+
+
+def _day_of(timestamp_ns):
+    return datetime.fromtimestamp(timestamp_ns / 1e9).strftime('%Y%m%d')
+
+
+class HeatmapStore:
+    """In-memory click grids with per-day JSON persistence"""
+
+    def __init__(self, data_folder, cell_size=DEFAULT_CELL_SIZE):
+        self.folder = os.path.join(data_folder, 'heatmaps')
+        self.cell_size = cell_size
+        self._pending = defaultdict(lambda: defaultdict(Counter))  # day -> app -> (col, row) -> count
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # serialises read-modify-write of day files
+
+    def _day_path(self, day):
+        return os.path.join(self.folder, f'heatmap_{day}.json')
+
+    def add(self, timestamp_ns, app, x, y, count=1):
+        """Count a click at screen position (x, y)"""
+        cell = (int(x) // self.cell_size, int(y) // self.cell_size)
+        day = _day_of(timestamp_ns)
+        with self._lock:
+            self._pending[day][app][cell] += count
+
+    def flush(self):
+        """Merge pending clicks into the per-day files"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(lambda: defaultdict(Counter))
+            if not pending:
+                return
+
+            os.makedirs(self.folder, exist_ok=True)
+            for day, apps in pending.items():
+                try:
+                    stored = self._load_day(day)
+                    for app, grid in apps.items():
+                        stored.setdefault(app, Counter()).update(grid)
+                    self._write_day(day, stored)
+                except Exception as e:
+                    print(f"Error saving heatmap for {day}: {e}")
+                    # Put the clicks back so the next flush retries them
+                    with self._lock:
+                        for app, grid in apps.items():
+                            self._pending[day][app].update(grid)
+
+    def _load_day(self, day):
+        """Return {app: Counter((col, row))} for a day, in this store's cell size"""
+        try:
+            with open(self._day_path(day), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if data.get('version') != HEATMAP_VERSION:
+            return {}
+
+        # Files written with another cell size are re-binned on load
+        stored_size = data.get('cell_size', self.cell_size)
+        apps = {}
+        for app, flat in data['apps'].items():
+            grid = Counter()
+            for i in range(0, len(flat), 3):
+                col, row, count = flat[i:i + 3]
+                if stored_size != self.cell_size:
+                    col = col * stored_size // self.cell_size
+                    row = row * stored_size // self.cell_size
+                grid[(col, row)] += count
+            apps[app] = grid
+        return apps
+
+    def _write_day(self, day, apps):
+        # Each app's grid is a flat [col, row, count, ...] list
+        data = {'version': HEATMAP_VERSION, 'cell_size': self.cell_size,
+                'apps': {app: [value for (col, row), count in sorted(grid.items())
+                               for value in (col, row, count)]
+                         for app, grid in sorted(apps.items())}}
+        path = self._day_path(day)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def days(self):
+        """Days with saved or pending clicks, as YYYYMMDD strings"""
+        days = {os.path.basename(path)[len('heatmap_'):-len('.json')]
+                for path in glob.glob(os.path.join(self.folder, 'heatmap_*.json'))}
+        with self._lock:
+            days.update(self._pending)
+        return sorted(days)
+
+    # ============ Queries ============
+
+    def iter_grids(self, start=None, end=None):
+        """Yield (day, app, grid) for whole days overlapping [start, end), saved and pending"""
+        start_ns = session_query.to_ns(start)
+        end_ns = session_query.to_ns(end)
+        first_day = _day_of(start_ns) if start_ns is not None else None
+        last_day = _day_of(end_ns - 1) if end_ns is not None else None
+
+        # Hold the flush lock so pending clicks can't move into a day file
+        # between reading one and the other
+        with self._flush_lock:
+            with self._lock:
+                pending = {day: {app: Counter(grid) for app, grid in day_apps.items()}
+                           for day, day_apps in self._pending.items()}
+            days = [day for day in self.days()
+                    if (first_day is None or day >= first_day) and
+                    (last_day is None or day <= last_day)]
+            loaded = {day: self._load_day(day) for day in days}
+
+        for day in days:
+            stored = loaded[day]
+            for app, grid in pending.get(day, {}).items():
+                stored.setdefault(app, Counter()).update(grid)
+            for app, grid in stored.items():
+                yield day, app, grid
+
+    def grid(self, start=None, end=None, apps=None):
+        """Summed click grid over whole days overlapping [start, end), optionally for some apps"""
+        apps = set(apps) if apps else None
+        total = Counter()
+        for _, app, grid in self.iter_grids(start, end):
+            if apps is None or app in apps:
+                total.update(grid)
+        return total
+
+    def app_totals(self, start=None, end=None):
+        """Click counts per app over whole days overlapping [start, end)"""
+        totals = Counter()
+        for _, app, grid in self.iter_grids(start, end):
+            totals[app] += sum(grid.values())
+        return totals
+
+    def export_png(self, path, start=None, end=None, apps=None, scale=4):
+        """Render the summed grid to a PNG (needs Pillow); returns the click count"""
+        return render_png(self.grid(start, end, apps), path, scale)
+
+
+def _heat_colour(level):
+    """Black -> red -> yellow -> white for level in [0, 1]"""
+    level = max(0.0, min(level, 1.0)) * 3
+    red = min(level, 1.0)
+    green = min(max(level - 1, 0.0), 1.0)
+    blue = min(max(level - 2, 0.0), 1.0)
+    return (int(red * 255), int(green * 255), int(blue * 255))
+
+
+def render_png(grid, path, scale=4):
+    """Write a click grid as a PNG, one scale x scale block per cell (log colour scale)"""
+    from PIL import Image
+
+    if not grid:
+        raise ValueError("No clicks to render")
+    cols = [col for col, _ in grid]
+    rows = [row for _, row in grid]
+    left, top = min(cols), min(rows)
+    width, height = max(cols) - left + 1, max(rows) - top + 1
+
+    peak = math.log1p(max(grid.values()))
+    pixels = [(0, 0, 0)] * (width * height)
+    for (col, row), count in grid.items():
+        pixels[(row - top) * width + (col - left)] = _heat_colour(math.log1p(count) / peak)
+
+    image = Image.new('RGB', (width, height))
+    image.putdata(pixels)
+    if scale > 1:
+        image = image.resize((width * scale, height * scale), Image.Resampling.NEAREST)
+    image.save(path)
+    return sum(grid.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export click heatmaps as PNG")
+    parser.add_argument('--data-folder', default='activity_data')
+    parser.add_argument('--app', action='append', help="only this app (repeatable)")
+    parser.add_argument('--start', help="ISO start date (inclusive)")
+    parser.add_argument('--end', help="ISO end date (exclusive)")
+    parser.add_argument('--scale', type=int, default=4, help="output pixels per grid cell")
+    parser.add_argument('--list', action='store_true', help="print clicks per app instead")
+    parser.add_argument('-o', '--output', default='heatmap.png')
+    args = parser.parse_args(argv)
+
+    store = HeatmapStore(args.data_folder)
+    if args.list:
+        for app, count in store.app_totals(args.start, args.end).most_common():
+            print(f"{count:>10,}  {app}")
+        return
+
+    clicks = store.export_png(args.output, args.start, args.end, args.app, args.scale)
+    print(f"Wrote {args.output} ({clicks:,} clicks)")
+
+
+if __name__ == "__main__":
+    main()
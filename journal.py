@@ -0,0 +1,221 @@
+"""
+Event Journal
+Memory-mapped ring of recent events, replayed after a crash
+
+Every row the tracker stores is also written into activity_data/journal.bin,
+a fixed-size file mapped into memory. Writing a row is a couple of memory
+copies - no system call - and because the mapping is shared, the kernel
+keeps the data even if the process is killed. The header records the
+session the rows belong to and the sequence number of the last row that
+save_session wrote to storage; on the next start, rows past that point are
+replayed into the session store. Rows are numbered within their session,
+so a crash between saving rows and marking them saved doesn't replay them
+twice: the tracker skips the rows the session's storage already holds.
+
+In burst mode the burst still being typed has no row yet. The tracker
+checkpoints it after every batch of events into one of two alternating
+areas after the header, so a torn checkpoint leaves the previous one
+readable, and a replay stores the last checkpoint as the burst's row.
+
+Layout:
+    header   64 bytes: magic, version, slot size, slot count, flushed
+             sequence number, sequence number before the session's first
+             row, session ID
+    checkpoints  two areas of CHECKPOINT_SIZE bytes, each holding one
+             record whose sequence number is a checkpoint generation
+    slots    fixed-width; a record takes one slot (rarely more, for long
+             burst keys) and starts with its sequence number, timestamp,
+             CRC-32 and string lengths, followed by app, event type and
+             key as UTF-8
+
+Records are written payload first, header last, and carry a CRC over both,
+so a record torn by a crash is simply skipped on replay.
+"""
+
+import mmap
+import struct
+import threading
+import zlib
+
+
+JOURNAL_FILENAME = 'journal.bin'
+MAGIC = b'ATJR'
+VERSION = 2
+DEFAULT_SLOT_SIZE = 64
+
+# magic, version, slot size, slot count, flushed sequence number, base
+# sequence number, session ID
+HEADER = struct.Struct('<4sHHIQQ32s')
+HEADER_SIZE = 64
+FLUSHED_OFFSET = struct.calcsize('<4sHHI')
+CHECKPOINT_SIZE = 2048
+SLOTS_OFFSET = HEADER_SIZE + 2 * CHECKPOINT_SIZE
+
+# sequence number, timestamp, CRC-32, app / event type / key byte lengths
+RECORD = struct.Struct('<QqIBBH')
+# the part of a record header the CRC covers, besides the payload
+RECORD_CHECKED = struct.Struct('<QqBBH')
+
+
+def _record_crc(seq, timestamp, app_len, type_len, key_len, payload):
+    return zlib.crc32(payload, zlib.crc32(RECORD_CHECKED.pack(seq, timestamp, app_len, type_len, key_len)))
+
+
+def _encode_row(app, event_type, key):
+    """(payload, app / event type / key byte lengths) for a record"""
+    app_bytes = app.encode('utf-8')[:255]
+    type_bytes = event_type.encode('utf-8')[:255]
+    key_bytes = key.encode('utf-8')[:65535]
+    return app_bytes + type_bytes + key_bytes, (len(app_bytes), len(type_bytes), len(key_bytes))
+
+
+def _write_record(buffer, offset, seq, timestamp, payload, lengths):
+    """Write a record payload first, header last"""
+    crc = _record_crc(seq, timestamp, *lengths, payload)
+    buffer[offset + RECORD.size:offset + RECORD.size + len(payload)] = payload
+    RECORD.pack_into(buffer, offset, seq, timestamp, crc, *lengths)
+
+
+def _read_record(data, offset):
+    """(seq, row, length) for an intact record at offset, or None"""
+    if offset + RECORD.size > len(data):
+        return None
+    seq, timestamp, crc, app_len, type_len, key_len = RECORD.unpack_from(data, offset)
+    length = RECORD.size + app_len + type_len + key_len
+    payload = data[offset + RECORD.size:offset + length]
+    if (not seq or len(payload) != app_len + type_len + key_len or
+            _record_crc(seq, timestamp, app_len, type_len, key_len, payload) != crc):
+        return None
+    app = payload[:app_len].decode('utf-8', 'replace')
+    event_type = payload[app_len:app_len + type_len].decode('utf-8', 'replace')
+    key = payload[app_len + type_len:].decode('utf-8', 'replace')
+    return seq, (timestamp, app, event_type, key), length
+
+
+class EventJournal:
+    """Fixed-size ring journal of stored event rows"""
+
+    def __init__(self, path, size=1 << 20, slot_size=DEFAULT_SLOT_SIZE):
+        self.path = path
+        self.slot_size = slot_size
+        self.slots = max((size - SLOTS_OFFSET) // slot_size, 16)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._flushed = 0
+        self._base = 0  # sequence number before the current session's first row
+        self._pos = 0
+        self._checkpoints = 0  # generation of the last checkpoint written
+
+        # Start from an empty (sparse, zero-filled) file
+        total = SLOTS_OFFSET + self.slots * slot_size
+        with open(path, 'wb') as f:
+            f.truncate(total)
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), total)
+        self._write_header(b'')
+
+    def _write_header(self, session_id):
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.slot_size, self.slots,
+                         self._flushed, self._base, session_id)
+
+    @property
+    def unsaved(self):
+        """Rows written since the last mark_saved"""
+        return self._seq - self._flushed
+
+    @property
+    def should_save(self):
+        """True once a quarter of the ring holds unsaved rows"""
+        return self._seq - self._flushed >= self.slots // 4
+
+    def begin(self, session_id):
+        """Start journaling a new session (everything earlier counts as saved)"""
+        with self._lock:
+            self._base = self._flushed = self._seq
+            self._write_header(session_id.encode('ascii')[:32])
+        self.checkpoint(None)
+
+    def append(self, timestamp, app, event_type, key):
+        """Write one stored row into the ring"""
+        payload, lengths = _encode_row(app, event_type, key)
+        needed = -(-(RECORD.size + len(payload)) // self.slot_size)
+        if needed > self.slots:
+            return
+
+        with self._lock:
+            pos = self._pos
+            if pos + needed > self.slots:
+                pos = 0
+            seq = self._seq + 1
+            _write_record(self._map, SLOTS_OFFSET + pos * self.slot_size, seq, timestamp, payload, lengths)
+            self._seq = seq
+            self._pos = pos + needed
+
+    def checkpoint(self, row):
+        """Record the row still being built (an open burst), or None once there is none
+
+        Each checkpoint replaces the last. A row too long for a checkpoint
+        area leaves the previous checkpoint in place.
+        """
+        timestamp, app, event_type, key = row if row is not None else (0, '', '', '')
+        payload, lengths = _encode_row(app, event_type, key)
+        if RECORD.size + len(payload) > CHECKPOINT_SIZE:
+            return
+
+        with self._lock:
+            self._checkpoints += 1
+            offset = HEADER_SIZE + (self._checkpoints % 2) * CHECKPOINT_SIZE
+            _write_record(self._map, offset, self._checkpoints, timestamp, payload, lengths)
+
+    def mark_saved(self, count):
+        """Record that the session's first `count` rows are in storage"""
+        with self._lock:
+            self._flushed = self._base + count
+            struct.pack_into('<Q', self._map, FLUSHED_OFFSET, self._flushed)
+
+    def sync(self):
+        """Force the journal to disk (only needed to survive an OS crash)"""
+        self._map.flush()
+
+    def close(self):
+        if self._map is None:
+            return
+        self._map.close()
+        self._file.close()
+        self._map = None
+
+
+def read_journal(path):
+    """Return (session_id, rows, open_row) for what a journal holds past its saved point
+
+    rows are (number, (timestamp_ns, app, event_type, key)) pairs in the
+    order they were written, numbered from 1 within the session; open_row
+    is the last checkpointed row, or None. Raises FileNotFoundError if there
+    is no journal.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        return None, [], None
+    magic, version, slot_size, slots, flushed, base, session_id = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or not slot_size:
+        raise ValueError(f"{path} is not an event journal")
+
+    records = []
+    pos = 0
+    while pos < slots:
+        record = _read_record(data, SLOTS_OFFSET + pos * slot_size)
+        if record is None:
+            pos += 1
+            continue
+        seq, row, length = record
+        pos += -(-length // slot_size)
+        if seq > flushed:
+            records.append((seq - base, row))
+    records.sort()
+
+    # The newest intact checkpoint wins; an empty one means nothing was open
+    checkpoints = [_read_record(data, HEADER_SIZE + area * CHECKPOINT_SIZE) for area in (0, 1)]
+    checkpoints = sorted(record for record in checkpoints if record is not None)
+    open_row = checkpoints[-1][1] if checkpoints and checkpoints[-1][1][1] else None
+    return session_id.rstrip(b'\0').decode('ascii', 'replace') or None, records, open_row
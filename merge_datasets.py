@@ -0,0 +1,360 @@
+"""
+Merge Datasets
+Combines activity_data folders from many machines into one dataset
+
+Each source folder is tagged with a host ID (HOST=PATH on the command line,
+or the folder name), and its session and archive partition files are read
+on a pool of threads. Files copied into more than one source - the same
+session ID with the same content hash - are merged only once. Every
+source is streamed in time order and the sources are combined with a
+k-way merge, so memory holds about one session file and a few chunks per
+source rather than the whole fleet.
+
+The result is a data folder of time-ordered archive partitions (see
+compaction.py) with an extra host column, a partitions.json manifest
+listing the hosts and sessions in each partition, and a session index, so
+session_query, storage and rollups.py rebuild read it like any other
+data folder:
+
+    python merge_datasets.py -o merged laptop=/backups/laptop/activity_data \\
+        desk=/backups/desk/activity_data /backups/studio/activity_data
+"""
+
+import argparse
+import csv
+import hashlib
+import heapq
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import session_query
+from compaction import PARTITION_FORMATS, Archive, partition_name, read_manifest
+from event_buffer import FIELDS, iso_to_ns, ns_to_iso
+from session_binary import BINARY_EXTENSION, BinarySessionReader
+from session_index import SessionIndex, add_events_to_entry, new_entry
+
+
+MERGED_FIELDS = FIELDS + ('host',)
+CHUNK_EVENTS = 4096
+QUEUE_CHUNKS = 4  # chunks buffered per source ahead of the merge
+_DONE = object()
+
+
+class Run:
+    """One source file: a session or an archive partition"""
+
+    def __init__(self, host, path):
+        self.host = host
+        self.path = path
+        stem = os.path.splitext(os.path.basename(path))[0]
+        self.is_partition = stem.startswith('part_')
+        self.session_id = stem[len('part_' if self.is_partition else 'session_'):]
+        self.sessions = [f"{host}/{self.session_id}"]
+        self.digest = None
+
+        # Lower bound on the run's timestamps, so it is only opened once the
+        # merge reaches it
+        if self.is_partition:
+            self.start_ns = session_query.partition_range_ns(path)[0]
+        else:
+            self.start_ns = session_query.session_start_ns(path)
+            if self.start_ns is not None:
+                self.start_ns -= session_query.SESSION_START_SLACK_NS
+
+    def hash_content(self):
+        digest = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.digest = digest.hexdigest()
+        return self
+
+    def load_sessions(self, manifest):
+        """Name the sessions an archive partition holds, from its source manifest"""
+        summary = manifest.get(os.path.basename(self.path))
+        if summary and summary.get('sessions'):
+            # Sessions of a source that is itself merged are already host-qualified
+            self.sessions = [session if '/' in session else f"{self.host}/{session}"
+                             for session in summary['sessions']]
+
+    @property
+    def dedupe_key(self):
+        return (self.is_partition, self.session_id, self.digest)
+
+    def _rows(self):
+        if self.path.endswith(BINARY_EXTENSION):
+            with BinarySessionReader(self.path) as reader:
+                for timestamp, app, event_type, key in reader.iter_columns():
+                    yield timestamp, app, event_type, key, self.host, self
+        else:
+            # A source that is itself a merged dataset keeps its host column
+            with open(self.path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    yield (iso_to_ns(row['timestamp']), row['app'], row['event_type'], row['key'],
+                           row.get('host') or self.host, self)
+
+    def iter_events(self):
+        """Events as (timestamp_ns, app, event_type, key, host, run), in time order
+
+        Archive partitions are stored in time order and are streamed. A
+        session stores rows in arrival order (bursts carry their start
+        time), so it is read whole and sorted.
+        """
+        if self.is_partition:
+            return self._rows()
+        return iter(sorted(self._rows(), key=lambda event: event[0]))
+
+
+def parse_source(spec):
+    """(host, path) from 'HOST=PATH' or a bare path named after its folder"""
+    host, sep, path = spec.partition('=')
+    if not sep or os.path.exists(spec):
+        path = spec
+        folder = os.path.abspath(path)
+        host = os.path.basename(folder)
+        if host == 'activity_data':
+            host = os.path.basename(os.path.dirname(folder))
+    return host, path
+
+
+def plan_runs(sources, workers=4):
+    """Hash every source file in parallel; return (runs per host, duplicates skipped)"""
+    runs = []
+    for host, folder in sources:
+        manifest = read_manifest(folder)
+        for path in session_query.archive_files(folder) + session_query.session_files(folder):
+            run = Run(host, path)
+            if run.is_partition:
+                run.load_sessions(manifest)
+            runs.append(run)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        runs = list(pool.map(Run.hash_content, runs))
+
+    seen = set()
+    by_host = {host: [] for host, _ in sources}
+    duplicates = []
+    for run in runs:
+        if run.dedupe_key in seen:
+            duplicates.append(run)
+            continue
+        seen.add(run.dedupe_key)
+        by_host[run.host].append(run)
+    return by_host, duplicates
+
+
+def _next_event(run, events):
+    """The next event of a run's stream, or None at its end (or on a read error)"""
+    try:
+        return next(events, None)
+    except Exception as e:
+        print(f"Warning: Could not read {run.path}: {e}")
+        return None
+
+
+def iter_source(runs):
+    """Yield one source's events in time order, opening files only as the merge reaches them"""
+    pending = sorted(runs, key=lambda run: (run.start_ns is not None, run.start_ns or 0))
+    heap = []  # (timestamp, run number, event, events iterator)
+    opened = 0
+
+    while True:
+        while opened < len(pending) and (
+                not heap or pending[opened].start_ns is None or
+                pending[opened].start_ns <= heap[0][0]):
+            run = pending[opened]
+            try:
+                events = run.iter_events()
+            except Exception as e:
+                print(f"Warning: Could not read {run.path}: {e}")
+                events = iter(())
+            event = _next_event(run, events)
+            if event is not None:
+                heapq.heappush(heap, (event[0], opened, event, events))
+            opened += 1
+        if not heap:
+            return
+
+        _, number, event, events = heap[0]
+        yield event
+        event = _next_event(pending[number], events)
+        if event is not None:
+            heapq.heapreplace(heap, (event[0], number, event, events))
+        else:
+            heapq.heappop(heap)
+
+
+def _prefetch(events, chunks):
+    """Producer thread: push an event stream into a bounded queue in chunks"""
+    try:
+        chunk = []
+        for event in events:
+            chunk.append(event)
+            if len(chunk) >= CHUNK_EVENTS:
+                chunks.put(chunk)
+                chunk = []
+        if chunk:
+            chunks.put(chunk)
+    except Exception as e:
+        print(f"Warning: Source stopped early: {e}")
+    finally:
+        chunks.put(_DONE)
+
+
+def _drain(chunks):
+    while True:
+        chunk = chunks.get()
+        if chunk is _DONE:
+            return
+        yield from chunk
+
+
+def merged_events(runs_by_host):
+    """k-way merge of every source, each read ahead on its own thread"""
+    streams = []
+    for runs in runs_by_host.values():
+        if not runs:
+            continue
+        chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+        threading.Thread(target=_prefetch, args=(iter_source(runs), chunks), daemon=True).start()
+        streams.append(_drain(chunks))
+    return heapq.merge(*streams, key=lambda event: event[0])
+
+
+class PartitionWriter:
+    """Writes a time-ordered stream into consecutive partition files"""
+
+    def __init__(self, data_folder, partition='day'):
+        self.archive = Archive(data_folder, partition)
+        if self.archive.partitions or session_query.archive_files(data_folder):
+            raise ValueError(f"{data_folder} already holds archive partitions")
+        os.makedirs(self.archive.folder, exist_ok=True)
+        self.index = SessionIndex(data_folder)
+        self.partition = partition
+        self._name = None
+        self._file = None
+        self._writer = None
+        self._chunk = []
+        self._entry = None
+        self._runs = set()
+        self._hosts = {}
+        self._written = {}  # name -> (entry, runs, hosts) of every partition so far
+        self._resumed = set()  # paths of partitions appended to after they closed
+
+    def write(self, event):
+        name = partition_name(event[0], self.partition)
+        if name != self._name:
+            self._close_partition()
+            self._open_partition(name)
+        self._chunk.append(event)
+        if len(self._chunk) >= CHUNK_EVENTS:
+            self._flush_chunk()
+
+    def _open_partition(self, name):
+        self._name = name
+        self._path = os.path.join(self.archive.folder, f'part_{name}.csv')
+        # An event older than its run's lower bound can bring the merge back
+        # to a partition it already closed; append to it instead of
+        # overwriting it, and put it back in time order on close()
+        resumed = name in self._written
+        if resumed:
+            self._resumed.add(self._path)
+        self._file = open(self._path, 'a' if resumed else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if resumed:
+            self._entry, self._runs, self._hosts = self._written[name]
+        else:
+            self._writer.writerow(MERGED_FIELDS)
+            self._entry, self._runs, self._hosts = self._written[name] = (new_entry(), set(), {})
+
+    def _flush_chunk(self):
+        chunk, self._chunk = self._chunk, []
+        self._writer.writerows((ns_to_iso(timestamp), app, event_type, key, host)
+                               for timestamp, app, event_type, key, host, _ in chunk)
+        events = [event[:4] for event in chunk]
+        add_events_to_entry(self._entry, events)
+        self.index.add_events(self._path, events)
+        for event in chunk:
+            self._runs.add(event[5])
+            self._hosts[event[4]] = self._hosts.get(event[4], 0) + 1
+
+    def _close_partition(self):
+        if self._file is None:
+            return
+        self._flush_chunk()
+        self._file.close()
+        self._file = None
+        self.index.touch(self._path)
+
+        summary = dict(self._entry)
+        summary.pop('mtime')
+        summary.pop('size')
+        sessions = {session for run in self._runs for session in run.sessions}
+        summary.update(sessions=sorted(sessions), hosts=self._hosts, downsampled=False)
+        self.archive.partitions[os.path.basename(self._path)] = summary
+
+    def _sort_partition(self, path):
+        """Rewrite a partition in time order (holds that one partition in memory)"""
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        # ISO timestamps in the same layout sort chronologically as strings
+        body = sorted(rows[1:], key=lambda row: row[0])
+        temporary = path + '.tmp'
+        with open(temporary, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(rows[0])
+            writer.writerows(body)
+        os.replace(temporary, path)
+        self.index.touch(path)
+
+    def close(self):
+        self._close_partition()
+        for path in sorted(self._resumed):
+            self._sort_partition(path)
+        self.archive.save()
+        self.index.save()
+
+
+def merge(sources, output, partition='day', workers=4):
+    """Merge (host, folder) sources into output; returns a summary dict"""
+    runs_by_host, duplicates = plan_runs(sources, workers)
+    for run in duplicates:
+        print(f"Skipping duplicate {run.path}")
+
+    writer = PartitionWriter(output, partition)
+    events = 0
+    try:
+        for event in merged_events(runs_by_host):
+            writer.write(event)
+            events += 1
+    finally:
+        writer.close()
+
+    return {'hosts': len(runs_by_host), 'files': sum(len(runs) for runs in runs_by_host.values()),
+            'duplicates': len(duplicates), 'events': events,
+            'partitions': len(writer.archive.partitions)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge activity_data folders from several machines")
+    parser.add_argument('sources', nargs='+', metavar='[HOST=]FOLDER')
+    parser.add_argument('-o', '--output', required=True, help="new data folder to write")
+    parser.add_argument('--partition', choices=sorted(PARTITION_FORMATS), default='day')
+    parser.add_argument('--workers', type=int, default=4, help="threads for hashing source files")
+    args = parser.parse_args(argv)
+
+    sources = [parse_source(spec) for spec in args.sources]
+    hosts = [host for host, _ in sources]
+    if len(set(hosts)) != len(hosts):
+        parser.error("host IDs must be unique; name sources as HOST=FOLDER")
+
+    result = merge(sources, args.output, args.partition, args.workers)
+    print(f"Merged {result['events']:,} events from {result['files']} files on "
+          f"{result['hosts']} hosts into {result['partitions']} partitions "
+          f"({result['duplicates']} duplicate files skipped)")
+
+
+if __name__ == "__main__":
+    main()
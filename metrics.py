@@ -0,0 +1,154 @@
+"""
+Metrics
+Low-overhead counters, gauges and latency histograms for the tracker
+
+Instrumented code checks `metrics.enabled` before taking any timestamps,
+so with metrics off the cost is one attribute lookup per site. Gauges are
+registered as functions and only evaluated when a snapshot is taken.
+Histograms use power-of-two nanosecond buckets, which is enough to tell a
+10 µs app lookup from a 10 ms auto-save. Counters and histograms are
+updated from the worker, listener and GUI threads, so each update takes a
+lock; it is uncontended almost always and costs well under a microsecond.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class Histogram:
+    """Latency histogram with power-of-two nanosecond buckets"""
+
+    BUCKETS = 48  # up to ~2.8 days
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = [0] * self.BUCKETS
+        self._lock = threading.Lock()
+
+    def observe(self, ns):
+        bucket = min(ns.bit_length(), self.BUCKETS - 1)
+        with self._lock:
+            self.count += 1
+            self.total += ns
+            if ns > self.max:
+                self.max = ns
+            self.buckets[bucket] += 1
+
+    def percentile(self, fraction):
+        """Upper bound (ns) of the bucket holding the given fraction of samples"""
+        with self._lock:
+            count, maximum, buckets = self.count, self.max, list(self.buckets)
+        return self._percentile(fraction, count, maximum, buckets)
+
+    @staticmethod
+    def _percentile(fraction, count, maximum, buckets):
+        if not count:
+            return 0
+        threshold = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= threshold:
+                return min(1 << index, maximum)
+        return maximum
+
+    def summary(self):
+        # One consistent copy, so the mean and percentiles agree with the count
+        with self._lock:
+            count, total, maximum, buckets = self.count, self.total, self.max, list(self.buckets)
+        return {'count': count,
+                'mean_us': total / count / 1000 if count else 0,
+                'p50_us': self._percentile(0.50, count, maximum, buckets) / 1000,
+                'p99_us': self._percentile(0.99, count, maximum, buckets) / 1000,
+                'max_us': maximum / 1000}
+
+
+class Metrics:
+    """Registry of named counters, gauges and histograms"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self._gauges = {}
+        self._started = time.time()
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, ns):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(ns)
+
+    def gauge(self, name, function):
+        """Register a function whose value is read at snapshot time"""
+        self._gauges[name] = function
+
+    def summary(self, name):
+        """Summary of one histogram, or None if it has no samples"""
+        histogram = self.histograms.get(name)
+        return histogram.summary() if histogram is not None and histogram.count else None
+
+    def snapshot(self):
+        """Current values of everything, as plain JSON-ready data"""
+        gauges = {}
+        for name, function in list(self._gauges.items()):
+            try:
+                gauges[name] = function()
+            except Exception:
+                gauges[name] = None
+        return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'uptime_s': round(time.time() - self._started, 1),
+                'counters': self._counters(),
+                'gauges': gauges,
+                'latency': {name: histogram.summary()
+                            for name, histogram in list(self.histograms.items())}}
+
+    def _counters(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def dump(self, path):
+        """Write a snapshot to path atomically"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def start_dumping(self, path, interval=60.0):
+        """Dump a snapshot to path every interval seconds from a background thread"""
+        if self._dump_thread is not None and self._dump_thread.is_alive():
+            return
+
+        def run():
+            while not self._dump_stop.wait(interval):
+                try:
+                    self.dump(path)
+                except Exception as e:
+                    print(f"Error writing metrics: {e}")
+
+        self._dump_stop.clear()
+        self._dump_thread = threading.Thread(target=run, name="MetricsDump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_dumping(self, path=None):
+        """Stop the dump thread, writing one last snapshot if a path is given"""
+        self._dump_stop.set()
+        if self._dump_thread is not None:
+            self._dump_thread.join(1.0)
+            self._dump_thread = None
+        if path is not None:
+            try:
+                self.dump(path)
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
@@ -0,0 +1,161 @@
+"""
+Motion
+Coalesces mouse movement and scrolling where it is captured
+
+pynput reports pointer moves and scroll ticks hundreds of times a second.
+MotionAggregator folds them into at most one 'mouse_move' and one 'scroll'
+record per interval that had any activity, so the extra signal costs a
+bounded number of records per minute however fast the pointer moves:
+
+    mouse_move   key 'px=<path length>;n=<moves>'
+    scroll       key 'dx=<sum>;dy=<sum>;n=<ticks>'
+    mouse_pos    key '<x>,<y>'  (only with record_positions)
+
+Records are timestamped with the start of their interval and credited to
+the app that was in front when it opened, so movement that follows a focus
+change isn't booked to whichever app is in front by the time the record
+is processed. Path length
+only counts steps of at least min_distance pixels, so sensor jitter doesn't
+add up. Position samples are taken no more often than min_sample_interval
+seconds and only once the pointer has moved min_distance pixels.
+"""
+
+import math
+import threading
+import time
+
+
+MOTION_EVENT_TYPES = ('mouse_move', 'scroll', 'mouse_pos')
+
+
+def move_key(path, moves):
+    return f"px={round(path)};n={moves}"
+
+
+def scroll_key(dx, dy, ticks):
+    return f"dx={dx:g};dy={dy:g};n={ticks}"
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_motion_key(key):
+    """Decode a mouse_move / scroll / mouse_pos key into a dict of numbers"""
+    if '=' not in key:
+        x, y = key.split(',')
+        return {'x': _number(x), 'y': _number(y)}
+    return {name: _number(value)
+            for name, value in (part.split('=', 1) for part in key.split(';'))}
+
+
+class MotionAggregator:
+    """Per-interval path length and scroll totals, fed from the mouse listener"""
+
+    def __init__(self, emit, interval=1.0, min_distance=3.0, min_sample_interval=0.1,
+                 record_positions=False, clock=time.time_ns, resolve_app=None):
+        self.emit = emit  # called as emit(event_type, key, timestamp, app=app)
+        # Names the app an interval belongs to, once per interval (app is
+        # None without it)
+        self.resolve_app = resolve_app
+        self.interval_ns = max(int(interval * 1e9), 1)
+        self.min_distance = min_distance
+        self.min_sample_ns = int(min_sample_interval * 1e9)
+        self.record_positions = record_positions
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        # Raw callbacks seen, for diagnostics
+        self.moves_seen = 0
+        self.scrolls_seen = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the current interval and pointer position"""
+        with self._lock:
+            self._interval_start = None
+            self._app = None
+            self._path = 0.0
+            self._moves = 0
+            self._dx = 0
+            self._dy = 0
+            self._ticks = 0
+            self._anchor = None  # last point counted into the path
+            self._sample = None  # (time, x, y) of the last position sample
+
+    def _take(self):
+        """Records for the current interval; resets its counters"""
+        records = []
+        start = self._interval_start
+        if self._moves:
+            records.append(('mouse_move', move_key(self._path, self._moves), start, self._app))
+        if self._ticks:
+            records.append(('scroll', scroll_key(self._dx, self._dy, self._ticks), start, self._app))
+        self._path = 0.0
+        self._moves = 0
+        self._dx = 0
+        self._dy = 0
+        self._ticks = 0
+        return records
+
+    def _roll(self, now):
+        """Close the current interval if now is past it; returns its records"""
+        start = self._interval_start
+        if start is not None and now - start < self.interval_ns:
+            return []
+        records = self._take() if start is not None else []
+        self._interval_start = now - now % self.interval_ns
+        self._app = self.resolve_app() if self.resolve_app is not None else None
+        return records
+
+    def move(self, x, y):
+        """Pointer moved to (x, y)"""
+        now = self.clock()
+        with self._lock:
+            self.moves_seen += 1
+            records = self._roll(now)
+            self._moves += 1
+
+            anchor = self._anchor
+            if anchor is None:
+                self._anchor = (x, y)
+            else:
+                step = math.hypot(x - anchor[0], y - anchor[1])
+                if step >= self.min_distance:
+                    self._path += step
+                    self._anchor = (x, y)
+
+            if self.record_positions:
+                sample = self._sample
+                if sample is None or (now - sample[0] >= self.min_sample_ns and
+                                      math.hypot(x - sample[1], y - sample[2]) >= self.min_distance):
+                    self._sample = (now, x, y)
+                    records.append(('mouse_pos', f"{round(x)},{round(y)}", now, self._app))
+
+        for event_type, key, timestamp, app in records:
+            self.emit(event_type, key, timestamp, app=app)
+
+    def scroll(self, dx, dy):
+        """Wheel or trackpad scrolled by (dx, dy) steps"""
+        now = self.clock()
+        with self._lock:
+            self.scrolls_seen += 1
+            records = self._roll(now)
+            self._dx += dx
+            self._dy += dy
+            self._ticks += 1
+
+        for event_type, key, timestamp, app in records:
+            self.emit(event_type, key, timestamp, app=app)
+
+    def flush(self):
+        """Emit the current interval now, e.g. when a session stops"""
+        with self._lock:
+            records = self._take() if self._interval_start is not None else []
+            self._interval_start = None
+
+        for event_type, key, timestamp, app in records:
+            self.emit(event_type, key, timestamp, app=app)
@@ -0,0 +1,259 @@
+"""
+Query Server
+Local HTTP endpoint for live and historical counts from a running tracker
+
+Dashboards and scripts can ask the tracker process for its numbers instead
+of re-reading session files or scraping the console. Everything is
+answered from memory - the live session counters, the session index and
+the rollups - so queries never touch the session file being written.
+
+    GET /live                         current session: events, per-app counts, queue
+    GET /apps                         saved per-app totals plus the current session
+    GET /range?start=&end=&by=app     rollup totals by app, hour or day
+              [&apps=A,B&event_types=keystroke,click&n=10]
+    GET /metrics                      latency histograms (with metrics enabled)
+
+The server binds to 127.0.0.1 only and writes its port to
+activity_data/query.port. Responses carry an ETag and are cached for
+min_interval seconds, or for as long as the tracker's state is unchanged
+but never longer than max_age seconds (the index, rollups and metrics can
+also change behind its back, e.g. from a compaction run); a request with a
+matching If-None-Match gets 304 Not Modified, so many frequent pollers
+cost little more than one.
+
+Query a running tracker with:
+    python query_server.py /live
+    python query_server.py "/range?start=2025-10-01&end=2025-11-01&by=day"
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import urlopen
+
+
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+PORT_FILENAME = 'query.port'
+RANGE_GROUPS = ('app', 'hour', 'day')
+
+
+class _ResponseCache:
+    """Rendered responses keyed by request, reused while fresh"""
+
+    def __init__(self, min_interval, max_age):
+        self.min_interval = min_interval
+        self.max_age = max_age
+        self._entries = {}  # request -> (generation, created, body, etag)
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry, generation):
+        if entry is None:
+            return False
+        age = time.monotonic() - entry[1]
+        return age < self.min_interval or (entry[0] == generation and age < self.max_age)
+
+    def get(self, request, generation, render):
+        entry = self._entries.get(request)
+        if self._fresh(entry, generation):
+            return entry[2], entry[3]
+
+        # One render per request at a time; waiting callers reuse its result
+        with self._lock:
+            entry = self._entries.get(request)
+            if self._fresh(entry, generation):
+                return entry[2], entry[3]
+            body = json.dumps(render(), separators=(',', ':')).encode('utf-8')
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            self._entries[request] = (generation, time.monotonic(), body, etag)
+            return body, etag
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    server_version = 'ActivityTrackerQuery/1'
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        try:
+            body, etag = service.respond(url.path, parse_qs(url.query))
+        except KeyError:
+            self._send(404, json.dumps({'error': f"unknown path {url.path}",
+                                        'paths': sorted(service.ROUTES)}).encode('utf-8'))
+            return
+        except ValueError as e:
+            self._send(400, json.dumps({'error': str(e)}).encode('utf-8'))
+            return
+        except Exception as e:
+            print(f"Query error for {self.path}: {e}")
+            self._send(500, json.dumps({'error': str(e)}).encode('utf-8'))
+            return
+
+        if etag in (self.headers.get('If-None-Match') or ''):
+            self._send(304, None, etag)
+        else:
+            self._send(200, body, etag)
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header('Cache-Control', f'max-age={self.server.service.cache.min_interval:g}')
+        if etag:
+            self.send_header('ETag', etag)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep per-request lines off the console
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class QueryServer:
+    """Serves an ActivityTracker's counters over HTTP on the loopback interface"""
+
+    ROUTES = ('/live', '/apps', '/range', '/metrics')
+
+    def __init__(self, tracker, port=0, host='127.0.0.1', min_interval=0.5, max_age=5.0):
+        if host not in LOOPBACK_HOSTS:
+            raise ValueError(f"The query server only listens on loopback, not {host}")
+        self.tracker = tracker
+        self.host = host
+        self.port = port
+        self.cache = _ResponseCache(min_interval, max_age)
+        self.port_file = os.path.join(tracker.data_folder, PORT_FILENAME)
+        self._server = None
+
+    def start(self):
+        self._server = _HTTPServer((self.host, self.port), _QueryHandler)
+        self._server.service = self
+        self.port = self._server.server_address[1]
+        with open(self.port_file, 'w', encoding='utf-8') as f:
+            f.write(str(self.port))
+        threading.Thread(target=self._server.serve_forever, name="QueryServer", daemon=True).start()
+        print(f"Query server on http://{self.host}:{self.port}/")
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        try:
+            os.remove(self.port_file)
+        except OSError:
+            pass
+
+    # ============ Responses ============
+
+    def generation(self):
+        """Changes whenever anything a response depends on may have changed"""
+        tracker = self.tracker
+        return (tracker.tracking, tracker.session_id, tracker.event_count,
+                tracker.saved_event_count, tracker.snapshot.saved_events,
+                tracker.event_pipeline.dropped)
+
+    def respond(self, path, params):
+        """(body, etag) for a request; KeyError for an unknown path, ValueError for bad parameters"""
+        if path not in self.ROUTES:
+            raise KeyError(path)
+        request = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        render = getattr(self, '_' + path.strip('/'))
+        return self.cache.get(request, self.generation(), lambda: render(params))
+
+    def _live(self, params):
+        tracker = self.tracker
+        started = tracker.session_start
+        return {'tracking': tracker.tracking,
+                'session_id': tracker.session_id,
+                'session_start': started.isoformat() if started else None,
+                'events': tracker.event_count,
+                'apps': dict(tracker.session_apps),
+                'rows': len(tracker.session_events),
+                'saved_rows': tracker.saved_event_count,
+                'queue_pending': tracker.event_pipeline.pending,
+                'dropped': tracker.event_pipeline.dropped,
+                'first_event_ms': tracker.first_event_ms}
+
+    def _apps(self, params):
+        tracker = self.tracker
+        return {'saved': tracker.get_app_totals(),
+                'saved_events': tracker.get_total_event_count(),
+                'session': dict(tracker.session_apps)}
+
+    def _range(self, params):
+        start = _param(params, 'start')
+        end = _param(params, 'end')
+        by = _param(params, 'by', 'app')
+        if by not in RANGE_GROUPS:
+            raise ValueError(f"by must be one of {', '.join(RANGE_GROUPS)}")
+        apps = _list_param(params, 'apps')
+        event_types = _list_param(params, 'event_types')
+
+        rollups = self.tracker.rollups
+        if by == 'app':
+            n = int(_param(params, 'n', '10'))
+            counts = dict(rollups.top_apps(start, end, n, event_types=event_types, apps=apps))
+        elif by == 'hour':
+            counts = rollups.hourly_histogram(start, end, apps, event_types)
+        else:
+            counts = rollups.daily_totals(start, end, apps, event_types)
+        return {'start': start, 'end': end, 'by': by, 'counts': counts}
+
+    def _metrics(self, params):
+        metrics = self.tracker.metrics
+        return metrics.snapshot() if metrics.enabled else {'enabled': False}
+
+
+def _param(params, name, default=None):
+    values = params.get(name)
+    return values[-1] if values else default
+
+
+def _list_param(params, name):
+    value = _param(params, name)
+    return [item for item in value.split(',') if item] if value else None
+
+
+def query(data_folder, path, timeout=5.0):
+    """GET a path from the tracker serving data_folder and return the decoded JSON"""
+    with open(os.path.join(data_folder, PORT_FILENAME), 'r', encoding='utf-8') as f:
+        port = int(f.read().strip())
+    with urlopen(f'http://127.0.0.1:{port}{path}', timeout=timeout) as response:
+        return json.load(response)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query a running tracker's query server")
+    parser.add_argument('path', nargs='?', default='/live', help="e.g. /live, /apps, /range?by=day")
+    parser.add_argument('--data-folder', default='activity_data')
+    args = parser.parse_args(argv)
+    try:
+        print(json.dumps(query(args.data_folder, args.path), indent=2))
+    except HTTPError as e:
+        # The server answers errors with a JSON body naming the problem
+        try:
+            message = json.loads(e.read().decode('utf-8')).get('error', e.reason)
+        except ValueError:
+            message = e.reason
+        print(f"Query failed ({e.code}): {message}", file=sys.stderr)
+        sys.exit(1)
+    except (OSError, ValueError) as e:
+        print(f"Could not reach the tracker: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Rollups
+Per-minute event counts maintained as events arrive, plus queries over them
+
+Every recorded event bumps a counter for its (minute, app, event_type,
+key class). Counters are merged into one JSON file per local day under
+activity_data/rollups/ whenever the session is saved. Top-N apps, hourly
+histograms and daily totals are then answered from the rollups, so a
+query costs the number of minutes in its range, not the number of raw
+events.
+
+Ranges are half-open [start, end) and resolved to whole minutes: a minute
+is included when it starts inside the range. With minute-aligned bounds
+the answers match a scan of the raw session files exactly.
+
+Rebuild rollups from existing sessions with:
+    python rollups.py rebuild
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import session_query
+from bursts import BURST_EVENT_TYPE, decode_burst_key
+from event_buffer import iso_to_ns
+
+
+ROLLUP_VERSION = 1
+MINUTE_NS = 60 * 1_000_000_000
+
+MODIFIER_KEYS = {'shift', 'shift_r', 'ctrl', 'ctrl_l', 'ctrl_r', 'alt', 'alt_l', 'alt_r',
+                 'alt_gr', 'cmd', 'cmd_l', 'cmd_r', 'caps_lock', 'fn'}
+WHITESPACE_KEYS = {'space', 'enter', 'tab', ' '}
+EDITING_KEYS = {'backspace', 'delete'}
+NAVIGATION_KEYS = {'up', 'down', 'left', 'right', 'home', 'end', 'page_up', 'page_down'}
+
+
+def key_class(event_type, key):
+    """Coarse class of a key, so rollups never store raw key contents"""
+    if event_type != 'keystroke':
+        return key if event_type == 'click' else event_type
+    if len(key) == 1:
+        if key.isalpha():
+            return 'letter'
+        if key.isdigit():
+            return 'digit'
+        if key.isspace():
+            return 'whitespace'
+        return 'symbol'
+    if key in MODIFIER_KEYS:
+        return 'modifier'
+    if key in WHITESPACE_KEYS:
+        return 'whitespace'
+    if key in EDITING_KEYS:
+        return 'editing'
+    if key in NAVIGATION_KEYS:
+        return 'navigation'
+    if key.startswith('f') and key[1:].isdigit():
+        return 'function'
+    return 'other'
+
+
+def _day_of_minute(minute):
+    return datetime.fromtimestamp(minute * 60).strftime('%Y%m%d')
+
+
+def _bucket_label(minute, bucket):
+    started = datetime.fromtimestamp(minute * 60)
+    if bucket == 'minute':
+        return started.isoformat()
+    if bucket == 'hour':
+        return started.replace(minute=0).isoformat()
+    if bucket == 'day':
+        return started.date().isoformat()
+    raise ValueError(f"Unknown bucket: {bucket}")
+
+
+class RollupStore:
+    """In-memory minute counters with per-day JSON persistence"""
+
+    FIELDS = ('app', 'event_type', 'key_class')
+
+    def __init__(self, data_folder):
+        self.folder = os.path.join(data_folder, 'rollups')
+        self._pending = defaultdict(Counter)  # minute -> (app, event_type, key class) -> count
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # serialises read-modify-write of day files
+        self._days = {}  # day -> (mtime, minutes) cache of persisted files
+
+    def _day_path(self, day):
+        return os.path.join(self.folder, f'rollup_{day}.json')
+
+    def add(self, timestamp_ns, app, event_type, key, count=1, cls=None):
+        """Count one event (or count events) into its minute bucket"""
+        minute = timestamp_ns // MINUTE_NS
+        if cls is None:
+            cls = key_class(event_type, key)
+        with self._lock:
+            self._pending[minute][(app, event_type, cls)] += count
+
+    def flush(self):
+        """Merge pending counters into the per-day files"""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(Counter)
+        if not pending:
+            return
+
+        by_day = defaultdict(dict)
+        for minute, counts in pending.items():
+            by_day[_day_of_minute(minute)][minute] = counts
+
+        os.makedirs(self.folder, exist_ok=True)
+        for day, minutes in by_day.items():
+            try:
+                stored = self._load_day(day)
+                for minute, counts in minutes.items():
+                    merged = stored.setdefault(minute, Counter())
+                    merged.update(counts)
+                self._write_day(day, stored)
+            except Exception as e:
+                print(f"Error saving rollups for {day}: {e}")
+                # Put the counts back so the next flush retries them
+                with self._lock:
+                    for minute, counts in minutes.items():
+                        self._pending[minute].update(counts)
+
+    def _load_day(self, day):
+        """Return {minute: Counter} for a day, using the cache while the file is unchanged"""
+        path = self._day_path(day)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return {}
+
+        cached = self._days.get(day)
+        if cached is not None and cached[0] == mtime:
+            return {minute: Counter(counts) for minute, counts in cached[1].items()}
+
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        minutes = {}
+        if data.get('version') == ROLLUP_VERSION:
+            for minute, rows in data['minutes'].items():
+                minutes[int(minute)] = Counter({(app, event_type, cls): count
+                                                for app, event_type, cls, count in rows})
+        self._days[day] = (mtime, minutes)
+        return {minute: Counter(counts) for minute, counts in minutes.items()}
+
+    def _write_day(self, day, minutes):
+        path = self._day_path(day)
+        data = {'version': ROLLUP_VERSION,
+                'minutes': {str(minute): [[*fields, count] for fields, count in counts.items()]
+                            for minute, counts in sorted(minutes.items())}}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self._days[day] = (os.stat(path).st_mtime, minutes)
+
+    def clear(self):
+        """Delete all persisted rollups and pending counters"""
+        with self._lock:
+            self._pending = defaultdict(Counter)
+        for path in glob.glob(os.path.join(self.folder, 'rollup_*.json')):
+            os.remove(path)
+        self._days = {}
+
+    # ============ Queries ============
+
+    def iter_minutes(self, start=None, end=None):
+        """Yield (minute, Counter) for minutes starting in [start, end), persisted and pending"""
+        start_ns = session_query.to_ns(start)
+        end_ns = session_query.to_ns(end)
+        first = None if start_ns is None else -(-start_ns // MINUTE_NS)
+        last = None if end_ns is None else -(-end_ns // MINUTE_NS)  # exclusive
+
+        # Hold the flush lock so pending counts can't move into a day file
+        # between reading one and the other
+        with self._flush_lock:
+            with self._lock:
+                pending = {minute: Counter(counts) for minute, counts in self._pending.items()}
+
+            days = set()
+            for path in glob.glob(os.path.join(self.folder, 'rollup_*.json')):
+                days.add(os.path.basename(path)[len('rollup_'):-len('.json')])
+            days.update(_day_of_minute(minute) for minute in pending)
+
+            # Skip day files entirely outside the range
+            if first is not None:
+                first_day = _day_of_minute(first)
+                days = {day for day in days if day >= first_day}
+            if last is not None:
+                last_day = _day_of_minute(last - 1)
+                days = {day for day in days if day <= last_day}
+
+            loaded = {day: self._load_day(day) for day in days}
+
+        for minute, counts in pending.items():
+            day = _day_of_minute(minute)
+            if day in loaded:
+                loaded[day].setdefault(minute, Counter()).update(counts)
+
+        for day in sorted(loaded):
+            minutes = loaded[day]
+            for minute in sorted(minutes):
+                if first is not None and minute < first:
+                    continue
+                if last is not None and minute >= last:
+                    continue
+                yield minute, minutes[minute]
+
+    def aggregate(self, start=None, end=None, by=('app',), bucket=None,
+                  apps=None, event_types=None):
+        """Sum counts grouped by fields in `by` and optionally a time bucket
+
+        Keys of the result are tuples: (bucket label, *fields) when bucket
+        is 'minute', 'hour' or 'day', otherwise just the fields.
+        """
+        positions = [self.FIELDS.index(field) for field in by]
+        apps = set(apps) if apps else None
+        event_types = set(event_types) if event_types else None
+
+        totals = Counter()
+        for minute, counts in self.iter_minutes(start, end):
+            label = (_bucket_label(minute, bucket),) if bucket else ()
+            for fields, count in counts.items():
+                if apps is not None and fields[0] not in apps:
+                    continue
+                if event_types is not None and fields[1] not in event_types:
+                    continue
+                totals[label + tuple(fields[i] for i in positions)] += count
+        return totals
+
+    def top_apps(self, start=None, end=None, n=10, event_types=None, apps=None):
+        """The n apps (of apps, if given) with the most events, as [(app, count), ...]"""
+        totals = self.aggregate(start, end, by=('app',), apps=apps, event_types=event_types)
+        return [(key[0], count) for key, count in totals.most_common(n)]
+
+    def hourly_histogram(self, start=None, end=None, apps=None, event_types=None):
+        """Event counts per local hour, as {hour start ISO: count}"""
+        totals = self.aggregate(start, end, by=(), bucket='hour', apps=apps, event_types=event_types)
+        return {key[0]: count for key, count in sorted(totals.items())}
+
+    def daily_totals(self, start=None, end=None, apps=None, event_types=None):
+        """Event counts per local day, as {date ISO: count}"""
+        totals = self.aggregate(start, end, by=(), bucket='day', apps=apps, event_types=event_types)
+        return {key[0]: count for key, count in sorted(totals.items())}
+
+
+def add_stored_event(store, timestamp, app, event_type, key):
+    """Count a stored row; a burst counts as its keystrokes, all in the minute it started"""
+    if event_type != BURST_EVENT_TYPE:
+        store.add(timestamp, app, event_type, key)
+        return
+
+    burst = decode_burst_key(key)
+    if 'classes' in burst:
+        for cls, count in burst['classes'].items():
+            store.add(timestamp, app, 'keystroke', None, count, cls=cls)
+    elif 'keys' in burst:
+        for key, count in burst['keys'].items():
+            store.add(timestamp, app, 'keystroke', key, count)
+    else:
+        store.add(timestamp, app, 'keystroke', None, burst['n'], cls='other')
+
+
+def rebuild_rollups(data_folder):
+    """Recompute all rollups from the raw session files"""
+    store = RollupStore(data_folder)
+    store.clear()
+    for count, event in enumerate(session_query.iter_events(data_folder), 1):
+        add_stored_event(store, iso_to_ns(event['timestamp']), event['app'],
+                         event['event_type'], event['key'])
+        if count % 100000 == 0:
+            store.flush()
+    store.flush()
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain and query activity rollups")
+    parser.add_argument('command', choices=['rebuild', 'top', 'hourly', 'daily'])
+    parser.add_argument('--data-folder', default='activity_data')
+    parser.add_argument('--start', help="ISO start (inclusive)")
+    parser.add_argument('--end', help="ISO end (exclusive)")
+    parser.add_argument('-n', type=int, default=10, help="number of apps for 'top'")
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        rebuild_rollups(args.data_folder)
+        print("Rollups rebuilt")
+        return
+
+    store = RollupStore(args.data_folder)
+    if args.command == 'top':
+        for app, count in store.top_apps(args.start, args.end, args.n):
+            print(f"{count:>10,}  {app}")
+    else:
+        query = store.hourly_histogram if args.command == 'hourly' else store.daily_totals
+        for label, count in query(args.start, args.end).items():
+            print(f"{label}  {count:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+Binary Session Format
+Compact columnar alternative to the session CSV files (session_<id>.atb)
+
+File layout (little-endian):
+
+    header   64 bytes - magic, version, flags, event count, time range,
+             footer offset and length, block count
+    blocks   up to BLOCK_EVENTS events each: delta-encoded int timestamps
+             plus app / event type / key code columns, optionally
+             zlib-compressed
+    footer   string tables (JSON), the block index and a CRC32
+
+Each block index entry holds the block's offset, sizes, event count and
+min/max timestamp, so a reader can memory-map the file and decode only the
+blocks a time range or slice touches. Appending copies the footer past
+the end of the new data, points the header at the copy, writes the new
+blocks and footer over the old one and finally rewrites the 64-byte
+header, so a save costs the new events plus two footers, not the whole
+file. The header always points at an intact footer, so a crash part-way
+through an append loses only that append, and the file holds a single
+footer however many saves it took.
+
+Convert existing files with:
+    python session_binary.py to-binary activity_data/session_*.csv
+    python session_binary.py to-csv activity_data/session_*.atb
+"""
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from event_buffer import FIELDS, StringTable, iso_to_ns, ns_to_iso
+
+
+MAGIC = b'ATSB'
+VERSION = 1
+BINARY_EXTENSION = '.atb'
+
+FLAG_ZLIB = 0x1
+BLOCK_EVENTS = 4096
+
+# magic, version, flags, count, min ts, max ts, footer offset, footer length, block count
+HEADER = struct.Struct('<4sHHQqqQQI')
+HEADER_SIZE = 64
+
+# count, base timestamp, typecodes of the delta/app/event type/key columns
+BLOCK_HEADER = struct.Struct('<Iq4s')
+
+# offset, stored length, raw length, count, min ts, max ts
+BLOCK_ENTRY = struct.Struct('<QIIIqq')
+
+FOOTER_TAIL = struct.Struct('<I4s')  # CRC32 of the footer body, magic
+
+
+def _code_type(values):
+    """Smallest unsigned array typecode that holds every value"""
+    largest = max(values, default=0)
+    if largest < 1 << 8:
+        return 'B'
+    if largest < 1 << 16:
+        return 'H'
+    return 'I'
+
+
+def _to_bytes(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_bytes(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def encode_block(events, tables):
+    """Encode (timestamp_ns, app, event_type, key) tuples as a raw block"""
+    apps, event_types, keys = tables
+    timestamps = [event[0] for event in events]
+    base = timestamps[0]
+
+    deltas = [0]
+    deltas.extend(b - a for a, b in zip(timestamps, timestamps[1:]))
+    delta_type = 'i' if all(-(1 << 31) <= d < (1 << 31) for d in deltas) else 'q'
+
+    app_codes = [apps.code(event[1]) for event in events]
+    event_type_codes = [event_types.code(event[2]) for event in events]
+    key_codes = [keys.code(event[3]) for event in events]
+
+    columns = [array(delta_type, deltas)]
+    for codes in (app_codes, event_type_codes, key_codes):
+        columns.append(array(_code_type(codes), codes))
+
+    typecodes = ''.join(column.typecode for column in columns).encode('ascii')
+    return BLOCK_HEADER.pack(len(events), base, typecodes) + b''.join(_to_bytes(c) for c in columns)
+
+
+def decode_block(raw):
+    """Decode a raw block into (timestamps, app codes, event type codes, key codes)"""
+    count, base, typecodes = BLOCK_HEADER.unpack_from(raw)
+    offset = BLOCK_HEADER.size
+    columns = []
+    for typecode in typecodes.decode('ascii'):
+        size = array(typecode).itemsize * count
+        columns.append(_from_bytes(typecode, raw[offset:offset + size]))
+        offset += size
+
+    deltas = columns[0]
+    timestamps = array('q', accumulate(deltas, initial=base))
+    del timestamps[0]
+    return timestamps, columns[1], columns[2], columns[3]
+
+
+class BinarySessionWriter:
+    """Appends events to a binary session file without rewriting earlier blocks"""
+
+    FLUSH_POLICIES = ('none', 'flush', 'fsync')
+
+    def __init__(self, path, compress=True, flush_policy='flush'):
+        if flush_policy not in self.FLUSH_POLICIES:
+            raise ValueError(f"Unknown flush policy: {flush_policy}")
+
+        self.path = path
+        self.flags = FLAG_ZLIB if compress else 0
+        self.flush_policy = flush_policy
+        self.tables = (StringTable(), StringTable(), StringTable())
+        self.blocks = []
+        self.count = 0
+        self.min_timestamp = 0
+        self.max_timestamp = 0
+        self.rows_written = 0
+        self._file = None
+        self._end = HEADER_SIZE  # end of the last block
+        self._header = None  # header fields of the last commit
+        self._pending = []  # (offset, stored block) waiting to go over the committed footer
+        self._committed = True
+
+    def _open(self):
+        """Create the file, or load the footer of an existing one to append to it"""
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with BinarySessionReader(self.path) as reader:
+                self.flags = reader.flags
+                self.blocks = list(reader.blocks)
+                self.count = len(reader)
+                self.min_timestamp, self.max_timestamp = reader.time_range
+                for table, values in zip(self.tables, reader.tables):
+                    for value in values:
+                        table.code(value)
+                self._header = (MAGIC, VERSION, self.flags, self.count, self.min_timestamp,
+                                self.max_timestamp, reader.footer_offset, reader.footer_length,
+                                len(self.blocks))
+            # New blocks start where the last one ends; anything after it is
+            # the committed footer or a torn append
+            self._end = max((entry[0] + entry[1] for entry in self.blocks), default=HEADER_SIZE)
+            self._file = open(self.path, 'r+b')
+        else:
+            self._file = open(self.path, 'w+b')
+            self._file.write(b'\0' * HEADER_SIZE)
+            self._end = HEADER_SIZE
+
+    def write_events(self, events, commit=True):
+        """Append (timestamp_ns, app, event_type, key) tuples as new blocks"""
+        events = list(events)
+        if not events:
+            return
+        if self._file is None:
+            self._open()
+
+        for start in range(0, len(events), BLOCK_EVENTS):
+            chunk = events[start:start + BLOCK_EVENTS]
+            raw = encode_block(chunk, self.tables)
+            stored = zlib.compress(raw, 1) if self.flags & FLAG_ZLIB else raw
+            if self._header is None:
+                # Nothing committed yet, so nothing to protect
+                self._file.seek(self._end)
+                self._file.write(stored)
+            else:
+                self._pending.append((self._end, stored))
+
+            timestamps = [event[0] for event in chunk]
+            low, high = min(timestamps), max(timestamps)
+            self.blocks.append((self._end, len(stored), len(raw), len(chunk), low, high))
+            self._end += len(stored)
+
+            if self.count == 0:
+                self.min_timestamp, self.max_timestamp = low, high
+            else:
+                self.min_timestamp = min(self.min_timestamp, low)
+                self.max_timestamp = max(self.max_timestamp, high)
+            self.count += len(chunk)
+
+        self.rows_written += len(events)
+        self._committed = False
+        if commit:
+            self.commit()
+
+    def _write_header(self, header):
+        self._file.seek(0)
+        self._file.write(HEADER.pack(*header).ljust(HEADER_SIZE, b'\0'))
+        self.flush()
+
+    def commit(self):
+        """Write the new blocks and footer, then the header, so they become visible
+
+        New blocks go over the committed footer, so the file only ever holds
+        one footer. Before they do, that footer is copied past the end of
+        the new data and the header pointed at the copy; a crash at any
+        point leaves a header that points at an intact footer.
+        """
+        if self._file is None or self._committed:
+            return
+
+        apps, event_types, keys = self.tables
+        tables = json.dumps({'apps': apps.values, 'event_types': event_types.values,
+                             'keys': keys.values}, separators=(',', ':')).encode('utf-8')
+        body = (struct.pack('<I', len(tables)) + tables +
+                b''.join(BLOCK_ENTRY.pack(*entry) for entry in self.blocks))
+        footer = body + FOOTER_TAIL.pack(zlib.crc32(body), MAGIC)
+
+        f = self._file
+        if self._pending:
+            offset, length = self._header[6], self._header[7]
+            copy = max(offset + length, self._end + len(footer))
+            f.seek(offset)
+            committed = f.read(length)
+            f.seek(copy)
+            f.write(committed)
+            self.flush()
+            self._write_header(self._header[:6] + (copy,) + self._header[7:])
+
+            for block_offset, stored in self._pending:
+                f.seek(block_offset)
+                f.write(stored)
+            self._pending = []
+
+        # Blocks and footer must be on disk before the header points at them
+        f.seek(self._end)
+        f.write(footer)
+        self.flush()
+        self._header = (MAGIC, VERSION, self.flags, self.count, self.min_timestamp,
+                        self.max_timestamp, self._end, len(footer), len(self.blocks))
+        self._write_header(self._header)
+        f.truncate(self._end + len(footer))
+        self._committed = True
+
+    def flush(self):
+        """Push written data out according to the flush policy"""
+        if self._file is None or self.flush_policy == 'none':
+            return
+
+        self._file.flush()
+        if self.flush_policy == 'fsync':
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Commit any pending blocks and close the file"""
+        if self._file is None:
+            return
+
+        try:
+            self.commit()
+            self._file.flush()
+            if self.flush_policy == 'fsync':
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class BinarySessionReader:
+    """Memory-mapped reader that decodes blocks on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_metadata()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_metadata(self):
+        data = self._map
+        if len(data) < HEADER_SIZE:
+            raise ValueError(f"{self.path}: file too short")
+
+        (magic, version, self.flags, self.count, min_timestamp, max_timestamp,
+         self.footer_offset, self.footer_length, block_count) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: not a binary session file")
+        if version != VERSION:
+            raise ValueError(f"{self.path}: unsupported version {version}")
+        self.time_range = (min_timestamp, max_timestamp)
+
+        footer = data[self.footer_offset:self.footer_offset + self.footer_length]
+        body = footer[:-FOOTER_TAIL.size]
+        crc, tail_magic = FOOTER_TAIL.unpack_from(footer, len(body))
+        if tail_magic != MAGIC or zlib.crc32(body) != crc:
+            raise ValueError(f"{self.path}: footer is corrupt (interrupted save?)")
+
+        (tables_length,) = struct.unpack_from('<I', body)
+        tables = json.loads(body[4:4 + tables_length].decode('utf-8'))
+        self.tables = (tables['apps'], tables['event_types'], tables['keys'])
+
+        offset = 4 + tables_length
+        self.blocks = [BLOCK_ENTRY.unpack_from(body, offset + i * BLOCK_ENTRY.size)
+                       for i in range(block_count)]
+
+        # Index of the first event of each block, for slicing
+        self._starts = [0]
+        for entry in self.blocks:
+            self._starts.append(self._starts[-1] + entry[3])
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read_block(self, index):
+        """Decode one block into columns of timestamps and codes"""
+        offset, stored_length, _, _, _, _ = self.blocks[index]
+        raw = self._map[offset:offset + stored_length]
+        if self.flags & FLAG_ZLIB:
+            raw = zlib.decompress(raw)
+        return decode_block(raw)
+
+    def _rows(self, index, start, stop, start_ns=None, end_ns=None):
+        timestamps, app_codes, event_type_codes, key_codes = self.read_block(index)
+        apps, event_types, keys = self.tables
+        for i in range(start, stop):
+            timestamp = timestamps[i]
+            if start_ns is not None and timestamp < start_ns:
+                continue
+            if end_ns is not None and timestamp >= end_ns:
+                continue
+            yield timestamp, apps[app_codes[i]], event_types[event_type_codes[i]], keys[key_codes[i]]
+
+    def iter_columns(self, start_ns=None, end_ns=None):
+        """Yield (timestamp_ns, app, event_type, key) tuples in [start_ns, end_ns)"""
+        for index, entry in enumerate(self.blocks):
+            count, low, high = entry[3], entry[4], entry[5]
+            if start_ns is not None and high < start_ns:
+                continue
+            if end_ns is not None and low >= end_ns:
+                continue
+            yield from self._rows(index, 0, count, start_ns, end_ns)
+
+    def events(self, start_ns=None, end_ns=None):
+        """Yield event dicts in the CSV layout"""
+        for timestamp, app, event_type, key in self.iter_columns(start_ns, end_ns):
+            yield {'timestamp': ns_to_iso(timestamp), 'app': app,
+                   'event_type': event_type, 'key': key}
+
+    def slice_columns(self, start, stop):
+        """Yield event tuples with positions in [start, stop), decoding only the blocks needed"""
+        start = max(start, 0)
+        stop = min(stop, self.count)
+        index = bisect_right(self._starts, start) - 1
+        while start < stop and index < len(self.blocks):
+            block_start = self._starts[index]
+            block_stop = self._starts[index + 1]
+            yield from self._rows(index, start - block_start, min(stop, block_stop) - block_start)
+            start = block_stop
+            index += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return list(self.slice_columns(0, self.count))[index]
+            return list(self.slice_columns(start, stop))
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("event index out of range")
+        return next(self.slice_columns(index, index + 1))
+
+
+def csv_to_binary(csv_path, binary_path=None, compress=True):
+    """Convert a session CSV into the binary format; returns the new path"""
+    if binary_path is None:
+        binary_path = os.path.splitext(csv_path)[0] + BINARY_EXTENSION
+    if os.path.exists(binary_path):
+        os.remove(binary_path)
+
+    writer = BinarySessionWriter(binary_path, compress=compress, flush_policy='none')
+    try:
+        batch = []
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                batch.append((iso_to_ns(row['timestamp']), row['app'], row['event_type'], row['key']))
+                if len(batch) >= BLOCK_EVENTS:
+                    writer.write_events(batch, commit=False)
+                    batch = []
+        writer.write_events(batch, commit=False)
+    finally:
+        writer.close()
+    return binary_path
+
+
+def binary_to_csv(binary_path, csv_path=None):
+    """Convert a binary session file back to the CSV layout; returns the new path"""
+    if csv_path is None:
+        csv_path = os.path.splitext(binary_path)[0] + '.csv'
+
+    with BinarySessionReader(binary_path) as reader, \
+            open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for timestamp, app, event_type, key in reader.iter_columns():
+            writer.writerow((ns_to_iso(timestamp), app, event_type, key))
+    return csv_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert session files between CSV and binary")
+    parser.add_argument('direction', choices=['to-binary', 'to-csv'])
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--no-compress', action='store_true', help="store blocks uncompressed")
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        try:
+            if args.direction == 'to-binary':
+                output = csv_to_binary(path, compress=not args.no_compress)
+            else:
+                output = binary_to_csv(path)
+            print(f"{path} -> {output}")
+        except Exception as e:
+            print(f"Could not convert {path}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Session Index
+Running totals for every session file, kept in activity_data/index.json
+
+Each entry (keyed by session filename, CSV or binary; archive partition
+files are indexed the same way) records a session's event count (a burst
+row counts as its keystrokes), time range and per-app / per-event-type
+counts, plus the file's mtime and size when they were computed. The
+tracker updates entries as it saves, and refresh() only rescans files
+whose mtime or size no longer match, so totals can be shown without
+reading the raw session files.
+"""
+
+import csv
+import json
+import os
+import threading
+from collections import Counter
+
+from bursts import event_weight
+from event_buffer import ns_to_iso
+from session_binary import BINARY_EXTENSION, BinarySessionReader
+from session_query import ARCHIVE_FOLDER
+
+
+INDEX_FILENAME = 'index.json'
+INDEX_VERSION = 1
+SESSION_EXTENSIONS = ('.csv', BINARY_EXTENSION)
+
+
+def new_entry():
+    """Return an empty per-session entry"""
+    return {'events': 0, 'first': None, 'last': None,
+            'apps': {}, 'event_types': {}, 'mtime': 0.0, 'size': 0}
+
+
+def _merge_counts(entry, first, last, apps, event_types):
+    """Fold counts and an ISO time range into a session entry"""
+    for app, count in apps.items():
+        entry['apps'][app] = entry['apps'].get(app, 0) + count
+    for event_type, count in event_types.items():
+        entry['event_types'][event_type] = entry['event_types'].get(event_type, 0) + count
+    entry['events'] += sum(apps.values())
+    if first is not None and (entry['first'] is None or first < entry['first']):
+        entry['first'] = first
+    if last is not None and (entry['last'] is None or last > entry['last']):
+        entry['last'] = last
+    return entry
+
+
+def add_rows_to_entry(entry, rows):
+    """Fold CSV row dicts (ISO timestamps) into a session entry"""
+    apps = Counter()
+    event_types = Counter()
+    first = last = None
+
+    for row in rows:
+        timestamp = row['timestamp']
+        if first is None or timestamp < first:
+            first = timestamp
+        if last is None or timestamp > last:
+            last = timestamp
+        weight = event_weight(row['event_type'], row['key'])
+        apps[row['app']] += weight
+        event_types[row['event_type']] += weight
+
+    return _merge_counts(entry, first, last, apps, event_types)
+
+
+def add_events_to_entry(entry, events):
+    """Fold (timestamp_ns, app, event_type, key) tuples into a session entry"""
+    apps = Counter()
+    event_types = Counter()
+    first = last = None
+
+    for timestamp, app, event_type, key in events:
+        if first is None or timestamp < first:
+            first = timestamp
+        if last is None or timestamp > last:
+            last = timestamp
+        weight = event_weight(event_type, key)
+        apps[app] += weight
+        event_types[event_type] += weight
+
+    if first is not None:
+        first, last = ns_to_iso(first), ns_to_iso(last)
+    return _merge_counts(entry, first, last, apps, event_types)
+
+
+def scan_session_file(path):
+    """Build an index entry by reading a whole session file"""
+    entry = new_entry()
+    if path.endswith(BINARY_EXTENSION):
+        with BinarySessionReader(path) as reader:
+            add_events_to_entry(entry, reader.iter_columns())
+    else:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            add_rows_to_entry(entry, csv.DictReader(f))
+    return entry
+
+
+class SessionIndex:
+    """Per-session manifest with O(1) running totals"""
+
+    def __init__(self, data_folder):
+        self.data_folder = data_folder
+        self.path = os.path.join(data_folder, INDEX_FILENAME)
+        self.sessions = {}  # filename -> entry
+        self.total_events = 0
+        self._app_totals = None
+        self._lock = threading.RLock()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Read the manifest from disk, starting empty if it is missing or bad"""
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == INDEX_VERSION:
+                    self.sessions = data.get('sessions', {})
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Warning: Could not read session index, rebuilding: {e}")
+                self.sessions = {}
+            self._recount()
+
+    def save(self):
+        """Write the manifest atomically if anything changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'version': INDEX_VERSION, 'sessions': self.sessions}
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                print(f"Error saving session index: {e}")
+
+    def refresh(self):
+        """Validate entries against the files on disk, rescanning changed ones"""
+        with self._lock:
+            seen = set()
+            entries = []
+            for folder in (self.data_folder, os.path.join(self.data_folder, ARCHIVE_FOLDER)):
+                try:
+                    entries.extend(os.scandir(folder))
+                except FileNotFoundError:
+                    pass
+
+            for dir_entry in entries:
+                name = dir_entry.name
+                if not (name.startswith(('session_', 'part_')) and name.endswith(SESSION_EXTENSIONS)):
+                    continue
+                seen.add(name)
+                self._rescan_if_stale(name, dir_entry.path, dir_entry.stat())
+
+            for name in set(self.sessions) - seen:
+                del self.sessions[name]
+                self._dirty = True
+
+            if self._dirty:
+                self._recount()
+            self.save()
+        return self
+
+    def _rescan_if_stale(self, name, path, stat):
+        entry = self.sessions.get(name)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return
+
+        try:
+            entry = scan_session_file(path)
+        except Exception as e:
+            print(f"Warning: Could not index {path}: {e}")
+            return
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+        self.sessions[name] = entry
+        self._dirty = True
+
+    def validate(self, path):
+        """Rescan one session file if its entry is missing or out of date"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._rescan_if_stale(os.path.basename(path), path, stat)
+            if self._dirty:
+                self._recount()
+
+    def add_events(self, path, events):
+        """Fold event tuples just appended to a session file into its entry"""
+        name = os.path.basename(path)
+        with self._lock:
+            entry = self.sessions.setdefault(name, new_entry())
+            before = entry['events']
+            add_events_to_entry(entry, events)
+            self._stamp(entry, path)
+            self.total_events += entry['events'] - before
+            self._app_totals = None
+            self._dirty = True
+
+    def touch(self, path):
+        """Record a session file's current mtime and size after it is closed"""
+        name = os.path.basename(path)
+        with self._lock:
+            entry = self.sessions.get(name)
+            if entry is not None:
+                self._stamp(entry, path)
+                self._dirty = True
+
+    def app_totals(self):
+        """Event counts per app across all indexed sessions"""
+        with self._lock:
+            if self._app_totals is None:
+                totals = Counter()
+                for entry in self.sessions.values():
+                    totals.update(entry['apps'])
+                self._app_totals = dict(totals)
+            return dict(self._app_totals)
+
+    def _stamp(self, entry, path):
+        try:
+            stat = os.stat(path)
+            entry['mtime'] = stat.st_mtime
+            entry['size'] = stat.st_size
+        except OSError:
+            pass
+
+    def _recount(self):
+        self.total_events = sum(entry['events'] for entry in self.sessions.values())
+        self._app_totals = None
@@ -0,0 +1,272 @@
+"""
+Session Query
+Streams events out of the session files with optional filters
+
+Files are parsed concurrently on a thread or process pool while results
+are yielded lazily in session order, so memory stays bounded by the few
+files in flight rather than the whole history. Time-range, app and
+event-type filters are pushed down: sessions whose index entry (or session
+ID) puts them outside the requested window are skipped without being
+opened. Compacted archive partitions (see compaction.py) are read first,
+and are skipped the same way using the date range in their name.
+"""
+
+import csv
+import glob
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bursts import BURST_EVENT_TYPE, decode_row
+from event_buffer import iso_to_ns, ns_to_iso
+from session_binary import BINARY_EXTENSION, BinarySessionReader
+
+
+ARCHIVE_FOLDER = 'archive'
+# How far before its ID a session may start: the ID is local wall-clock
+# time, which a DST change or clock correction can put after its events
+SESSION_START_SLACK_NS = 2 * 60 * 60 * 1_000_000_000
+LIVE_SESSION_FILENAME = 'current_session'
+
+
+def session_files(data_folder):
+    """Paths of all CSV and binary session files, oldest session first"""
+    paths = (glob.glob(os.path.join(data_folder, 'session_*.csv')) +
+             glob.glob(os.path.join(data_folder, f'session_*{BINARY_EXTENSION}')))
+    return sorted(paths, key=os.path.basename)
+
+
+def archive_files(data_folder):
+    """Paths of all archive partition files, oldest partition first"""
+    folder = os.path.join(data_folder, ARCHIVE_FOLDER)
+    paths = (glob.glob(os.path.join(folder, 'part_*.csv')) +
+             glob.glob(os.path.join(folder, f'part_*{BINARY_EXTENSION}')))
+    return sorted(paths, key=os.path.basename)
+
+
+def mark_live_session(data_folder, path):
+    """Record the session file a running tracker is writing to"""
+    with open(os.path.join(data_folder, LIVE_SESSION_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump({'session': os.path.basename(path), 'pid': os.getpid()}, f)
+
+
+def clear_live_session(data_folder, path):
+    """Remove the live-session marker if it still names path"""
+    marker = os.path.join(data_folder, LIVE_SESSION_FILENAME)
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            if json.load(f).get('session') != os.path.basename(path):
+                return
+        os.remove(marker)
+    except (OSError, ValueError):
+        pass
+
+
+def live_session(data_folder):
+    """Filename of the session a running tracker is writing to, or None"""
+    try:
+        with open(os.path.join(data_folder, LIVE_SESSION_FILENAME), 'r', encoding='utf-8') as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return marker.get('session') if _process_alive(marker.get('pid')) else None
+
+
+def _process_alive(pid):
+    if not isinstance(pid, int):
+        return False
+    if os.name == 'nt':
+        return True  # os.kill would terminate the process; assume it is still running
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def partition_range_ns(path):
+    """[start, end) of a day (part_YYYYMMDD) or month (part_YYYYMM) partition file"""
+    name = os.path.splitext(os.path.basename(path))[0][len('part_'):]
+    try:
+        if len(name) == 8:
+            start = datetime.strptime(name, '%Y%m%d')
+            end = start + timedelta(days=1)
+        else:
+            start = datetime.strptime(name, '%Y%m')
+            end = (start + timedelta(days=32)).replace(day=1)
+    except ValueError:
+        return None, None
+    return iso_to_ns(start.isoformat()), iso_to_ns(end.isoformat())
+
+
+def read_session_events(path):
+    """Yield every (timestamp_ns, app, event_type, key) tuple in a session or partition file"""
+    if path.endswith(BINARY_EXTENSION):
+        with BinarySessionReader(path) as reader:
+            yield from reader.iter_columns()
+        return
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield iso_to_ns(row['timestamp']), row['app'], row['event_type'], row['key']
+
+
+def to_ns(value):
+    """Accept None, epoch nanoseconds, a datetime or an ISO string"""
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return iso_to_ns(value.isoformat())
+    return iso_to_ns(value)
+
+
+def session_start_ns(path):
+    """Start time encoded in a session filename, or None if it doesn't parse"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        started = datetime.strptime(name[len('session_'):], '%Y%m%d_%H%M%S')
+    except ValueError:
+        return None
+    return iso_to_ns(started.isoformat())
+
+
+def _entry_is_current(entry, path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return entry.get('mtime') == stat.st_mtime and entry.get('size') == stat.st_size
+
+
+def plan_files(data_folder, start_ns=None, end_ns=None, apps=None, event_types=None, index=None):
+    """Session files that may hold matching events
+
+    An up-to-date index entry gives the exact time range; otherwise the
+    range comes from the file name, with SESSION_START_SLACK_NS allowed
+    before a session's ID.
+    """
+    planned = []
+    sessions = index.sessions if index is not None else {}
+
+    for path in archive_files(data_folder) + session_files(data_folder):
+        entry = sessions.get(os.path.basename(path))
+        if entry and entry['events'] and _entry_is_current(entry, path):
+            if start_ns is not None and iso_to_ns(entry['last']) < start_ns:
+                continue
+            if end_ns is not None and iso_to_ns(entry['first']) >= end_ns:
+                continue
+            if apps is not None and apps.isdisjoint(entry['apps']):
+                continue
+            if event_types is not None and event_types.isdisjoint(entry['event_types']):
+                continue
+            planned.append(path)
+            continue
+
+        if os.path.basename(path).startswith('part_'):
+            started, ended = partition_range_ns(path)
+            if start_ns is not None and ended is not None and ended <= start_ns:
+                continue
+        else:
+            started = session_start_ns(path)
+            if started is not None:
+                started -= SESSION_START_SLACK_NS
+        if end_ns is not None and started is not None and started >= end_ns:
+            continue
+
+        planned.append(path)
+    return planned
+
+
+def load_session_file(path, start_ns=None, end_ns=None, apps=None, event_types=None):
+    """Read one session file into a list of matching event dicts
+
+    Burst rows come back with count, end and histogram fields added (see
+    bursts.decode_row).
+    """
+    rows = []
+
+    if path.endswith(BINARY_EXTENSION):
+        with BinarySessionReader(path) as reader:
+            for event in reader.events(start_ns, end_ns):
+                if apps is not None and event['app'] not in apps:
+                    continue
+                if event_types is not None and event['event_type'] not in event_types:
+                    continue
+                if event['event_type'] == BURST_EVENT_TYPE:
+                    decode_row(event)
+                rows.append(event)
+        return rows
+
+    # ISO timestamps in the same layout sort chronologically as strings
+    start_iso = ns_to_iso(start_ns) if start_ns is not None else None
+    end_iso = ns_to_iso(end_ns) if end_ns is not None else None
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if start_iso is not None and row['timestamp'] < start_iso:
+                continue
+            if end_iso is not None and row['timestamp'] >= end_iso:
+                continue
+            if apps is not None and row['app'] not in apps:
+                continue
+            if event_types is not None and row['event_type'] not in event_types:
+                continue
+            if row['event_type'] == BURST_EVENT_TYPE:
+                decode_row(row)
+            rows.append(row)
+    return rows
+
+
+def iter_events(data_folder, start=None, end=None, apps=None, event_types=None,
+                workers=4, executor='thread', index=None):
+    """Yield event dicts in session order, parsing files in parallel
+
+    start/end bound timestamps to [start, end) and accept a datetime, an ISO
+    string or epoch nanoseconds. executor is 'thread' or 'process'; at most
+    2 * workers files are parsed ahead of the consumer.
+    """
+    start_ns = to_ns(start)
+    end_ns = to_ns(end)
+    apps = frozenset(apps) if apps else None
+    event_types = frozenset(event_types) if event_types else None
+
+    paths = plan_files(data_folder, start_ns, end_ns, apps, event_types, index)
+    filters = (start_ns, end_ns, apps, event_types)
+
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            try:
+                rows = load_session_file(path, *filters)
+            except Exception as e:
+                print(f"Warning: Could not load {path}: {e}")
+                continue
+            yield from rows
+        return
+
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    pool = pool_class(max_workers=workers)
+    try:
+        remaining = iter(paths)
+        in_flight = deque()
+        for path in remaining:
+            in_flight.append((path, pool.submit(load_session_file, path, *filters)))
+            if len(in_flight) >= workers * 2:
+                break
+
+        while in_flight:
+            path, future = in_flight.popleft()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                in_flight.append((next_path, pool.submit(load_session_file, next_path, *filters)))
+
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"Warning: Could not load {path}: {e}")
+                continue
+            yield from rows
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,401 @@
+"""
+Storage Backends
+Where ActivityTracker puts sessions and how it reads them back
+
+A backend receives each session's events in batches of
+(timestamp_ns, app, event_type, key) tuples from the autosave path and
+answers the read-side questions (all events, filtered streams, session
+count, totals). Two implementations:
+
+    FileStorage   - one session_<id>.csv (or .atb) per session in the data
+                    folder, with the index.json running totals
+    SQLiteStorage - a single activity.sqlite3 database in WAL mode with
+                    indexed sessions and events tables, plus per-app
+                    totals kept up to date as events are appended
+"""
+
+import csv
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+import session_query
+from bursts import decode_row, event_weight
+from compaction import archived_session_count
+from event_buffer import FIELDS, ns_to_iso
+from session_binary import BINARY_EXTENSION, BinarySessionReader, BinarySessionWriter
+from session_index import SessionIndex
+
+
+STORAGE_FORMATS = ('csv', 'binary', 'sqlite')
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class SessionWriter:
+    """Append-only CSV writer that keeps the session file open between saves"""
+
+    # 'none'  - leave rows in Python's write buffer until the file is closed
+    # 'flush' - hand rows to the OS on every save (survives a crash of the app)
+    # 'fsync' - also force rows onto disk on every save (survives a power cut)
+    FLUSH_POLICIES = ('none', 'flush', 'fsync')
+
+    def __init__(self, path, fieldnames=FIELDS, flush_policy='flush'):
+        if flush_policy not in self.FLUSH_POLICIES:
+            raise ValueError(f"Unknown flush policy: {flush_policy}")
+
+        self.path = path
+        self.fieldnames = fieldnames
+        self.flush_policy = flush_policy
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+
+    def _open(self):
+        """Open the file for appending, writing the header if it is new"""
+        needs_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if needs_header:
+            self._writer.writerow(self.fieldnames)
+
+    def write_events(self, events):
+        """Append (timestamp_ns, app, event_type, key) tuples and apply the flush policy"""
+        if self._file is None:
+            self._open()
+
+        self._writer.writerows(
+            (ns_to_iso(timestamp), app, event_type, key)
+            for timestamp, app, event_type, key in events)
+        self.rows_written += len(events)
+        self.flush()
+
+    def flush(self):
+        """Push buffered rows out according to the flush policy"""
+        if self._file is None or self.flush_policy == 'none':
+            return
+
+        self._file.flush()
+        if self.flush_policy == 'fsync':
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Flush and close the underlying file"""
+        if self._file is None:
+            return
+
+        try:
+            self._file.flush()
+            if self.flush_policy == 'fsync':
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+
+class StorageBackend:
+    """Interface between ActivityTracker and wherever sessions live"""
+
+    # Human-readable location of the current session, for console output
+    session_location = None
+
+    # Bytes appended to disk by append_events, for metrics
+    bytes_written = 0
+
+    def open_session(self, session_id):
+        """Start a new session; later appends belong to it"""
+        raise NotImplementedError
+
+    def append_events(self, events):
+        """Persist a batch of event tuples for the current session"""
+        raise NotImplementedError
+
+    def close_session(self):
+        """Finish the current session, releasing any open handles"""
+        raise NotImplementedError
+
+    def iter_events(self, start=None, end=None, apps=None, event_types=None, **options):
+        """Yield saved event dicts matching the filters"""
+        raise NotImplementedError
+
+    def load_all_sessions(self):
+        """Return every saved event as a list of dicts"""
+        return list(self.iter_events())
+
+    def session_rows(self, session_id):
+        """Number of rows stored for a session (0 if there is none)"""
+        raise NotImplementedError
+
+    def get_session_count(self):
+        raise NotImplementedError
+
+    def total_events(self):
+        raise NotImplementedError
+
+    def app_totals(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        """Reconcile cached metadata with what is stored (may be slow)"""
+
+    def close(self):
+        """Close the current session and the backend"""
+        self.close_session()
+
+
+class FileStorage(StorageBackend):
+    """One CSV or binary file per session, plus the session index"""
+
+    def __init__(self, data_folder, storage_format='csv', flush_policy='flush'):
+        if storage_format not in ('csv', 'binary'):
+            raise ValueError(f"Unknown file format: {storage_format}")
+
+        self.data_folder = data_folder
+        self.storage_format = storage_format
+        self.flush_policy = flush_policy
+        self.index = SessionIndex(data_folder)
+        self.session_location = None
+        self._writer = None
+
+    def _session_path(self, session_id):
+        extension = BINARY_EXTENSION if self.storage_format == 'binary' else '.csv'
+        return os.path.join(self.data_folder, f'session_{session_id}{extension}')
+
+    def open_session(self, session_id):
+        self.close_session()
+        self.session_location = self._session_path(session_id)
+        # Keeps compaction away from the session while it is open, however
+        # long it goes without a write
+        session_query.mark_live_session(self.data_folder, self.session_location)
+        # Reopening an existing session (e.g. journal recovery after a crash
+        # that also lost index updates) must start from accurate totals
+        self.index.validate(self.session_location)
+
+    def append_events(self, events):
+        if self._writer is None:
+            if self.storage_format == 'binary':
+                self._writer = BinarySessionWriter(self.session_location, flush_policy=self.flush_policy)
+            else:
+                self._writer = SessionWriter(self.session_location, FIELDS, self.flush_policy)
+
+        size_before = _file_size(self.session_location)
+        self._writer.write_events(events)
+        self.bytes_written += max(_file_size(self.session_location) - size_before, 0)
+        self.index.add_events(self.session_location, events)
+
+    def close_session(self):
+        if self.session_location is not None:
+            session_query.clear_live_session(self.data_folder, self.session_location)
+        if self._writer is None:
+            return
+
+        try:
+            self._writer.close()
+        finally:
+            self._writer = None
+            self.index.touch(self.session_location)
+            self.index.save()
+
+    def iter_events(self, start=None, end=None, apps=None, event_types=None, **options):
+        return session_query.iter_events(
+            self.data_folder, start=start, end=end, apps=apps, event_types=event_types,
+            index=self.index, **options)
+
+    def session_rows(self, session_id):
+        path = self._session_path(session_id)
+        if not os.path.exists(path):
+            return 0
+        if self.storage_format == 'binary':
+            with BinarySessionReader(path) as reader:
+                return len(reader)
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            return sum(1 for _ in csv.DictReader(f))
+
+    def get_session_count(self):
+        # Compacted sessions live on in the archive partitions
+        return (len(session_query.session_files(self.data_folder)) +
+                archived_session_count(self.data_folder))
+
+    def total_events(self):
+        return self.index.total_events
+
+    def app_totals(self):
+        return self.index.app_totals()
+
+    def refresh(self):
+        self.index.refresh()
+
+
+class SQLiteStorage(StorageBackend):
+    """All sessions in one SQLite database (WAL mode, batched inserts)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT UNIQUE NOT NULL,
+            first_ns INTEGER,
+            last_ns INTEGER,
+            events INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS events (
+            session INTEGER NOT NULL REFERENCES sessions(id),
+            timestamp_ns INTEGER NOT NULL,
+            app TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            key TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS app_totals (
+            app TEXT PRIMARY KEY,
+            events INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS events_by_time ON events(timestamp_ns);
+        CREATE INDEX IF NOT EXISTS events_by_app ON events(app, timestamp_ns);
+        CREATE INDEX IF NOT EXISTS sessions_by_time ON sessions(first_ns, last_ns);
+    """
+
+    def __init__(self, data_folder, filename='activity.sqlite3', flush_policy='flush'):
+        self.data_folder = data_folder
+        self.path = os.path.join(data_folder, filename)
+        self.session_location = self.path
+        self._lock = threading.Lock()
+        self._session_row = None
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # 'fsync' syncs every commit; otherwise WAL only syncs at checkpoints
+        synchronous = 'FULL' if flush_policy == 'fsync' else 'NORMAL'
+        self._conn.execute(f'PRAGMA synchronous={synchronous}')
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+        # Databases from before app_totals existed start with it empty
+        if (self._conn.execute('SELECT 1 FROM events LIMIT 1').fetchone() and
+                not self._conn.execute('SELECT 1 FROM app_totals LIMIT 1').fetchone()):
+            self._count_app_totals()
+
+    def _reader(self):
+        """A separate connection so long reads don't hold the writer's lock"""
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    def open_session(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO sessions (session_id) VALUES (?)', (session_id,))
+            (self._session_row,) = self._conn.execute(
+                'SELECT id FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+
+    def append_events(self, events):
+        if not events or self._session_row is None:
+            return
+
+        timestamps = [event[0] for event in events]
+        # Burst rows count as the keystrokes they stand for
+        apps = Counter()
+        for _, app, event_type, key in events:
+            apps[app] += event_weight(event_type, key)
+        weight = sum(apps.values())
+        session = self._session_row
+        wal_before = _file_size(self.path + '-wal')
+        # One transaction per autosave batch
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO events (session, timestamp_ns, app, event_type, key) VALUES (?, ?, ?, ?, ?)',
+                [(session, *event) for event in events])
+            self._conn.execute(
+                'UPDATE sessions SET events = events + ?, '
+                'first_ns = MIN(COALESCE(first_ns, ?), ?), last_ns = MAX(COALESCE(last_ns, ?), ?) '
+                'WHERE id = ?',
+                (weight, min(timestamps), min(timestamps),
+                 max(timestamps), max(timestamps), session))
+            self._conn.executemany(
+                'INSERT INTO app_totals (app, events) VALUES (?, ?) '
+                'ON CONFLICT(app) DO UPDATE SET events = events + excluded.events',
+                apps.items())
+        # The WAL shrinks back at checkpoints, so only count growth
+        self.bytes_written += max(_file_size(self.path + '-wal') - wal_before, 0)
+
+    def close_session(self):
+        self._session_row = None
+
+    def iter_events(self, start=None, end=None, apps=None, event_types=None, **options):
+        clauses = []
+        params = []
+        start_ns = session_query.to_ns(start)
+        end_ns = session_query.to_ns(end)
+        if start_ns is not None:
+            clauses.append('timestamp_ns >= ?')
+            params.append(start_ns)
+        if end_ns is not None:
+            clauses.append('timestamp_ns < ?')
+            params.append(end_ns)
+        for column, values in (('app', apps), ('event_type', event_types)):
+            if values:
+                values = list(values)
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+
+        query = 'SELECT timestamp_ns, app, event_type, key FROM events'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY session, rowid'
+
+        conn = self._reader()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                for timestamp, app, event_type, key in rows:
+                    yield decode_row({'timestamp': ns_to_iso(timestamp), 'app': app,
+                                      'event_type': event_type, 'key': key})
+        finally:
+            conn.close()
+
+    def session_rows(self, session_id):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM events JOIN sessions ON events.session = sessions.id '
+                'WHERE sessions.session_id = ?', (session_id,)).fetchone()[0]
+
+    def get_session_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions WHERE events > 0').fetchone()[0]
+
+    def total_events(self):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(events), 0) FROM sessions').fetchone()[0]
+
+    def app_totals(self):
+        with self._lock:
+            return dict(self._conn.execute('SELECT app, events FROM app_totals'))
+
+    def _count_app_totals(self):
+        """Recount the per-app totals from the events table (a full scan)"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM app_totals')
+            self._conn.execute(
+                "INSERT INTO app_totals (app, events) "
+                "SELECT app, SUM(CASE WHEN event_type = 'burst' THEN json_extract(key, '$.n') ELSE 1 END) "
+                "FROM events GROUP BY app")
+
+    def close(self):
+        self.close_session()
+        with self._lock:
+            self._conn.close()
+
+
+def make_storage(data_folder, storage_format='csv', flush_policy='flush'):
+    """Create the backend for a storage format name"""
+    if storage_format == 'sqlite':
+        return SQLiteStorage(data_folder, flush_policy=flush_policy)
+    if storage_format in ('csv', 'binary'):
+        return FileStorage(data_folder, storage_format, flush_policy)
+    raise ValueError(f"Unknown storage format: {storage_format} (expected one of {STORAGE_FORMATS})")
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# The tracker's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_buffer import iso_to_ns  # noqa: E402
+
+SECOND = 1_000_000_000
+
+
+def _make_events(start, count, first=0, apps=('Editor',), step=SECOND):
+    """Keystroke tuples i = first..first+count-1, step apart from start
+
+    start is an ISO string or epoch nanoseconds; apps and keys cycle with i.
+    """
+    base = iso_to_ns(start) if isinstance(start, str) else start
+    return [(base + i * step, apps[i % len(apps)], 'keystroke', chr(97 + i % 26))
+            for i in range(first, first + count)]
+
+
+@pytest.fixture
+def make_events():
+    return _make_events
@@ -0,0 +1,80 @@
+import pytest
+
+import analysis
+from bursts import encode_burst_key
+from event_buffer import iso_to_ns
+from storage import FileStorage
+
+
+SECOND = 1_000_000_000
+BASE = '2024-01-02T09:00:00'
+
+
+@pytest.fixture(params=[False, True], ids=['arrays', 'numpy'])
+def use_numpy(request):
+    if request.param and not analysis.NUMPY_AVAILABLE:
+        pytest.skip('NumPy is not installed')
+    return request.param
+
+
+@pytest.fixture(params=['csv', 'binary'])
+def folder(tmp_path, request):
+    base = iso_to_ns(BASE)
+    storage = FileStorage(str(tmp_path), request.param)
+    storage.open_session('20240102_090000')
+    storage.append_events([
+        (base, 'Editor', 'keystroke', 'a'),
+        (base + 1 * SECOND, 'Editor', 'keystroke', 'b'),
+        (base + 2 * SECOND, 'Editor', 'keystroke', 'c'),
+        (base + 10 * SECOND, 'Browser', 'click', 'left'),
+        (base + 20 * SECOND, 'Editor', 'burst', encode_burst_key(5, 4 * SECOND)),
+        # A 176 s pause after the burst ends is idle with a 60 s threshold
+        (base + 200 * SECOND, 'Editor', 'keystroke', 'd'),
+        (base + 230 * SECOND, 'Mail', 'keystroke', 'e'),
+    ])
+    storage.close_session()
+    return str(tmp_path)
+
+
+def test_gaps_are_measured_from_the_end_of_bursts(folder, use_numpy):
+    columns = analysis.load_columns(folder, use_numpy=use_numpy)
+    assert [int(gap) // SECOND for gap in analysis.gaps(columns)] == [1, 1, 8, 10, 176, 30]
+
+    distribution = analysis.gap_distribution(columns)
+    assert distribution['gaps'] == 6
+    assert {bucket: count for bucket, count in distribution['buckets'].items() if count} == \
+        {'<=1s': 2, '<=10s': 2, '<=30s': 1, '<=300s': 1}
+    assert (distribution['p50_s'], distribution['max_s']) == (8.0, 176.0)
+
+
+def test_active_time_and_dwell(folder, use_numpy):
+    columns = analysis.load_columns(folder, use_numpy=use_numpy)
+    assert analysis.active_time(columns, idle_threshold=60) == {
+        'span_s': 230.0, 'active_s': 54.0, 'idle_s': 176.0, 'idle_gaps': 1, 'active_periods': 2}
+
+    dwell = analysis.app_dwell(columns, idle_threshold=60)
+    assert list(dwell) == ['Editor', 'Browser', 'Mail']
+    # The burst's credit is capped at the idle threshold, not the 180 s to the next row
+    assert dwell['Editor'] == {'seconds': 100.0, 'visits': 2, 'events': 9}
+    assert dwell['Browser'] == {'seconds': 10.0, 'visits': 1, 'events': 1}
+    assert dwell['Mail'] == {'seconds': 0.0, 'visits': 1, 'events': 1}
+
+
+def test_summary_counts_burst_keystrokes_per_minute(folder, use_numpy):
+    columns = analysis.load_columns(folder, use_numpy=use_numpy)
+    first, rate = analysis.events_per_minute(columns)
+    assert first == iso_to_ns(BASE)
+    assert [int(count) for count in rate] == [9, 0, 0, 2]
+
+    summary = analysis.summarize(columns, idle_threshold=60)
+    assert (summary['rows'], summary['events']) == (7, 11)
+    assert summary['first'] == BASE
+    assert summary['per_minute'] == {'minutes': 4, 'active_minutes': 2, 'peak': 9, 'mean_active': 5.5}
+
+
+def test_filters_apply_while_loading(folder, use_numpy):
+    columns = analysis.load_columns(folder, start='2024-01-02T09:00:05', apps=['Editor'],
+                                    use_numpy=use_numpy)
+    assert len(columns) == 2
+    assert int(sum(columns.weights)) == 6
+    assert len(analysis.load_columns(folder, end=BASE, use_numpy=use_numpy)) == 0
@@ -0,0 +1,83 @@
+from app_resolver import AppResolver, FakeWindowSource
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _resolver(apps, notify=True, **kwargs):
+    source = FakeWindowSource(apps, notify=notify)
+    clock = FakeClock()
+    return AppResolver(source, clock=clock, **kwargs), source, clock
+
+
+def test_cached_name_is_reused_until_the_ttl_runs_out():
+    resolver, source, clock = _resolver({1: 'Editor'}, notify=False, ttl=0.25)
+    assert resolver.max_age == 0.25
+    assert [resolver.resolve() for _ in range(3)] == ['Editor'] * 3
+    assert source.foreground_calls == 1
+    assert resolver.hits == 2
+
+    clock.now = 0.3
+    resolver.resolve()
+    assert source.foreground_calls == 2
+
+
+def test_without_notifications_focus_changes_show_after_the_ttl():
+    resolver, source, clock = _resolver({1: 'Editor', 2: 'Browser'}, notify=False, ttl=0.25)
+    assert resolver.resolve() == 'Editor'
+    source.focus(2)
+    assert resolver.resolve() == 'Editor'
+    clock.now = 0.25
+    assert resolver.resolve() == 'Browser'
+
+
+def test_focus_notification_invalidates_before_the_ttl():
+    resolver, source, clock = _resolver({1: 'Editor', 2: 'Browser'}, notify_ttl=1.0)
+    assert resolver.notifications and resolver.max_age == 1.0
+    assert resolver.resolve() == 'Editor'
+    source.focus(2)
+    assert resolver.resolve() == 'Browser'
+    assert source.foreground_calls == 2
+
+
+def test_notifications_can_be_turned_off():
+    resolver, source, _ = _resolver({1: 'Editor', 2: 'Browser'}, notifications=False, ttl=0.25)
+    assert not resolver.notifications and resolver.max_age == 0.25
+    resolver.resolve()
+    source.focus(2)
+    assert resolver.resolve() == 'Editor'
+
+
+def test_process_names_are_kept_in_a_bounded_lru():
+    apps = {pid: f'App{pid}' for pid in range(1, 5)}
+    resolver, source, clock = _resolver(apps, notify=False, ttl=0.0, cache_size=2)
+
+    def visit(pid):
+        source.focus(pid)
+        clock.now += 1
+        return resolver.resolve()
+
+    assert [visit(1), visit(2), visit(1)] == ['App1', 'App2', 'App1']
+    assert source.name_calls == 2
+    # 3 evicts the least recently used pid, which is 2 rather than 1
+    visit(3)
+    visit(1)
+    assert source.name_calls == 3
+    visit(2)
+    assert source.name_calls == 4
+    assert list(resolver._names) == [1, 2]
+
+
+def test_lookup_errors_resolve_to_unknown():
+    resolver, source, _ = _resolver({1: 'Editor'}, notify=False)
+
+    def broken():
+        raise OSError('no window server')
+
+    source.foreground = broken
+    assert resolver.resolve() == 'Unknown'
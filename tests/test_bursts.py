@@ -0,0 +1,106 @@
+import contextlib
+import io
+
+import pytest
+
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver, FakeWindowSource
+from bursts import (BurstCoalescer, decode_burst_key, decode_row, encode_burst_key,
+                    event_weight)
+from event_buffer import ns_to_iso
+
+
+SECOND = 1_000_000_000
+START = 1_700_000_000 * SECOND
+
+
+def _coalescer(**options):
+    rows = []
+    coalescer = BurstCoalescer(lambda *row: rows.append(row), **options)
+    return coalescer, rows
+
+
+def _bursts(rows):
+    return [(start, app, decode_burst_key(key)['n']) for start, app, _, key in rows]
+
+
+def test_gap_closes_the_burst_at_exactly_gap_seconds():
+    coalescer, rows = _coalescer(gap=2.0)
+    for offset in (0, 1.999, 3.998, 5.998):
+        coalescer.add(START + int(offset * SECOND), 'Editor', 'a')
+    assert _bursts(rows) == [(START, 'Editor', 3)]
+    coalescer.flush()
+    assert _bursts(rows)[1] == (START + int(5.998 * SECOND), 'Editor', 1)
+
+
+def test_app_change_closes_the_burst():
+    coalescer, rows = _coalescer()
+    coalescer.add(START, 'Editor', 'a')
+    coalescer.add(START + SECOND // 10, 'Browser', 'b')
+    coalescer.add(START + SECOND // 5, 'Editor', 'c')
+    coalescer.flush()
+    assert [app for _, app, _ in _bursts(rows)] == ['Editor', 'Browser', 'Editor']
+
+
+def test_max_duration_splits_continuous_typing():
+    coalescer, rows = _coalescer(gap=2.0, max_duration=10.0)
+    for i in range(25):
+        coalescer.add(START + i * SECOND, 'Editor', 'a')
+    coalescer.flush()
+    assert [count for _, _, count in _bursts(rows)] == [10, 10, 5]
+    assert decode_burst_key(rows[0][3])['ms'] == 9000
+
+
+def test_close_idle_waits_for_the_gap():
+    coalescer, rows = _coalescer(gap=2.0)
+    coalescer.add(START, 'Editor', 'a')
+    coalescer.close_idle(START + SECOND)
+    assert rows == []
+    coalescer.close_idle(START + 2 * SECOND)
+    assert len(rows) == 1
+    coalescer.add(START + 3 * SECOND, 'Editor', 'a')
+    coalescer.reset()
+    coalescer.flush()
+    assert len(rows) == 1
+
+
+@pytest.mark.parametrize('histogram, field, expected', [
+    ('class', 'classes', {'letter': 2, 'digit': 1, 'editing': 1}),
+    ('key', 'keys', {'a': 1, 'b': 1, '7': 1, 'backspace': 1}),
+])
+def test_histograms(histogram, field, expected):
+    coalescer, rows = _coalescer(histogram=histogram)
+    for i, key in enumerate(['a', 'b', '7', 'backspace']):
+        coalescer.add(START + i * SECOND // 10, 'Editor', key)
+    coalescer.flush()
+    burst = decode_burst_key(rows[0][3])
+    assert burst[field] == expected
+    assert sum(burst[field].values()) == burst['n'] == 4
+
+
+def test_unknown_histogram_is_rejected():
+    with pytest.raises(ValueError):
+        BurstCoalescer(lambda *row: None, histogram='bigram')
+
+
+def test_weights_and_row_decoding():
+    key = encode_burst_key(12, 1_500_000_000, classes={'letter': 12})
+    assert decode_burst_key(key) == {'n': 12, 'ms': 1500, 'classes': {'letter': 12}}
+    assert event_weight('burst', key) == 12
+    assert event_weight('keystroke', 'a') == 1
+    assert event_weight('burst', 'not json') == 1
+
+    row = decode_row({'timestamp': ns_to_iso(START), 'app': 'Editor',
+                      'event_type': 'burst', 'key': key})
+    assert row['count'] == 12
+    assert row['end'] == ns_to_iso(START + 1_500_000_000)
+    assert row['classes'] == {'letter': 12}
+    click = {'timestamp': ns_to_iso(START), 'app': 'Editor', 'event_type': 'click', 'key': 'left'}
+    assert decode_row(dict(click)) == click
+
+
+def test_tracker_keeps_key_classes_by_default(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = ActivityTracker(record_mode='burst', data_folder=str(tmp_path), verbosity=0,
+                                  app_resolver=AppResolver(FakeWindowSource({1: 'Editor'})))
+    assert tracker.bursts.histogram == 'class'
@@ -0,0 +1,128 @@
+import os
+import time
+
+import compaction
+import merge_datasets
+import session_query
+from event_buffer import iso_to_ns
+from journal import JOURNAL_FILENAME, EventJournal
+from storage import FileStorage
+
+
+def _age(path, seconds=3600):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_idle_live_session_is_not_compacted(tmp_path, make_events):
+    folder = str(tmp_path)
+    storage = FileStorage(folder)
+    storage.open_session('20240102_090000')
+    storage.append_events(make_events('2024-01-02T09:00:00', 5))
+    # A tracker left running but idle: the file stops changing
+    _age(storage.session_location)
+
+    assert compaction.compact(folder)['sessions'] == 0
+    assert os.path.exists(storage.session_location)
+
+    storage.append_events(make_events('2024-01-02T09:30:00', 3))
+    storage.close_session()
+    assert session_query.live_session(folder) is None
+    _age(storage.session_location)
+
+    assert compaction.compact(folder)['events'] == 8
+    assert not session_query.session_files(folder)
+    assert len(list(session_query.iter_events(folder))) == 8
+
+
+def test_marker_of_dead_tracker_is_ignored(tmp_path, make_events):
+    folder = str(tmp_path)
+    storage = FileStorage(folder)
+    storage.open_session('20240102_090000')
+    storage.append_events(make_events('2024-01-02T09:00:00', 2))
+    storage.close_session()
+    path = storage.session_location
+    _age(path)
+
+    # Left behind by a tracker that was killed
+    marker = os.path.join(folder, session_query.LIVE_SESSION_FILENAME)
+    with open(marker, 'w', encoding='utf-8') as f:
+        f.write('{"session": "%s", "pid": 999999999}' % os.path.basename(path))
+
+    assert compaction.closed_sessions(folder) == [path]
+
+
+def test_session_with_unreplayed_journal_is_skipped(tmp_path, make_events):
+    folder = str(tmp_path)
+    storage = FileStorage(folder)
+    storage.open_session('20240102_090000')
+    saved = make_events('2024-01-02T09:00:00', 4)
+    storage.append_events(saved)
+    storage.close_session()
+    path = storage.session_location
+    _age(path)
+
+    # A crash left two rows in the journal that never reached the file
+    journal = EventJournal(os.path.join(folder, JOURNAL_FILENAME), 4096)
+    journal.begin('20240102_090000')
+    for event in saved + make_events('2024-01-02T09:10:00', 2):
+        journal.append(*event)
+    journal.mark_saved(len(saved))
+    journal.close()
+
+    assert compaction.closed_sessions(folder) == []
+
+    # Once replayed (marked saved) the session can be compacted
+    journal = EventJournal(os.path.join(folder, JOURNAL_FILENAME), 4096)
+    journal.close()
+    assert compaction.closed_sessions(folder) == [path]
+
+
+def test_batches_merge_into_one_ordered_partition(tmp_path, monkeypatch, make_events):
+    folder = str(tmp_path)
+    storage = FileStorage(folder)
+    # Interleaved sessions, so each batch lands in the middle of the partition
+    for number in range(6):
+        storage.open_session(f'20240102_0{number}0000')
+        storage.append_events(make_events(f'2024-01-02T0{number}:00:00', 3) +
+                              make_events(f'2024-01-02T1{5 - number}:00:00', 3))
+        storage.close_session()
+        _age(storage.session_location)
+
+    staged = []
+    stage = compaction.Archive._stage
+    monkeypatch.setattr(compaction.Archive, '_stage',
+                        lambda self, path, *args: staged.append(path) or stage(self, path, *args))
+    assert compaction.compact(folder, batch_sessions=2)['events'] == 36
+
+    # Three batches, but the partition is written once
+    assert [os.path.basename(path) for path in staged] == ['part_20240102.csv']
+    timestamps = [event['timestamp'] for event in session_query.iter_events(folder)]
+    assert len(timestamps) == 36 and timestamps == sorted(timestamps)
+    assert not [name for name in os.listdir(os.path.join(folder, 'archive')) if name.endswith('.tmp')]
+
+
+def test_merged_dataset_keeps_its_host_column(tmp_path, make_events):
+    source = str(tmp_path / 'desk')
+    os.makedirs(source)
+    storage = FileStorage(source)
+    storage.open_session('20240102_090000')
+    storage.append_events(make_events('2024-01-02T09:00:00', 4) +
+                          [(iso_to_ns('2024-01-02T09:00:30'), 'Editor', 'click', 'left')])
+    storage.close_session()
+    merged = str(tmp_path / 'merged')
+    merge_datasets.merge([('desk', source)], merged)
+
+    # A local session compacted into the merged partition, then downsampled
+    storage = FileStorage(merged)
+    storage.open_session('20240102_100000')
+    storage.append_events(make_events('2024-01-02T10:00:00', 2, apps=('Mail',)))
+    storage.close_session()
+    _age(storage.session_location)
+    compaction.compact(merged, downsample_after_days=1)
+
+    rows = list(session_query.iter_events(merged))
+    assert [(row['app'], row['event_type'], row['host']) for row in rows] == [
+        ('Editor', 'burst', 'desk'), ('Editor', 'click', 'desk'), ('Mail', 'burst', '')]
+    summary = compaction.read_manifest(merged)['part_20240102.csv']
+    assert summary['downsampled'] and summary['hosts'] == {'desk': 2, '': 1}
@@ -0,0 +1,78 @@
+import contextlib
+import io
+
+import pytest
+
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver, FakeWindowSource
+
+
+SECOND = 1_000_000_000
+START = 1_700_000_000 * SECOND
+
+
+def _tracker(folder, verbosity):
+    source = FakeWindowSource({1: 'Editor', 2: 'Browser'})
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = ActivityTracker(autosave_interval=3600, app_resolver=AppResolver(source),
+                                  data_folder=folder, verbosity=verbosity, console_interval=10)
+        tracker.start_tracking()
+        # Record on the test's thread, the way the GUI does once the worker stops
+        tracker.event_pipeline.stop()
+    return tracker, source
+
+
+def _typed(tracker, seconds):
+    """Output printed while typing one key per second for `seconds` seconds"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for i in range(seconds):
+            tracker.enqueue_event('keystroke', 'a', timestamp=START + i * SECOND)
+    return output.getvalue().splitlines()
+
+
+def test_quiet_prints_nothing_per_event(tmp_path):
+    tracker, _ = _tracker(str(tmp_path), verbosity=0)
+    assert _typed(tracker, 25) == []
+
+
+def test_summary_prints_once_per_console_interval(tmp_path):
+    tracker, _ = _tracker(str(tmp_path), verbosity=1)
+    lines = _typed(tracker, 25)
+    assert lines[0].startswith('>>> First event recorded')
+    summaries = lines[1:]
+    assert len(summaries) == 2
+    assert '11 events (Editor 11) | session total 11' in summaries[0]
+    assert '10 events (Editor 10) | session total 21' in summaries[1]
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tracker.stop_tracking()
+    assert '4 events (Editor 4) | session total 25' in output.getvalue()
+
+
+def test_verbose_prints_every_event(tmp_path):
+    tracker, _ = _tracker(str(tmp_path), verbosity=2)
+    lines = _typed(tracker, 3)
+    assert lines[1:] == ['[Editor] keystroke: a'] * 3
+
+
+def test_snapshots_are_replaced_not_mutated(tmp_path):
+    tracker, source = _tracker(str(tmp_path), verbosity=0)
+    before = tracker.snapshot
+    assert before.tracking and before.events == 0 and before.apps == {}
+
+    _typed(tracker, 2)
+    source.focus(2)
+    tracker.enqueue_event('click', 'left', timestamp=START + 5 * SECOND)
+    after = tracker.snapshot
+    assert after is not before
+    assert before.events == 0 and before.apps == {}
+    assert after.events == 3 and after.apps == {'Editor': 2, 'Browser': 1}
+    with pytest.raises(AttributeError):
+        after.events = 0
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker.stop_tracking()
+    assert not tracker.snapshot.tracking
+    assert tracker.snapshot.session_id == after.session_id
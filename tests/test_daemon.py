@@ -0,0 +1,71 @@
+import contextlib
+import io
+import os
+import threading
+
+import pytest
+
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver, FakeWindowSource
+from daemon import TrackerDaemon, send_command
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    # Signal handlers can only be installed from the main thread
+    monkeypatch.setattr(TrackerDaemon, 'install_signal_handlers', lambda self: None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = ActivityTracker(app_resolver=AppResolver(FakeWindowSource({1: 'Editor'})),
+                                  data_folder=folder)
+        daemon = TrackerDaemon(tracker, folder)
+        thread = threading.Thread(target=daemon.run, kwargs={'start': False})
+        thread.start()
+        while daemon.ready_ns is None:
+            thread.join(0.01)
+        yield daemon
+        if thread.is_alive():
+            send_command(folder, 'quit')
+        thread.join(5)
+
+
+def test_start_stop_and_status_commands(daemon):
+    folder = daemon.data_folder
+    status = send_command(folder, 'status')
+    assert not status['tracking'] and status['ready_ms'] is not None
+
+    status = send_command(folder, 'start')
+    assert status['tracking'] and status['session_id']
+    daemon.tracker.record_event('keystroke', 'a')
+    daemon.tracker.event_pipeline.drain()
+    assert send_command(folder, 'status')['events'] == 1
+    # Repeating a command is harmless
+    assert send_command(folder, 'start')['session_id'] == status['session_id']
+
+    assert not send_command(folder, 'stop')['tracking']
+    assert not send_command(folder, 'stop')['tracking']
+
+
+def test_unknown_command_lists_the_valid_ones(daemon):
+    reply = send_command(daemon.data_folder, 'restart')
+    assert 'error' in reply
+    assert reply['commands'] == ['start', 'stop', 'status', 'quit']
+
+
+def test_quit_stops_tracking_and_removes_the_socket(daemon):
+    folder = daemon.data_folder
+    send_command(folder, 'start')
+    assert not send_command(folder, 'quit')['tracking']
+    for _ in range(500):
+        if not os.path.exists(daemon.address):
+            break
+        threading.Event().wait(0.01)
+    assert not os.path.exists(daemon.address)
+    with pytest.raises(OSError):
+        send_command(folder, 'status', timeout=1.0)
+
+
+def test_second_daemon_refuses_a_live_socket(daemon):
+    other = TrackerDaemon(daemon.tracker, daemon.data_folder)
+    with pytest.raises(RuntimeError):
+        other.open_control_socket()
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from event_buffer import EventBuffer, iso_to_ns, ns_to_iso
+
+
+APPS = ('Editor', 'Browser', 'Mail')
+
+
+def test_spilled_events_read_back_in_order(tmp_path, make_events):
+    spill_dir = str(tmp_path / 'spill')
+    buffer = EventBuffer(max_memory_events=4, spill_dir=spill_dir)
+    events = make_events('2024-01-02T09:00:00', 10, apps=APPS)
+    for event in events:
+        buffer.append_event(*event)
+
+    assert len(buffer) == 10
+    assert buffer.spilled_chunks == 2
+    assert len(os.listdir(spill_dir)) == 2
+    # Only the unspilled tail stays in memory
+    assert buffer.memory_bytes == 2 * (8 + 4 + 2 + 4)
+    assert list(buffer.iter_columns()) == events
+    assert list(buffer.iter_columns(5)) == events[5:]
+
+
+def test_indexing_spans_chunks_and_memory(tmp_path, make_events):
+    buffer = EventBuffer(max_memory_events=3, spill_dir=str(tmp_path))
+    events = make_events('2024-01-02T09:00:00', 8, apps=APPS)
+    for event in events:
+        buffer.append_event(*event)
+
+    assert buffer[0]['timestamp'] == ns_to_iso(events[0][0])
+    assert buffer[4]['app'] == events[4][1]
+    assert buffer[-1]['key'] == events[-1][3]
+    assert [event['key'] for event in buffer[2:7]] == [event[3] for event in events[2:7]]
+    with pytest.raises(IndexError):
+        buffer[8]
+
+
+def test_clear_removes_spilled_chunks(tmp_path, make_events):
+    buffer = EventBuffer(max_memory_events=2, spill_dir=str(tmp_path))
+    for event in make_events('2024-01-02T09:00:00', 5):
+        buffer.append_event(*event)
+    buffer.clear()
+
+    assert len(buffer) == 0 and buffer.spilled_chunks == 0
+    assert os.listdir(str(tmp_path)) == []
+    buffer.append_event(*make_events('2024-01-02T10:00:00', 1)[0])
+    assert len(list(buffer)) == 1
+
+
+def test_dict_events_round_trip_through_iso():
+    buffer = EventBuffer()
+    event = {'timestamp': '2024-01-02T09:00:00.123456', 'app': 'Editor',
+             'event_type': 'click', 'key': 'left'}
+    buffer.append(event)
+    assert list(buffer) == [event]
+    assert next(buffer.iter_columns())[0] == iso_to_ns(event['timestamp'])
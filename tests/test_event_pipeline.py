@@ -0,0 +1,68 @@
+import pytest
+
+from activity_tracker import EventPipeline
+
+
+def _pipeline(policy, capacity=3, max_batch=1000):
+    batches = []
+    return EventPipeline(batches.append, capacity=capacity, overflow_policy=policy,
+                         max_batch=max_batch), batches
+
+
+def test_drop_newest_keeps_the_queued_events():
+    pipeline, batches = _pipeline('drop_newest')
+    accepted = [pipeline.put(i) for i in range(5)]
+    assert accepted == [True, True, True, False, False]
+    pipeline.drain()
+    assert batches == [[0, 1, 2]]
+    assert (pipeline.enqueued, pipeline.processed, pipeline.dropped) == (3, 3, 2)
+
+
+def test_drop_oldest_makes_room_for_new_events():
+    pipeline, batches = _pipeline('drop_oldest')
+    assert all(pipeline.put(i) for i in range(5))
+    pipeline.drain()
+    assert batches == [[2, 3, 4]]
+    assert (pipeline.enqueued, pipeline.processed, pipeline.dropped) == (5, 3, 2)
+    assert pipeline.high_water == 3
+
+
+def test_drain_splits_into_max_batch_chunks():
+    pipeline, batches = _pipeline('drop_oldest', capacity=100, max_batch=4)
+    for i in range(10):
+        pipeline.put(i)
+    pipeline.drain()
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert pipeline.pending == 0
+
+
+def test_handler_error_does_not_lose_later_batches(capsys):
+    seen = []
+
+    def handler(batch):
+        seen.append(batch)
+        if len(seen) == 1:
+            raise RuntimeError('boom')
+
+    pipeline = EventPipeline(handler, max_batch=2)
+    for i in range(4):
+        pipeline.put(i)
+    pipeline.drain()
+    assert seen == [[0, 1], [2, 3]]
+    assert 'boom' in capsys.readouterr().out
+
+
+def test_stop_processes_everything_queued():
+    pipeline, batches = _pipeline('drop_oldest', capacity=100)
+    pipeline.batch_interval = 60
+    pipeline.start()
+    for i in range(5):
+        pipeline.put(i)
+    pipeline.stop()
+    assert not pipeline.running
+    assert sum(batches, []) == [0, 1, 2, 3, 4]
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        EventPipeline(lambda batch: None, overflow_policy='block')
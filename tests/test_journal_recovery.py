@@ -0,0 +1,88 @@
+import contextlib
+import io
+from collections import Counter
+
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver, FakeWindowSource
+from bursts import event_weight
+from session_query import iter_events
+
+APPS = {1: 'Editor', 2: 'Browser'}
+SECOND = 1_000_000_000
+
+
+def _tracker(folder):
+    source = FakeWindowSource(APPS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = ActivityTracker(autosave_interval=5, record_mode='burst',
+                                  app_resolver=AppResolver(source), data_folder=folder)
+    return tracker, source
+
+
+def _stored_app_totals(folder):
+    totals = Counter()
+    for event in iter_events(folder):
+        totals[event['app']] += event_weight(event['event_type'], event['key'])
+    return totals
+
+
+def test_burst_recovery_matches_stored_rows(tmp_path):
+    folder = str(tmp_path)
+    tracker, source = _tracker(folder)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker.start_tracking()
+        now = 1_700_000_000 * SECOND
+        # Bursts that span auto-saves, app switches and clicks
+        for i in range(400):
+            if i % 50 == 0:
+                source.focus(1 + (i // 50) % 2)
+            if i % 37 == 0:
+                tracker.record_event('click', 'left', timestamp=now)
+            tracker.record_event('keystroke', 'a', timestamp=now)
+            now += SECOND // 4 if i % 60 else 3 * SECOND
+        # Killed: the pending rows only live on in the journal
+        tracker.event_pipeline.stop()
+
+    recovered, _ = _tracker(folder)
+    stored = _stored_app_totals(folder)
+    assert sum(stored.values()) > 0
+    assert dict(recovered.rollups.top_apps()) == dict(stored)
+
+
+def test_open_burst_is_recovered_from_its_checkpoint(tmp_path):
+    folder = str(tmp_path)
+    tracker, _ = _tracker(folder)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker.start_tracking()
+        tracker.event_pipeline.stop()
+        now = 1_700_000_000 * SECOND
+        for i in range(30):
+            tracker.enqueue_event('keystroke', 'a', timestamp=now + i * SECOND // 10)
+    # Killed mid-burst: no burst row has been stored yet
+    assert len(tracker.session_events) == 0
+
+    recovered, _ = _tracker(folder)
+    rows = list(iter_events(folder))
+    assert [(row['event_type'], row['count']) for row in rows] == [('burst', 30)]
+    assert dict(recovered.rollups.top_apps()) == {'Editor': 30}
+
+
+def test_rows_saved_before_a_crash_are_not_replayed(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    tracker, _ = _tracker(folder)
+    tracker.bursts = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker.start_tracking()
+        tracker.event_pipeline.stop()
+        now = 1_700_000_000 * SECOND
+        for i in range(10):
+            tracker.enqueue_event('keystroke', 'a', timestamp=now + i * SECOND)
+        tracker.save_session()
+        # Killed after the next save reached storage, before it was marked saved
+        monkeypatch.setattr(tracker.journal, 'mark_saved', lambda count: None)
+        for i in range(10, 15):
+            tracker.enqueue_event('click', 'left', timestamp=now + i * SECOND)
+        tracker.save_session()
+
+    _tracker(folder)
+    assert len(list(iter_events(folder))) == 15
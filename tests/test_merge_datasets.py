@@ -0,0 +1,92 @@
+import csv
+import os
+from collections import Counter
+
+import merge_datasets
+import session_query
+from compaction import read_manifest
+from event_buffer import FIELDS
+
+
+def _write_session(folder, session_id, rows):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f'session_{session_id}.csv'), 'w', newline='',
+              encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        writer.writerows((timestamp, app, 'keystroke', 'a') for timestamp, app in rows)
+
+
+def test_merge_across_a_day_boundary(tmp_path):
+    laptop = str(tmp_path / 'laptop')
+    desk = str(tmp_path / 'desk')
+    _write_session(laptop, '20240101_235000', [
+        ('2024-01-01T23:50:00', 'Editor'),
+        ('2024-01-01T23:59:58', 'Editor'),
+        ('2024-01-02T00:00:03', 'Editor'),
+    ])
+    # Started after a clock correction: the ID is a minute past the first event
+    _write_session(laptop, '20240102_000100', [
+        ('2024-01-02T00:00:01', 'Browser'),
+        ('2024-01-02T00:05:00', 'Browser'),
+    ])
+    # The clock stepped back by hours - further than any lower-bound slack
+    _write_session(laptop, '20240102_040000', [
+        ('2024-01-01T23:59:59', 'Terminal'),
+        ('2024-01-02T04:00:00', 'Terminal'),
+    ])
+    _write_session(desk, '20240101_235959', [
+        ('2024-01-01T23:59:59.500000', 'Mail'),
+        ('2024-01-02T00:00:02', 'Mail'),
+    ])
+
+    output = str(tmp_path / 'merged')
+    result = merge_datasets.merge([('laptop', laptop), ('desk', desk)], output)
+    assert result['events'] == 9
+
+    days = {}
+    for path in session_query.archive_files(output):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        day = os.path.basename(path)[len('part_'):-len('.csv')]
+        assert all(row['timestamp'][:10].replace('-', '') == day for row in rows)
+        assert [row['timestamp'] for row in rows] == sorted(row['timestamp'] for row in rows)
+        days[day] = rows
+    assert sorted(days) == ['20240101', '20240102']
+    assert len(days['20240101']) == 4
+    assert len(days['20240102']) == 5
+
+    manifest = read_manifest(output)
+    assert manifest['part_20240101.csv']['events'] == 4
+    assert manifest['part_20240101.csv']['hosts'] == {'laptop': 3, 'desk': 1}
+    assert 'laptop/20240102_040000' in manifest['part_20240101.csv']['sessions']
+
+    merged = Counter((event['app'], event['host']) for event in session_query.iter_events(output))
+    assert merged == Counter({('Editor', 'laptop'): 3, ('Browser', 'laptop'): 2,
+                              ('Terminal', 'laptop'): 2, ('Mail', 'desk'): 2})
+
+
+def test_merged_dataset_merges_again(tmp_path):
+    laptop = str(tmp_path / 'laptop')
+    _write_session(laptop, '20240101_235000', [
+        ('2024-01-01T23:50:00', 'Editor'),
+        ('2024-01-02T00:00:03', 'Editor'),
+    ])
+    first = str(tmp_path / 'first')
+    merge_datasets.merge([('laptop', laptop)], first)
+
+    desk = str(tmp_path / 'desk')
+    _write_session(desk, '20240101_235959', [
+        ('2024-01-01T23:59:59', 'Mail'),
+        ('2024-01-02T00:00:01', 'Mail'),
+    ])
+    # The first merge's partitions are streamed as sources of their own
+    second = str(tmp_path / 'second')
+    result = merge_datasets.merge([('fleet', first), ('desk', desk)], second)
+    assert result['events'] == 4
+
+    events = list(session_query.iter_events(second))
+    assert [(event['app'], event['host']) for event in events] == [
+        ('Editor', 'laptop'), ('Mail', 'desk'), ('Mail', 'desk'), ('Editor', 'laptop')]
+    assert read_manifest(second)['part_20240101.csv']['sessions'] == [
+        'desk/20240101_235959', 'laptop/20240101_235000']
@@ -0,0 +1,39 @@
+import threading
+
+from metrics import Histogram, Metrics
+
+
+def test_concurrent_updates_are_not_lost():
+    metrics = Metrics(enabled=True)
+    threads = 8
+    per_thread = 20000
+    barrier = threading.Barrier(threads)
+
+    def work():
+        barrier.wait()
+        for i in range(per_thread):
+            metrics.observe('record_event', 1000 + i)
+            metrics.incr('events.keystroke')
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    histogram = metrics.histograms['record_event']
+    assert histogram.count == sum(histogram.buckets) == threads * per_thread
+    assert histogram.total == threads * sum(range(1000, 1000 + per_thread))
+    assert metrics.snapshot()['counters'] == {'events.keystroke': threads * per_thread}
+
+
+def test_summary_percentiles():
+    histogram = Histogram()
+    for ns in [1_000] * 98 + [1_000_000] * 2:
+        histogram.observe(ns)
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['p50_us'] == 1.024
+    assert summary['p99_us'] == 1000.0
+    assert summary['max_us'] == 1000.0
+    assert Histogram().summary()['p99_us'] == 0
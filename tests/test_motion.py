@@ -0,0 +1,58 @@
+import contextlib
+import io
+
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver, FakeWindowSource
+from motion import MotionAggregator, parse_motion_key
+
+
+SECOND = 1_000_000_000
+START = 1_700_000_000 * SECOND
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = START
+
+    def __call__(self):
+        return self.now
+
+
+def test_interval_is_credited_to_the_app_it_opened_in():
+    clock = FakeClock()
+    apps = ['Editor']
+    records = []
+    motion = MotionAggregator(lambda *record, app: records.append(record + (app,)),
+                              clock=clock, resolve_app=lambda: apps[0])
+    for x in range(0, 100, 10):
+        motion.move(x, 0)
+    motion.scroll(0, -1)
+    # Focus moves on before the interval is emitted
+    apps[0] = 'Browser'
+    clock.now += SECOND
+    motion.move(200, 0)
+    motion.flush()
+
+    assert [(event_type, app) for event_type, _, _, app in records] == \
+        [('mouse_move', 'Editor'), ('scroll', 'Editor'), ('mouse_move', 'Browser')]
+    assert parse_motion_key(records[0][1]) == {'px': 90, 'n': 10}
+    assert records[0][2] == START
+
+
+def test_tracker_stores_motion_under_the_captured_app(tmp_path):
+    source = FakeWindowSource({1: 'Editor', 2: 'Browser'})
+    clock = FakeClock()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = ActivityTracker(app_resolver=AppResolver(source, notifications=False, ttl=0),
+                                  data_folder=str(tmp_path), track_motion=True, verbosity=0)
+        tracker.motion.clock = clock
+        tracker.start_tracking()
+        tracker.on_move(0, 0)
+        tracker.on_move(50, 0)
+        source.focus(2)
+        clock.now += SECOND
+        tracker.on_move(60, 0)
+        tracker.stop_tracking()
+
+    rows = [(app, event_type) for _, app, event_type, _ in tracker.session_events.iter_columns()]
+    assert rows == [('Editor', 'mouse_move'), ('Browser', 'mouse_move')]
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import json
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import query_server
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver, FakeWindowSource
+
+
+@pytest.fixture
+def server(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = ActivityTracker(app_resolver=AppResolver(FakeWindowSource({1: 'Editor'})),
+                                  data_folder=str(tmp_path), journal_size=0, verbosity=0)
+        server = query_server.QueryServer(tracker, min_interval=0, max_age=0.2).start()
+    yield server
+    server.stop()
+
+
+def _get(server, path, etag=None):
+    request = Request(f'http://127.0.0.1:{server.port}{path}')
+    if etag:
+        request.add_header('If-None-Match', etag)
+    try:
+        with urlopen(request, timeout=5) as response:
+            return response.status, response.headers.get('ETag'), response.read()
+    except HTTPError as e:
+        return e.code, e.headers.get('ETag'), e.read()
+
+
+def test_etag_answers_304_until_state_changes(server):
+    status, etag, body = _get(server, '/live')
+    assert status == 200 and json.loads(body)['events'] == 0
+    assert _get(server, '/live', etag)[0] == 304
+
+    server.tracker.tracking = True
+    server.tracker.record_event('keystroke', 'a')
+    status, new_etag, body = _get(server, '/live', etag)
+    assert status == 200 and new_etag != etag and json.loads(body)['events'] == 1
+
+
+def test_unchanged_generation_is_still_refreshed_after_max_age(server):
+    totals = {'Editor': 1}
+    server.tracker.get_app_totals = lambda: dict(totals)
+    assert json.loads(_get(server, '/apps')[2])['saved'] == {'Editor': 1}
+
+    # e.g. compaction or a merge changed the index from another process
+    totals['Mail'] = 2
+    assert json.loads(_get(server, '/apps')[2])['saved'] == {'Editor': 1}
+    time.sleep(0.25)
+    assert json.loads(_get(server, '/apps')[2])['saved'] == {'Editor': 1, 'Mail': 2}
+
+
+def test_bad_requests(server):
+    status, _, body = _get(server, '/range?by=week')
+    assert status == 400 and 'by must be one of' in json.loads(body)['error']
+    assert _get(server, '/nope')[0] == 404
+
+
+def test_cli_prints_server_errors(server, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        query_server.main(['/range?by=week', '--data-folder', server.tracker.data_folder])
+    assert exit_info.value.code == 1
+    assert 'Query failed (400): by must be one of' in capsys.readouterr().err
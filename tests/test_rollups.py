@@ -0,0 +1,67 @@
+import contextlib
+import io
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from activity_tracker import ActivityTracker
+from app_resolver import AppResolver, FakeWindowSource
+from bursts import event_weight
+from rollups import RollupStore, rebuild_rollups
+from session_query import iter_events
+
+SECOND = 1_000_000_000
+
+
+def _hour(timestamp):
+    return datetime.fromisoformat(timestamp).replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+def _brute_force(folder):
+    apps, hours, types = Counter(), Counter(), Counter()
+    for event in iter_events(folder):
+        weight = event_weight(event['event_type'], event['key'])
+        apps[event['app']] += weight
+        hours[_hour(event['timestamp'])] += weight
+        event_type = 'keystroke' if event['event_type'] == 'burst' else event['event_type']
+        types[event_type] += weight
+    return apps, hours, types
+
+
+@pytest.mark.parametrize('record_mode', ['raw', 'burst'])
+def test_rollups_match_a_raw_scan(tmp_path, record_mode):
+    folder = str(tmp_path)
+    source = FakeWindowSource({1: 'Editor', 2: 'Browser', 3: 'Mail'})
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = ActivityTracker(autosave_interval=300, record_mode=record_mode,
+                                  burst_histogram='class', app_resolver=AppResolver(source),
+                                  data_folder=folder, verbosity=0)
+        tracker.start_tracking()
+        # Two and a half hours of typing and clicking across three apps
+        now = 1_700_000_000 * SECOND
+        for i in range(3000):
+            if i % 97 == 0:
+                source.focus(1 + i % 3)
+            if i % 13 == 0:
+                tracker.record_event('click', 'left', timestamp=now)
+            else:
+                tracker.record_event('keystroke', 'ab1'[i % 3], timestamp=now)
+            now += 3 * SECOND if i % 40 else 90 * SECOND
+        tracker.stop_tracking()
+
+    apps, hours, types = _brute_force(folder)
+    assert sum(apps.values()) == 3000
+
+    for store in (tracker.rollups, rebuild_rollups(folder)):
+        assert dict(store.top_apps(n=10)) == dict(apps)
+        assert store.hourly_histogram() == dict(hours)
+        by_type = store.aggregate(by=('event_type',))
+        assert {key[0]: count for key, count in by_type.items()} == dict(types)
+
+    # A filtered range agrees too
+    start, end = sorted(hours)[1], sorted(hours)[2]
+    in_range = sum(event_weight(event['event_type'], event['key'])
+                   for event in tracker.iter_events(start, end, apps=['Editor']))
+    assert in_range
+    assert RollupStore(folder).daily_totals(start, end, apps=['Editor']) == {start[:10]: in_range}
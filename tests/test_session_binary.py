@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from session_binary import BinarySessionReader, BinarySessionWriter
+
+
+START = 1_700_000_000_000_000_000
+APPS = ('App0', 'App1', 'App2')
+
+
+@pytest.fixture
+def events(make_events):
+    return lambda first, count: make_events(START, count, first, APPS, step=1_000_000)
+
+
+def _read(path):
+    with BinarySessionReader(path) as reader:
+        return list(reader.iter_columns())
+
+
+class RecordingFile:
+    """File wrapper that logs every write and truncate, to replay crashes"""
+
+    def __init__(self, file):
+        self._file = file
+        self.ops = []
+
+    def write(self, data):
+        self.ops.append(('write', self._file.tell(), bytes(data)))
+        return self._file.write(data)
+
+    def truncate(self, size=None):
+        size = self._file.tell() if size is None else size
+        self.ops.append(('truncate', size, None))
+        return self._file.truncate(size)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def _apply(data, ops):
+    data = bytearray(data)
+    for op, position, payload in ops:
+        if op == 'truncate':
+            del data[position:]
+            continue
+        if len(data) < position:
+            data.extend(b'\0' * (position - len(data)))
+        data[position:position + len(payload)] = payload
+    return bytes(data)
+
+
+def test_append_after_reopen(tmp_path, events):
+    path = str(tmp_path / 'session.atb')
+    writer = BinarySessionWriter(path)
+    writer.write_events(events(0, 10))
+    writer.write_events(events(10, 5))
+    writer.close()
+
+    writer = BinarySessionWriter(path)
+    writer.write_events(events(15, 7))
+    writer.close()
+    assert _read(path) == events(0, 22)
+
+
+def test_torn_append_loses_only_the_uncommitted_tail(tmp_path, events):
+    path = str(tmp_path / 'session.atb')
+    writer = BinarySessionWriter(path)
+    writer.write_events(events(0, 50))
+    writer.close()
+    with open(path, 'rb') as f:
+        committed = f.read()
+
+    writer = BinarySessionWriter(path)
+    writer._open()
+    writer._file = recorder = RecordingFile(writer._file)
+    writer.write_events(events(50, 50))
+    writer.close()
+    assert _read(path) == events(0, 100)
+
+    # Replay every prefix of the append's writes, including a half-done one
+    for count in range(len(recorder.ops)):
+        op, position, payload = recorder.ops[count]
+        torn_ops = recorder.ops[:count]
+        if op == 'write':
+            torn_ops = torn_ops + [(op, position, payload[:len(payload) // 2])]
+        torn = str(tmp_path / f'torn_{count}.atb')
+        with open(torn, 'wb') as f:
+            f.write(_apply(committed, torn_ops))
+        assert _read(torn) in (events(0, 50), events(0, 100))
+
+        # The next save appends over the torn tail
+        before = _read(torn)
+        writer = BinarySessionWriter(torn)
+        writer.write_events(events(100, 10))
+        writer.close()
+        assert _read(torn) == before + events(100, 10)
+        os.remove(torn)
+
+
+def test_size_stays_linear_over_many_commits(tmp_path, events):
+    def size_after(commits):
+        path = str(tmp_path / f'session_{commits}.atb')
+        writer = BinarySessionWriter(path, flush_policy='none')
+        for i in range(commits):
+            writer.write_events(events(i * 60, 60))
+        writer.close()
+        assert len(_read(path)) == commits * 60
+        return os.path.getsize(path)
+
+    assert size_after(800) < 9 * size_after(100)
+
+
+def test_new_file_without_header_is_rejected(tmp_path, events):
+    path = str(tmp_path / 'session.atb')
+    writer = BinarySessionWriter(path)
+    writer.write_events(events(0, 5), commit=False)
+    writer._file.close()  # crash before the first commit
+    with pytest.raises(ValueError):
+        BinarySessionReader(path)
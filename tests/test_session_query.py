@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import analysis
+import session_query
+from storage import FileStorage
+
+
+@pytest.mark.parametrize('storage_format', ['csv', 'binary'])
+def test_session_older_than_its_id_is_not_pruned(tmp_path, storage_format, make_events):
+    folder = str(tmp_path)
+    storage = FileStorage(folder, storage_format)
+    # Clock stepped back after the session started
+    storage.open_session('20240310_030500')
+    storage.append_events(make_events('2024-03-10T02:10:00', 5))
+    storage.close_session()
+
+    start, end = '2024-03-10T02:00:00', '2024-03-10T03:00:00'
+    assert len(list(session_query.iter_events(folder, start, end, index=storage.index))) == 5
+    # Without the index the ID is trusted only within the slack
+    assert len(list(session_query.iter_events(folder, start, end))) == 5
+    assert len(analysis.load_columns(folder, start, end)) == 5
+
+    os.remove(os.path.join(folder, 'index.json'))
+    assert len(analysis.load_columns(folder, start, end)) == 5
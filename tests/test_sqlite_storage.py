@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+
+from bursts import encode_burst_key
+from event_buffer import ns_to_iso
+from storage import make_storage
+
+
+APPS = ('Editor', 'Browser')
+
+
+def test_events_round_trip_with_filters(tmp_path, make_events):
+    storage = make_storage(str(tmp_path), 'sqlite')
+    events = make_events('2024-01-02T09:00:00', 10, apps=APPS)
+    storage.open_session('20240102_090000')
+    storage.append_events(events[:6])
+    storage.append_events(events[6:])
+    storage.close_session()
+
+    assert [(event['timestamp'], event['app'], event['key']) for event in storage.iter_events()] == \
+        [(ns_to_iso(timestamp), app, key) for timestamp, app, _, key in events]
+    window = list(storage.iter_events(ns_to_iso(events[2][0]), ns_to_iso(events[5][0]), apps=['Editor']))
+    assert [event['key'] for event in window] == ['c', 'e']
+    assert storage.get_session_count() == 1
+    assert storage.total_events() == 10
+    assert storage.session_rows('20240102_090000') == 10
+    assert storage.session_rows('20240103_090000') == 0
+    storage.close()
+
+
+def test_app_totals_weigh_bursts_and_survive_a_recount(tmp_path, make_events):
+    folder = str(tmp_path)
+    storage = make_storage(folder, 'sqlite')
+    storage.open_session('20240102_090000')
+    burst = make_events('2024-01-02T09:05:00', 1)[0][0]
+    storage.append_events(make_events('2024-01-02T09:00:00', 3, apps=APPS) +
+                          [(burst, 'Editor', 'burst', encode_burst_key(40, 3_000_000_000))])
+    assert storage.app_totals() == {'Editor': 42, 'Browser': 1}
+    assert storage.total_events() == 43
+
+    rows = [event for event in storage.iter_events() if event['event_type'] == 'burst']
+    assert rows[0]['count'] == 40
+    storage.close()
+
+    # An older database without app_totals gets them backfilled on open
+    with sqlite3.connect(storage.path) as conn:
+        conn.execute('DELETE FROM app_totals')
+    conn.close()
+    reopened = make_storage(folder, 'sqlite')
+    assert reopened.app_totals() == {'Editor': 42, 'Browser': 1}
+    reopened.close()
+
+
+def test_readers_see_committed_batches_while_writing(tmp_path, make_events):
+    storage = make_storage(str(tmp_path), 'sqlite')
+    assert storage._conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    storage.open_session('20240102_090000')
+    batches = [make_events('2024-01-02T09:00:00', 50, first=50 * i) for i in range(20)]
+
+    seen = []
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                seen.append(sum(1 for _ in storage.iter_events()))
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for batch in batches:
+        storage.append_events(batch)
+    done.set()
+    reader.join()
+
+    assert not errors
+    # Every read saw whole batches only, and never went backwards
+    assert all(count % 50 == 0 for count in seen)
+    assert seen == sorted(seen)
+    assert sum(1 for _ in storage.iter_events()) == 1000
+    storage.close()